@@ -1,5 +1,20 @@
+from .analysis_index import AnalysisIndex
 from .asset import Asset
-from .asset_dir import AssetDir
+from .asset_dir import AssetDir, AssetDirIndex, DirtyAssetDirs
+from .asset_dir_watcher import AssetDirWatcher
+from .asset_registry import AssetRegistry
+from .asset_view import AssetView
 from .async_loader import AsyncLoader
-from .load_scan_save import recursive_load_asset_dir, recursive_save_asset_dir
+from .async_saver import AsyncSaver
+from .catalog import AssetCatalog, open_catalog
+from .image_analyzer import ImageAnalyzer
+from .journal import AssetJournal
+from .library_snapshot import load_library_snapshot, save_library_snapshot
+from .live_query import LiveQuery
+from .load_scan_save import recursive_load_asset_dir, recursive_save_asset_dir, save_asset_dir, \
+    snapshot_asset_dir
+from .parallel_scanner import ParallelScanner, ScanCancelledError, ScanJob
 from .program_config import ProgramConfig
+from .scan_statistics import ScanStatistics
+from .tag_query import QueryError, parse_query
+from .tag_vocabulary import TagVocabulary
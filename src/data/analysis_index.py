@@ -0,0 +1,192 @@
+import array
+
+from data.color_signature import color_distance, color_name, significant_colors
+
+# Bits per channel of the cells of the color grid, see `similar_color_bits`.
+_CELL_BITS = 2
+_CELL_SIZE = 1 << (8 - _CELL_BITS)
+
+
+class AnalysisIndex:
+    """
+    The `ImageAnalysis` of every asset in the library, by the ids of the `AssetRegistry`.
+
+    Follows the registry: new assets, and assets that were replaced by a new version, are handed to `queue_analysis`.
+    Their analyses come back through `add_results`, once they are done. The values are kept in arrays, instead of an
+    object per asset, because a library can hold millions of assets.
+
+    For searching by color there are bitmaps, like the tag bitmaps of the registry: one for every color name, and
+    one for every cell of a coarse grid over the colors. Finding the images with a color close to a given one only
+    has to look at the images in the cells around it.
+    """
+
+    def __init__(self, registry, queue_analysis):
+        """
+        :param registry: The `AssetRegistry` of the library.
+        :param queue_analysis: Called with a list of the assets that need to be analyzed, for example
+                               `ImageAnalyzer.queue`.
+        """
+        self._registry = registry
+        self._queue_analysis = queue_analysis
+
+        # Id -> the Asset that was handed out to be analyzed, `None` for free ids.
+        self._assets = []
+        # Id -> difference hash, see `image_hash.difference_hash`. Only valid for the ids in `_analyzed_bits`.
+        self._hashes = array.array("Q")
+        # Id -> color signature, see `color_signature.color_signature`. Only valid for the ids in `_analyzed_bits`.
+        self._colors = array.array("Q")
+        # Color name -> bitmap of the ids of the images that mostly have that color, see `significant_colors`.
+        self._color_name_bits = {}
+        # (red, green, blue) cell -> bitmap of the ids of the images that mostly have a color in that cell.
+        self._color_cell_bits = {}
+        # Bitmap of the ids whose asset has an analysis.
+        self._analyzed_bits = 0
+        # Number of assets that were queued, and are not yet analyzed.
+        self._pending_count = 0
+
+        registry.add_listener(self)
+        registry.set_analyses(self)
+        self.assets_changed([(asset_id, registry.asset(asset_id))
+                             for asset_id in registry.ids_of_bits(registry.all_bits())])
+
+    def close(self):
+        """
+        Stops following the registry.
+        """
+        self._registry.remove_listener(self)
+        if self._registry.analyses() is self:
+            self._registry.set_analyses(None)
+
+    def assets_changed(self, changes: list):
+        """
+        Called by the registry.
+        :param changes: List of (id, `Asset`).
+        """
+        if len(changes) == 0:
+            return
+        registry = self._registry
+        assets = self._assets
+        grow = max(asset_id for asset_id, _ in changes) + 1 - len(assets)
+        if grow > 0:
+            assets.extend([None] * grow)
+            self._hashes.extend([0] * grow)
+            self._colors.extend([0] * grow)
+
+        to_analyze = []
+        # Ids whose analysis no longer applies.
+        outdated = []
+        for asset_id, asset in changes:
+            if registry.asset(asset_id) is not asset:
+                # Removed.
+                if assets[asset_id] is asset:
+                    assets[asset_id] = None
+                    outdated.append(asset_id)
+            elif assets[asset_id] is not asset:
+                # New, or another version of the asset. Tag changes don't need a new analysis.
+                assets[asset_id] = asset
+                outdated.append(asset_id)
+                to_analyze.append(asset)
+
+        outdated_bits = registry.bits_of_ids(outdated) & self._analyzed_bits
+        if outdated_bits != 0:
+            self._analyzed_bits &= ~outdated_bits
+            for bitmaps in (self._color_name_bits, self._color_cell_bits):
+                for key in bitmaps.keys():
+                    bitmaps[key] &= ~outdated_bits
+        if len(to_analyze) > 0:
+            self._pending_count += len(to_analyze)
+            self._queue_analysis(to_analyze)
+
+    def add_results(self, results: list):
+        """
+        :param results: List of (Asset, `ImageAnalysis`), see `ImageAnalyzer.take_results`. `None` for assets that
+                        could not be analyzed. Results of assets that are no longer in the registry are ignored.
+        """
+        registry = self._registry
+        analyzed_ids = []
+        # Color name, or cell -> ids.
+        ids_per_name = {}
+        ids_per_cell = {}
+        for asset, analysis in results:
+            self._pending_count -= 1
+            asset_id = registry.id_of(asset.uuid())
+            if asset_id is None or self._assets[asset_id] is not asset or analysis is None:
+                continue
+            self._hashes[asset_id] = analysis.dhash
+            self._colors[asset_id] = analysis.colors
+            analyzed_ids.append(asset_id)
+            for color in significant_colors(analysis.colors):
+                ids_per_name.setdefault(color_name(color), []).append(asset_id)
+                ids_per_cell.setdefault(_cell_of(color), []).append(asset_id)
+
+        self._analyzed_bits |= registry.bits_of_ids(analyzed_ids)
+        for bitmaps, ids_per_key in ((self._color_name_bits, ids_per_name), (self._color_cell_bits, ids_per_cell)):
+            for key, asset_ids in ids_per_key.items():
+                bitmaps[key] = bitmaps.get(key, 0) | registry.bits_of_ids(asset_ids)
+
+    def pending_count(self) -> int:
+        """
+        :return: The number of assets that are waiting for their analysis.
+        """
+        return max(0, self._pending_count)
+
+    def analyzed_bits(self) -> int:
+        """
+        :return: Bitmap of the ids of the assets that have an analysis.
+        """
+        return self._analyzed_bits
+
+    def difference_hash(self, asset_id: int):
+        """
+        :return: The difference hash of the asset with the id, or `None` if it was not analyzed.
+        """
+        if not (self._analyzed_bits >> asset_id) & 1:
+            return None
+        return self._hashes[asset_id]
+
+    def color_signature(self, asset_id: int):
+        """
+        :return: The color signature of the asset with the id, or `None` if it was not analyzed.
+        """
+        if not (self._analyzed_bits >> asset_id) & 1:
+            return None
+        return self._colors[asset_id]
+
+    def color_name_bits(self, name: str) -> int:
+        """
+        :param name: One of the `color_signature.COLOR_NAMES`.
+        :return: Bitmap of the ids of the images that mostly have the color.
+        """
+        return self._color_name_bits.get(name, 0)
+
+    def similar_color_bits(self, color: tuple, max_distance: float) -> int:
+        """
+        :param color: (red, green, blue), from 0 to 255.
+        :param max_distance: See `color_signature.color_distance`.
+        :return: Bitmap of the ids of the images that mostly have a color at most `max_distance` away from the color.
+        """
+        # Only the images in the cells that reach within the distance can match.
+        candidates = 0
+        for cell, bits in self._color_cell_bits.items():
+            closest = tuple(min(max(channel, cell_channel * _CELL_SIZE), cell_channel * _CELL_SIZE + _CELL_SIZE - 1)
+                            for channel, cell_channel in zip(color, cell))
+            if color_distance(color, closest) <= max_distance:
+                candidates |= bits
+
+        colors = self._colors
+        registry = self._registry
+        return registry.bits_of_ids(asset_id for asset_id in registry.ids_of_bits(candidates)
+                                    if any(color_distance(color, other) <= max_distance
+                                           for other in significant_colors(colors[asset_id])))
+
+    def ids_and_hashes(self, bits: int) -> list:
+        """
+        :param bits: Bitmap of the ids to look at.
+        :return: List of (id, difference hash) of the ids that have an analysis, see `image_hash.duplicate_groups`.
+        """
+        hashes = self._hashes
+        return [(asset_id, hashes[asset_id]) for asset_id in self._registry.ids_of_bits(bits & self._analyzed_bits)]
+
+
+def _cell_of(color: tuple) -> tuple:
+    return tuple(channel >> (8 - _CELL_BITS) for channel in color)
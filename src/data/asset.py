@@ -1,27 +1,61 @@
+import os
 import pathlib
+import sys
 import uuid
 
 from PyQt5.QtCore import QStandardPaths, Qt
 from PyQt5.QtGui import QPixmap, QPixmapCache
 
+from data.png_header import pack_png_header, unpack_png_header
+from data.tag_vocabulary import vocabulary
+
 
 class Asset:
     # All the file extensions that count as assets.
     # All lowercase.
     ASSET_EXTENSIONS = ['.png']
 
-    def __init__(self, path, asset_uuid=None, tags=None):
-        if tags is None:
-            tags = set()
+    # A library can hold millions of assets, so they only keep the bare minimum.
+    __slots__ = ["_dir_path", "_name", "_uuid", "_tag_mask", "_inode", "_size", "_mtime", "_png_header", "_dirty",
+                 "_asset_dir"]
+
+    # Where the thumbnails are cached on disk. The same for every asset, so only looked up once.
+    _thumbnail_cache_dir = None
+
+    def __init__(self, path, asset_uuid=None, tags=None, tag_mask=0):
+        """
+        :param tags: Collection of tag strings.
+        :param tag_mask: Bitmask of tag ids from the `TagVocabulary`, added to `tags`.
+        """
+        path = os.fspath(path)
+        if not os.path.isabs(path):
+            path = str(pathlib.Path(path).absolute())
 
-        self._path = pathlib.Path(path).absolute()
+        # The path is stored as the directory and the file name. All the assets in a directory share the same
+        # directory string. The `pathlib.Path` is only made when it is asked for.
+        dir_path, self._name = os.path.split(path)
+        self._dir_path = sys.intern(dir_path)
 
         self._uuid = asset_uuid
-        self._tags = tags
+        # The bits of the ids of the tags in the `TagVocabulary`.
+        self._tag_mask = tag_mask | vocabulary.mask_of(tags) if tags else tag_mask
+
+        # Inode of the file when it was last scanned, used to recognize renamed files. `None` when unknown.
+        self._inode = None
+        # File size in bytes. `None` when unknown, the scan does not stat every file.
+        self._size = None
+        # Modification time of the file in nanoseconds, known together with the size.
+        self._mtime = None
+        # The `PngHeader` packed into an int, see `pack_png_header`. 0 when the file has none, `None` when it was not
+        # read yet.
+        self._png_header = None
 
         # Marks whether the Asset has been edited in-memory since last time it was loaded.
         self._dirty = False
 
+        # The `AssetDir` this asset is in. Lets it know when the asset becomes dirty, so it gets saved.
+        self._asset_dir = None
+
         if not self._uuid:
             # Asset was not seen before, so generate a new uuid.
             # We use uuid4 because we don't need cryptographically secure uuid's.
@@ -29,21 +63,59 @@ class Asset:
             self._uuid = uuid.uuid4()
             self._dirty = True
 
-        self._thumbnail_cache_dir = pathlib.Path(QStandardPaths.writableLocation(QStandardPaths.CacheLocation))
-
     def name(self):
-        return self._path.name
+        return self._name
+
+    def tags(self) -> frozenset:
+        """
+        :return: The tag strings. Assets with the same tags share the same set.
+        """
+        return vocabulary.tags_of(self._tag_mask)
+
+    def tag_mask(self) -> int:
+        """
+        :return: The bitmask of the ids of the tags, see `TagVocabulary`.
+        """
+        return self._tag_mask
 
-    def tags(self):
-        return self._tags
+    def has_tag(self, tag) -> bool:
+        tag_id = vocabulary.known_id(tag)
+        return tag_id is not None and (self._tag_mask >> tag_id) & 1 == 1
 
     def add_tag(self, tag):
-        self._tags.add(tag)
-        self._dirty = True
+        self._set_tag_mask(self._tag_mask | vocabulary.bit(tag))
 
     def remove_tag(self, tag):
-        self._tags.remove(tag)
+        """
+        Does nothing if the asset doesn't have the tag.
+        """
+        tag_id = vocabulary.known_id(tag)
+        if tag_id is not None:
+            self._set_tag_mask(self._tag_mask & ~(1 << tag_id))
+
+    def set_tags(self, tags):
+        """
+        Replaces all the tags at once.
+        """
+        self._set_tag_mask(vocabulary.mask_of(tags))
+
+    def _set_tag_mask(self, tag_mask: int):
+        if tag_mask == self._tag_mask:
+            return
+
+        old_mask = self._tag_mask
+        self._tag_mask = tag_mask
+        if self._asset_dir is not None:
+            self._asset_dir.asset_tags_changed(self, old_mask)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        """
+        Marks the asset as needing to be saved. Changing the tags already does this.
+        """
         self._dirty = True
+        if self._asset_dir is not None:
+            self._asset_dir.mark_dirty()
 
     def is_dirty(self):
         """
@@ -60,12 +132,113 @@ class Asset:
 
     def absolute_path(self):
         """
-        :return: The absolute path as a `pathlib.Path`.
+        :return: The absolute path as a `pathlib.Path`. A new one every time, so don't keep it around.
+        """
+        return pathlib.Path(self._dir_path, self._name)
+
+    def dir_path(self) -> str:
+        """
+        :return: The absolute path of the directory the asset is in.
+        """
+        return self._dir_path
+
+    def inode(self):
+        """
+        :return: The inode of the file when it was last scanned, or `None` if it is not known.
+        """
+        return self._inode
+
+    def set_inode(self, inode):
+        self._inode = inode
+
+    def size(self):
+        """
+        :return: The file size in bytes, or `None` if it is not known.
         """
-        return self._path
+        return self._size
+
+    def set_size(self, size):
+        if size == self._size:
+            return
+
+        old_size = self._size
+        self._size = size
+        if self._asset_dir is not None:
+            self._asset_dir.asset_size_changed(self, old_size)
+
+    def modified_time(self):
+        """
+        :return: The modification time of the file in nanoseconds since the epoch, or `None` if it is not known.
+        """
+        return self._mtime
+
+    def set_modified_time(self, mtime):
+        if mtime == self._mtime:
+            return
+
+        self._mtime = mtime
+        if self._asset_dir is not None:
+            self._asset_dir.asset_stat_changed(self)
+
+    def png_header(self):
+        """
+        :return: The `PngHeader` with the size of the image, or `None` if it is not known.
+        """
+        if self._png_header is None:
+            return None
+        return unpack_png_header(self._png_header)
+
+    def png_header_known(self) -> bool:
+        """
+        :return: True when the header was read, even if the file turned out not to have one.
+        """
+        return self._png_header is not None
+
+    def packed_png_header(self):
+        """
+        :return: The header as stored, for saving. See `pack_png_header`.
+        """
+        return self._png_header
+
+    def set_png_header(self, header):
+        """
+        :param header: The `PngHeader` read from the file, or `None` if it has none.
+        """
+        self.set_packed_png_header(pack_png_header(header))
+
+    def set_packed_png_header(self, packed):
+        """
+        :param packed: As given by `packed_png_header`. `None` when not known.
+        """
+        if packed == self._png_header:
+            return
+
+        self._png_header = packed
+        if self._asset_dir is not None:
+            self._asset_dir.asset_stat_changed(self)
+
+    def set_asset_dir(self, asset_dir):
+        """
+        Called by the `AssetDir` that holds this asset.
+        """
+        self._asset_dir = asset_dir
+
+    def moved_to(self, path):
+        """
+        Call when the file was renamed or moved.
+        :return: A copy of this asset at the new path. It keeps the uuid and tags, and is marked as dirty so the new
+                 location gets saved.
+        """
+        moved = Asset(path, asset_uuid=self._uuid, tag_mask=self._tag_mask)
+        moved._inode = self._inode
+        moved._size = self._size
+        moved._mtime = self._mtime
+        moved._png_header = self._png_header
+        moved._dirty = True
+        return moved
 
     def relative_path(self, relative_to: pathlib.Path):
-        return self._path.relative_to(relative_to)
+        return self.absolute_path().relative_to(relative_to)
 
     def uuid(self):
         """
@@ -80,12 +253,28 @@ class Asset:
         :return: True if the path is an asset, false if not.
         """
         _path = pathlib.Path(path)
-        return _path.is_file() and _path.suffix.lower() in Asset.ASSET_EXTENSIONS
+        return _path.is_file() and Asset.has_asset_extension(_path.name)
+
+    @staticmethod
+    def has_asset_extension(file_name: str) -> bool:
+        """
+        Only looks at the name, does not touch the file system.
+        :param file_name: The file name to check.
+        :return: True if the file name has one of the asset extensions.
+        """
+        return os.path.splitext(file_name)[1].lower() in Asset.ASSET_EXTENSIONS
+
+    @staticmethod
+    def thumbnail_cache_dir() -> pathlib.Path:
+        if Asset._thumbnail_cache_dir is None:
+            # Not when the module is loaded, the location depends on the application name.
+            Asset._thumbnail_cache_dir = pathlib.Path(QStandardPaths.writableLocation(QStandardPaths.CacheLocation))
+        return Asset._thumbnail_cache_dir
 
     def load_image(self) -> QPixmap:
         # We don't cache the full sized image, so that we don't use multiple gigabytes of memory after a while.
         # TODO: do something if it goes wrong.
-        image = QPixmap(str(self.absolute_path()))
+        image = QPixmap(os.path.join(self._dir_path, self._name))
         return image
 
     def load_thumbnail_cached(self, size: int) -> QPixmap:
@@ -99,7 +288,7 @@ class Asset:
             return thumbnail
         else:
             # Cache files are named: <hash>_<size>.png
-            cache_file_path = self._thumbnail_cache_dir.joinpath(thumbnail_key).with_suffix(".png")
+            cache_file_path = Asset.thumbnail_cache_dir().joinpath(thumbnail_key).with_suffix(".png")
             if cache_file_path.is_file():
                 # We already have a thumbnail of this size cached on disk.
                 thumbnail = QPixmap(str(cache_file_path))
@@ -1,16 +1,172 @@
 import pathlib
 
+from data.tag_vocabulary import tag_ids_of, vocabulary
+
 
 class AssetDir:
-    def __init__(self, path, subdirs: dict, assets: dict):
+    def __init__(self, path, subdirs: dict, assets: dict, scan_state=None, owns_assets=True, adopt=True):
         """
         :param path: Absolute path to this directory.
         :param subdirs: List of subdirectories in this directory.
         :param assets: uuid -> Asset dictionary of assets in this directory.
+        :param scan_state: `DirScanState` describing the directory on disk when it was scanned.
+                           `None` if the directory was not scanned from disk.
+        :param owns_assets: Whether the assets report to this directory when they become dirty.
+                            False for directories that only temporarily show assets, while the directory that will
+                            save them is still being built.
+        :param adopt: Whether to take over the subdirectories and assets right away, see `adopt`.
+                      False when some of them still belong to a tree that is in use on another thread.
         """
         self._path = pathlib.Path(path).absolute()
         self._subdirs = subdirs
         self._assets = assets
+        self._scan_state = scan_state
+        self._owns_assets = owns_assets
+
+        self._parent = None
+        # Whether this directory has changes that are not saved yet.
+        self._dirty = False
+        # The `DirtyAssetDirs` that keeps track of the dirty directories in this tree. Only set on the root.
+        self._dirty_asset_dirs = None
+        # The `AssetDirIndex`es that keep track of the assets in this tree. Only set on the root.
+        self._indexes = ()
+        # Tuple of the uuids in `_assets`, in order. `None` until it is asked for, and after the assets changed.
+        self._asset_uuids = None
+
+        # Totals over the whole tree of this directory. Kept up to date when assets, their tags, or subdirectories
+        # change, so they never need a walk over the tree.
+        self._count_recursive = 0
+        self._untagged_recursive = 0
+        # Bytes of the assets whose file size is known.
+        self._bytes_recursive = 0
+        # Tag id -> number of assets with the tag. Tags without assets are left out.
+        self._tag_counts_recursive = {}
+
+        # Whether the subdirectories and assets were taken over. Until then they are not in the totals.
+        self._adopted = False
+        if adopt:
+            self.adopt()
+
+    def adopt(self):
+        """
+        Takes over the subdirectories and assets this directory was made with: they report to this directory, and
+        count towards its totals. Only has to be called for directories that were made with `adopt=False`, on the
+        thread that owns the tree those came from.
+        """
+        if self._adopted:
+            return
+        self._adopted = True
+
+        for subdir in self._subdirs.values():
+            subdir._parent = self
+            self._change_totals(*subdir._totals())
+        self._change_totals(*_totals_of(self._assets.values()))
+        self._adopt_assets(self._assets)
+
+    def _adopt_assets(self, assets: dict):
+        if not self._owns_assets:
+            return
+
+        dirty = False
+        for asset in assets.values():
+            asset.set_asset_dir(self)
+            dirty = dirty or asset.is_dirty()
+        if dirty:
+            self.mark_dirty()
+
+    def parent(self):
+        """
+        :return: The `AssetDir` this is a subdirectory of, or `None` for the root of a tree.
+        """
+        return self._parent
+
+    def root(self):
+        root = self
+        while root._parent is not None:
+            root = root._parent
+        return root
+
+    def is_dirty(self):
+        """
+        :return: True if this directory needs to be saved. Does not look at the subdirectories.
+        """
+        return self._dirty
+
+    def mark_dirty(self):
+        """
+        Marks this directory as needing to be saved. Called by the assets when they change.
+        """
+        if self._dirty:
+            return
+        self._dirty = True
+
+        dirty_asset_dirs = self.root()._dirty_asset_dirs
+        if dirty_asset_dirs is not None:
+            dirty_asset_dirs.add(self)
+
+    def asset_tags_changed(self, asset, old_mask: int):
+        """
+        Called by the assets when their tags changed.
+        :param old_mask: The tag bitmask the asset had before.
+        """
+        tag_counts = {}
+        for tag_id in tag_ids_of(old_mask):
+            tag_counts[tag_id] = -1
+        for tag_id in tag_ids_of(asset.tag_mask()):
+            tag_counts[tag_id] = tag_counts.get(tag_id, 0) + 1
+        untagged = (asset.tag_mask() == 0) - (old_mask == 0)
+        self._change_totals(0, untagged, 0, tag_counts)
+
+        for index in self.root()._indexes:
+            index.update_asset(asset, old_mask)
+
+    def asset_size_changed(self, asset, old_size):
+        """
+        Called by the assets when their file size became known, or changed.
+        :param old_size: The size in bytes the asset had before, or `None`.
+        """
+        self._change_totals(0, 0, (asset.size() or 0) - (old_size or 0), {})
+        self.asset_stat_changed(asset)
+
+    def asset_stat_changed(self, asset):
+        """
+        Called by the assets when their file size, modification time, or image header became known or changed.
+        """
+        for index in self.root()._indexes:
+            index.update_asset_stat(asset)
+
+    def _totals(self, sign=1):
+        """
+        :return: The totals of this tree, as arguments for `_change_totals`.
+        """
+        return (sign * self._count_recursive, sign * self._untagged_recursive, sign * self._bytes_recursive,
+                {tag_id: sign * count for tag_id, count in self._tag_counts_recursive.items()})
+
+    def _change_totals(self, count: int, untagged: int, size: int, tag_counts: dict):
+        """
+        Adds to the totals of this directory and all of its parents. Negative numbers subtract.
+        :param tag_counts: Tag id -> number of assets to add.
+        """
+        node = self
+        while node is not None:
+            node._count_recursive += count
+            node._untagged_recursive += untagged
+            node._bytes_recursive += size
+            for tag_id, change in tag_counts.items():
+                new_count = node._tag_counts_recursive.get(tag_id, 0) + change
+                if new_count == 0:
+                    node._tag_counts_recursive.pop(tag_id, None)
+                else:
+                    node._tag_counts_recursive[tag_id] = new_count
+            node = node._parent
+
+    def was_saved(self):
+        """
+        Call after saving this directory. Marks it, and its assets, as clean again.
+        """
+        for asset in self._assets.values():
+            asset.was_saved()
+        self._dirty = False
 
     def name(self):
         return self._path.name
@@ -35,6 +191,117 @@ class AssetDir:
         """
         return self._assets
 
+    def asset_uuids(self) -> tuple:
+        """
+        :return: The uuids of the assets directly in this folder, in order. Cached until the assets change.
+                 The tuple itself never changes, so it can be held on to.
+        """
+        if self._asset_uuids is None:
+            self._asset_uuids = tuple(self._assets.keys())
+        return self._asset_uuids
+
+    def walk(self):
+        """
+        :return: Generator of this directory, and all the recursive subdirectories. Parents before their children.
+        """
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            yield node
+            # Reversed, so they come out in order.
+            nodes.extend(reversed(list(node._subdirs.values())))
+
+    def scan_state(self):
+        """
+        :return: The `DirScanState` from when this directory was scanned, or `None`.
+        """
+        return self._scan_state
+
+    def add_assets(self, assets: dict):
+        """
+        Adds assets directly to this directory. Assets with a uuid that is already there replace the old ones.
+        :param assets: uuid -> Asset dictionary.
+        """
+        if not self._adopted:
+            # They are counted and taken over along with the others.
+            self._assets.update(assets)
+            self._asset_uuids = None
+            return
+
+        # Assets that are replaced by a new version could have had other tags.
+        replaced = [self._assets[asset_uuid] for asset_uuid in assets.keys() if asset_uuid in self._assets]
+        indexes = self.root()._indexes
+        for index in indexes:
+            index.remove_assets(replaced)
+
+        self._change_totals(*_totals_of(replaced, sign=-1))
+        self._change_totals(*_totals_of(assets.values()))
+        self._assets.update(assets)
+        self._asset_uuids = None
+        self._adopt_assets(assets)
+
+        for index in indexes:
+            index.add_assets(assets.values())
+
+    def add_subdir(self, rel_path: pathlib.Path, subdir):
+        """
+        Adds, or replaces, a subdirectory.
+        :param rel_path: Path of the subdirectory relative to this directory.
+        :param subdir: The `AssetDir` of the subdirectory.
+        """
+        replaced = self._subdirs.get(rel_path)
+        self._subdirs[rel_path] = subdir
+        if replaced is not None:
+            self._change_totals(*replaced._totals(sign=-1))
+        self._change_totals(*subdir._totals())
+        subdir._parent = self
+
+        root = self.root()
+        if root._dirty_asset_dirs is not None:
+            root._dirty_asset_dirs.add_tree(subdir)
+        for index in root._indexes:
+            if replaced is not None:
+                index.remove_tree(replaced)
+            index.add_tree(subdir)
+
+    def remove_assets(self, asset_uuids):
+        """
+        Removes assets that are directly in this directory.
+        Does not mark the directory as dirty. If the files come back, they keep their uuid and tags.
+        :param asset_uuids: The uuids of the assets to remove. Unknown uuids are ignored.
+        """
+        if not self._adopted:
+            for asset_uuid in asset_uuids:
+                self._assets.pop(asset_uuid, None)
+            self._asset_uuids = None
+            return
+
+        removed = [self._assets.pop(asset_uuid) for asset_uuid in asset_uuids if asset_uuid in self._assets]
+        self._asset_uuids = None
+        self._change_totals(*_totals_of(removed, sign=-1))
+
+        for index in self.root()._indexes:
+            index.remove_assets(removed)
+
+    def remove_subdir(self, rel_path: pathlib.Path):
+        """
+        :param rel_path: Path of the subdirectory relative to this directory.
+        :return: The removed `AssetDir`, or `None` if there was no such subdirectory.
+        """
+        removed = self._subdirs.pop(rel_path, None)
+
+        if removed is not None:
+            self._change_totals(*removed._totals(sign=-1))
+            for index in self.root()._indexes:
+                index.remove_tree(removed)
+        return removed
+
+    def set_scan_state(self, scan_state):
+        """
+        Replaces the `DirScanState`, after the directory was updated without a full scan.
+        """
+        self._scan_state = scan_state
+
     def asset_count(self):
         return len(self._assets)
 
@@ -43,30 +310,200 @@ class AssetDir:
         :return: All the assets contained in this directory and all of the recursive subdirectories.
         """
         # Make a new dictionary, otherwise we change which assets we hold.
-        assets = dict(self._assets)
-        for subdir in self._subdirs.values():
-            assets.update(subdir.assets_recursive())
+        # Filled in a single pass, instead of merging the dictionaries of the subtrees level by level.
+        assets = {}
+        for node in self.walk():
+            assets.update(node._assets)
         return assets
 
     def asset_count_recursive(self):
-        count = self.asset_count()
-        for subdir in self._subdirs.values():
-            count += subdir.asset_count_recursive()
+        return self._count_recursive
 
-        return count
+    def untagged_count_recursive(self):
+        """
+        :return: The number of assets in this subtree without any tags.
+        """
+        return self._untagged_recursive
+
+    def total_bytes_recursive(self):
+        """
+        :return: The total file size of the assets in this subtree. Assets whose size is not known yet count as 0.
+        """
+        return self._bytes_recursive
+
+    def tag_counts_recursive(self) -> dict:
+        """
+        :return: Tag -> number of assets in this subtree with that tag.
+        """
+        return {vocabulary.tag(tag_id): count for tag_id, count in self._tag_counts_recursive.items()}
 
     def known_tags_recursive(self) -> set:
         """
         Retrieves all the tags known to the assets in this subtree.
         """
-        tags = set()
+        return {vocabulary.tag(tag_id) for tag_id in self._tag_counts_recursive.keys()}
 
-        # Get the tags of the assets in this directory.
-        for asset in self._assets.values():
-            tags.update(asset.tags())
+    def tag_mask_recursive(self) -> int:
+        """
+        :return: The bitmask of all the tags of the assets in this subtree, see `TagVocabulary`.
+        """
+        mask = 0
+        for tag_id in self._tag_counts_recursive.keys():
+            mask |= 1 << tag_id
+        return mask
 
-        # Get all the tags from the subdirectories.
-        for subdir in self._subdirs.values():
-            tags.update(subdir.known_tags_recursive())
 
-        return tags
+def _totals_of(assets, sign=1):
+    """
+    :param assets: Iterable of `Asset`s.
+    :return: The totals of the assets, as arguments for `AssetDir._change_totals`.
+    """
+    count = 0
+    untagged = 0
+    size = 0
+    tag_counts = {}
+    for asset in assets:
+        count += 1
+        mask = asset.tag_mask()
+        if mask == 0:
+            untagged += 1
+        else:
+            for tag_id in tag_ids_of(mask):
+                tag_counts[tag_id] = tag_counts.get(tag_id, 0) + sign
+        size += asset.size() or 0
+    return sign * count, sign * untagged, sign * size, tag_counts
+
+
+class DirtyAssetDirs:
+    """
+    Keeps track of the directories, in all the asset directory trees of the library, that need to be saved.
+    Saving only has to visit these, instead of walking every directory and every asset.
+    """
+
+    def __init__(self):
+        # Insertion ordered set, so directories are saved in the order they changed.
+        self._dirs = {}
+
+    def attach(self, root: AssetDir):
+        """
+        Starts tracking a tree. Directories that are already dirty are picked up right away.
+        """
+        root._dirty_asset_dirs = self
+        self.add_tree(root)
+
+    def add_tree(self, asset_dir: AssetDir):
+        """
+        Adds the directories in a tree that are dirty.
+        """
+        nodes = [asset_dir]
+        while nodes:
+            node = nodes.pop()
+            if node.is_dirty():
+                self._dirs[node] = None
+            nodes.extend(node.subdirs().values())
+
+    def detach(self, root: AssetDir):
+        """
+        Stops tracking a tree, for example because it was replaced by a new scan.
+        Directories that were moved over to another tree stay tracked.
+        :param root: Root of the tree. Ignored when `None`.
+        """
+        if root is None:
+            return
+        root._dirty_asset_dirs = None
+        for asset_dir in list(self._dirs.keys()):
+            if asset_dir.root() is root:
+                del self._dirs[asset_dir]
+
+    def add(self, asset_dir: AssetDir):
+        self._dirs[asset_dir] = None
+
+    def take(self):
+        """
+        :return: List of the dirty directories. They are no longer tracked until they become dirty again.
+        """
+        dirs = list(self._dirs.keys())
+        self._dirs = {}
+        return dirs
+
+    def __len__(self):
+        return len(self._dirs)
+
+
+class AssetDirIndex:
+    """
+    Base for the library-wide indexes over the assets in asset directory trees.
+
+    Once a tree is attached, the index is kept up to date: the `AssetDir`s report the assets and subdirectories that
+    come and go, and the assets report when their tags change.
+    """
+
+    def __init__(self):
+        # Root path -> root `AssetDir` of every attached tree.
+        self._roots = {}
+
+    def attach(self, root: AssetDir):
+        """
+        Adds all the assets of a tree, and keeps them up to date.
+        Replaces the tree that was attached for the same path before, for example after a new scan.
+        """
+        root_path = root.absolute_path()
+        previous = self._roots.get(root_path)
+        if previous is root:
+            return
+        if previous is not None:
+            # First, a new scan can reuse assets from the previous tree.
+            self.detach(root_path)
+
+        root._indexes += (self,)
+        self._roots[root_path] = root
+        self.add_tree(root)
+
+    def detach(self, root_path: pathlib.Path):
+        """
+        Removes all the assets of the tree attached for a path.
+        """
+        root = self._roots.pop(root_path, None)
+        if root is None:
+            return
+        root._indexes = tuple(index for index in root._indexes if index is not self)
+        self.remove_tree(root)
+
+    def roots(self) -> list:
+        """
+        :return: The root `AssetDir`s of the attached trees.
+        """
+        return list(self._roots.values())
+
+    def add_tree(self, asset_dir: AssetDir):
+        for node in asset_dir.walk():
+            self.add_assets(node.assets().values())
+
+    def remove_tree(self, asset_dir: AssetDir):
+        for node in asset_dir.walk():
+            self.remove_assets(node.assets().values())
+
+    def add_assets(self, assets):
+        """
+        :param assets: Iterable of `Asset`s. Assets with a uuid that is already known replace the old ones.
+        """
+        raise NotImplementedError
+
+    def remove_assets(self, assets):
+        """
+        :param assets: Iterable of `Asset`s. Only removed if they are the asset that is known for their uuid.
+        """
+        raise NotImplementedError
+
+    def update_asset(self, asset, old_mask: int):
+        """
+        Called when the tags of an asset changed.
+        :param old_mask: The tag bitmask the asset had before.
+        """
+        pass
+
+    def update_asset_stat(self, asset):
+        """
+        Called when the file size, modification time, or image header of an asset became known or changed.
+        """
+        pass
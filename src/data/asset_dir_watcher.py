@@ -0,0 +1,405 @@
+import logging
+import os
+import pathlib
+from concurrent import futures
+
+import PyQt5.QtCore as Qcore
+
+from data import AssetDir
+from data.load_scan_save import DirScanState, apply_scanned_stats, load_asset_dir_contents, \
+    recursive_load_asset_dir
+
+
+class _DirChange:
+    """
+    The result of reading a single changed directory again.
+    """
+    __slots__ = ["root", "path", "assets", "state", "new_subdirs", "stat_updates"]
+
+    def __init__(self, root: AssetDir, path: pathlib.Path, assets: dict, state: DirScanState, new_subdirs: dict,
+                 stat_updates: list):
+        # The root `AssetDir` at the time the change was picked up.
+        self.root = root
+        self.path = path
+        # uuid -> Asset dictionary of what is in the directory now.
+        self.assets = assets
+        # The new `DirScanState`, without subdirectory states.
+        self.state = state
+        # Directory name -> fully scanned `AssetDir` of subdirectories that did not exist before.
+        self.new_subdirs = new_subdirs
+        # New inodes and image headers of the assets that were already in the tree, see `apply_scanned_stats`.
+        self.stat_updates = stat_updates
+
+
+class AssetDirWatcher(Qcore.QObject):
+    """
+    Keeps loaded asset directories up to date with what happens on disk.
+
+    Every directory in a watched tree is watched with a `QFileSystemWatcher`, which uses inotify (or the platform
+    equivalent). When the system runs out of watches, the remaining directories are polled for a changed
+    modification time instead.
+    Only the directories that changed are read again, on a background thread. Their new contents are applied to the
+    `AssetDir` tree on the GUI thread, and `assets_changed` tells what changed.
+    """
+
+    # Changes to a directory usually come in bursts (copying a batch of files), so wait a bit before reading it.
+    # In milliseconds.
+    DEBOUNCE_INTERVAL = 300
+    # How often directories that could not be watched are checked for changes.
+    # In milliseconds.
+    POLL_INTERVAL = 5000
+
+    # Root path, added uuid -> Asset dictionary, list of removed uuids, updated uuid -> Asset dictionary.
+    # Updated assets are new objects for assets that were already there, for example because the file was renamed.
+    assets_changed = Qcore.pyqtSignal(object, object, object, object)
+
+    # Used to get the results of the background thread back to the GUI thread.
+    _dir_read = Qcore.pyqtSignal(object)
+    _polled = Qcore.pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+
+        # Root path -> root `AssetDir` of every watched tree.
+        self._roots = {}
+        # Absolute path string -> root path, of every directory that is watched or polled.
+        self._dir_roots = {}
+        # Absolute path strings of the directories that are polled, because they could not be watched.
+        self._polled_dirs = set()
+
+        # Directory paths that changed, and are waiting to be read.
+        self._pending = set()
+        # Directory paths that are being read. A directory is never read twice at the same time.
+        self._in_flight = set()
+
+        # A single thread is enough, as only the changed directories are read.
+        self._executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="asset_dir_watcher")
+
+        self._watcher = Qcore.QFileSystemWatcher()
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+
+        self._debounce_timer = Qcore.QTimer()
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(self.DEBOUNCE_INTERVAL)
+        self._debounce_timer.timeout.connect(self._read_pending)
+
+        self._poll_timer = Qcore.QTimer()
+        self._poll_timer.setInterval(self.POLL_INTERVAL)
+        self._poll_timer.timeout.connect(self._poll)
+
+        self._dir_read.connect(self._apply_change)
+        self._polled.connect(self._on_polled)
+
+    def watch(self, root_dir: AssetDir):
+        """
+        Starts watching a fully scanned asset directory. Replaces any earlier watch of the same root.
+        The `AssetDir` tree is changed in place when files are added, removed, or renamed.
+        """
+        root_path = root_dir.absolute_path()
+        if root_dir.scan_state() is None:
+            logging.warning("Can not watch asset directory that was not scanned: \"{}\"".format(root_path))
+            return
+
+        self.unwatch(root_path)
+        self._roots[root_path] = root_dir
+        self._add_dirs(root_path, root_path, root_dir.scan_state())
+
+    def unwatch(self, root_path):
+        """
+        Stops watching an asset directory. Changes that were picked up, but not yet applied, are dropped.
+        """
+        root_path = pathlib.Path(root_path)
+        if self._roots.pop(root_path, None) is None:
+            return
+
+        removed = [path for path, root in self._dir_roots.items() if root == root_path]
+        self._remove_dirs(removed)
+
+    def is_watching(self, root_path) -> bool:
+        return pathlib.Path(root_path) in self._roots
+
+    def watched_dir_count(self) -> int:
+        """
+        :return: Number of directories that are watched, including the ones that are polled.
+        """
+        return len(self._dir_roots)
+
+    def shutdown(self):
+        """
+        Stops watching everything. Directories that are being read are not waited on.
+        """
+        for root_path in list(self._roots.keys()):
+            self.unwatch(root_path)
+        self._executor.shutdown(wait=False)
+
+    def _add_dirs(self, root_path: pathlib.Path, path: pathlib.Path, state: DirScanState):
+        """
+        Watches a directory and all its subdirectories, as listed in the scan state.
+        """
+        new_dirs = []
+        states = [(path, state)]
+        while states:
+            dir_path, dir_state = states.pop()
+            new_dirs.append(str(dir_path))
+            for name, subdir_state in dir_state.subdir_states.items():
+                states.append((dir_path.joinpath(name), subdir_state))
+
+        for dir_path in new_dirs:
+            self._dir_roots[dir_path] = root_path
+
+        failed = self._watcher.addPaths(new_dirs)
+        if len(failed) > 0:
+            logging.info("Could not watch {} directories, polling them instead.".format(len(failed)))
+            self._polled_dirs.update(failed)
+            self._poll_timer.start()
+
+    def _remove_dirs(self, dir_paths):
+        """
+        :param dir_paths: Absolute path strings of directories to stop watching.
+        """
+        watched = []
+        for dir_path in dir_paths:
+            self._dir_roots.pop(dir_path, None)
+            self._pending.discard(dir_path)
+            if dir_path in self._polled_dirs:
+                self._polled_dirs.discard(dir_path)
+            else:
+                watched.append(dir_path)
+
+        if len(watched) > 0:
+            self._watcher.removePaths(watched)
+        if len(self._polled_dirs) == 0:
+            self._poll_timer.stop()
+
+    @Qcore.pyqtSlot(str)
+    def _on_directory_changed(self, dir_path: str):
+        if dir_path not in self._dir_roots:
+            return
+
+        self._pending.add(dir_path)
+        # Don't restart a running timer, or a directory that keeps changing would never be read.
+        if not self._debounce_timer.isActive():
+            self._debounce_timer.start()
+
+    @Qcore.pyqtSlot()
+    def _read_pending(self):
+        for dir_path in list(self._pending):
+            if dir_path in self._in_flight:
+                # Will be read again after the current read is applied.
+                continue
+            self._pending.discard(dir_path)
+
+            root_path = self._dir_roots.get(dir_path)
+            if root_path is None:
+                continue
+            root = self._roots[root_path]
+            path = pathlib.Path(dir_path)
+
+            state, node = _find_dir(root, path)
+            if state is None:
+                # Not part of the tree (anymore). Its parent will pick up any changes.
+                continue
+
+            # Hand the background thread copies, the tree can change while it is reading.
+            previous_state = DirScanState(state.dir_mtime, state.dir_inode, state.config_mtime,
+                                          dict(state.subdir_states))
+            previous_assets = dict(node.assets()) if node is not None else {}
+
+            self._in_flight.add(dir_path)
+            future = self._executor.submit(_read_changed_dir, root, path, previous_state, previous_assets)
+            # Called from the background thread.
+            future.add_done_callback(lambda f, p=dir_path: self._dir_read.emit((p, f)))
+
+    @Qcore.pyqtSlot(object)
+    def _apply_change(self, read_result):
+        dir_path, future = read_result
+        self._in_flight.discard(dir_path)
+        if len(self._pending) > 0 and not self._debounce_timer.isActive():
+            self._debounce_timer.start()
+
+        exception = future.exception()
+        if exception is not None:
+            logging.warning("Could not read changed directory: \"{}\". Reason: {}".format(dir_path, exception))
+            return
+
+        change = future.result()
+        if change is None:
+            # Could not be read, most likely because it was removed. Its parent will pick that up.
+            return
+
+        root_path = change.root.absolute_path()
+        if self._roots.get(root_path) is not change.root:
+            # The asset directory was unwatched, or replaced by a full scan in the meantime.
+            return
+
+        state, node = _find_dir(change.root, change.path)
+        if state is None:
+            return
+
+        apply_scanned_stats(change.stat_updates)
+        old_assets = node.assets() if node is not None else {}
+        added = {}
+        updated = {}
+        new_assets = {}
+        for asset_uuid, asset in change.assets.items():
+            old_asset = old_assets.get(asset_uuid)
+            if old_asset is None:
+                added[asset_uuid] = asset
+            elif old_asset.name() == asset.name() and old_asset.dir_path() == asset.dir_path() and \
+                    old_asset.tag_mask() == asset.tag_mask():
+                # Keep the object the rest of the program already knows. This is what happens when our own save
+                # touches the config file.
+                asset = old_asset
+            else:
+                updated[asset_uuid] = asset
+            new_assets[asset_uuid] = asset
+        removed = [asset_uuid for asset_uuid in old_assets.keys() if asset_uuid not in new_assets]
+
+        # Subdirectories that are gone.
+        subdir_names = set(change.state.subdir_states.keys())
+        for name in list(state.subdir_states.keys()):
+            if name in subdir_names:
+                continue
+            removed_path = change.path.joinpath(name)
+            del state.subdir_states[name]
+            self._remove_dirs([path for path in self._dir_roots.keys()
+                               if path == str(removed_path) or path.startswith(str(removed_path) + os.sep)])
+            if node is not None:
+                removed_subdir = node.remove_subdir(pathlib.Path(name))
+                if removed_subdir is not None:
+                    removed.extend(removed_subdir.assets_recursive().keys())
+
+        # The state object is shared with the parent's state, so update it in place.
+        state.dir_mtime = change.state.dir_mtime
+        state.dir_inode = change.state.dir_inode
+        state.config_mtime = change.state.config_mtime
+
+        if len(new_assets) > 0 or len(change.new_subdirs) > 0:
+            node = _make_dir(change.root, change.path)
+
+        if node is not None:
+            node.remove_assets(removed)
+            node.add_assets(new_assets)
+
+        # New subdirectories.
+        for name, subdir in change.new_subdirs.items():
+            state.subdir_states[name] = subdir.scan_state()
+            self._add_dirs(root_path, subdir.absolute_path(), subdir.scan_state())
+            if len(subdir.assets()) > 0 or len(subdir.subdirs()) > 0:
+                node.add_subdir(pathlib.Path(name), subdir)
+                added.update(subdir.assets_recursive())
+
+        _prune_empty_dirs(change.root, change.path)
+
+        if len(added) > 0 or len(removed) > 0 or len(updated) > 0:
+            logging.info("Asset directory changed: \"{}\". {} added, {} removed, {} updated.".format(
+                change.path, len(added), len(removed), len(updated)))
+            self.assets_changed.emit(root_path, added, removed, updated)
+
+    @Qcore.pyqtSlot()
+    def _poll(self):
+        expected = []
+        for dir_path in self._polled_dirs:
+            root_path = self._dir_roots.get(dir_path)
+            if root_path is None:
+                continue
+            state, _ = _find_dir(self._roots[root_path], pathlib.Path(dir_path))
+            if state is not None:
+                expected.append((dir_path, state.dir_mtime))
+
+        future = self._executor.submit(_find_changed_dirs, expected)
+        future.add_done_callback(lambda f: self._polled.emit(f.result()))
+
+    @Qcore.pyqtSlot(object)
+    def _on_polled(self, changed_dirs):
+        for dir_path in changed_dirs:
+            self._on_directory_changed(dir_path)
+
+
+def _read_changed_dir(root: AssetDir, path: pathlib.Path, previous_state: DirScanState, previous_assets: dict):
+    """
+    Runs on the background thread.
+    :return: The `_DirChange`, or `None` if the directory could not be read.
+    """
+    try:
+        assets, subdir_paths, state, _, stat_updates = load_asset_dir_contents(path, previous_state, previous_assets)
+
+        new_subdirs = {}
+        for subdir_path in subdir_paths:
+            if subdir_path.name not in previous_state.subdir_states:
+                new_subdirs[subdir_path.name] = recursive_load_asset_dir(subdir_path)
+
+        # Only lists the names, the states of the subdirectories that were already there are kept.
+        state.subdir_states = {subdir_path.name: None for subdir_path in subdir_paths}
+        return _DirChange(root, path, assets, state, new_subdirs, stat_updates)
+    except OSError as e:
+        logging.debug("Could not read changed directory: \"{}\". Reason: {}".format(path, e))
+        return None
+
+
+def _find_changed_dirs(expected):
+    """
+    Runs on the background thread.
+    :param expected: List of (path string, directory modification time in nanoseconds) tuples.
+    :return: List of the path strings whose modification time differs.
+    """
+    changed = []
+    for dir_path, dir_mtime in expected:
+        try:
+            if os.stat(dir_path).st_mtime_ns != dir_mtime:
+                changed.append(dir_path)
+        except OSError:
+            # Removed. Its parent changed as well.
+            pass
+    return changed
+
+
+def _find_dir(root: AssetDir, path: pathlib.Path):
+    """
+    :return: The `DirScanState` of a directory in the tree, and its `AssetDir`.
+             The `AssetDir` is `None` if the directory contains no assets. Both are `None` if it is not in the tree.
+    """
+    state = root.scan_state()
+    node = root
+    for part in path.relative_to(root.absolute_path()).parts:
+        state = state.subdir_states.get(part)
+        if state is None:
+            return None, None
+        if node is not None:
+            node = node.subdirs().get(pathlib.Path(part))
+    return state, node
+
+
+def _make_dir(root: AssetDir, path: pathlib.Path) -> AssetDir:
+    """
+    :return: The `AssetDir` of a directory in the tree, after creating it and any missing parents.
+    """
+    state = root.scan_state()
+    node = root
+    for part in path.relative_to(root.absolute_path()).parts:
+        state = state.subdir_states[part]
+        subdir = node.subdirs().get(pathlib.Path(part))
+        if subdir is None:
+            subdir = AssetDir(node.absolute_path().joinpath(part), {}, {}, scan_state=state)
+            node.add_subdir(pathlib.Path(part), subdir)
+        node = subdir
+    return node
+
+
+def _prune_empty_dirs(root: AssetDir, path: pathlib.Path):
+    """
+    Removes the `AssetDir` of a directory, and then of its parents, for as long as they are empty.
+    Just like a scan only records directories that have assets somewhere in their tree.
+    """
+    chain = [root]
+    for part in path.relative_to(root.absolute_path()).parts:
+        subdir = chain[-1].subdirs().get(pathlib.Path(part))
+        if subdir is None:
+            break
+        chain.append(subdir)
+
+    # The root itself always stays.
+    for parent, node in reversed(list(zip(chain, chain[1:]))):
+        if len(node.assets()) > 0 or len(node.subdirs()) > 0:
+            break
+        parent.remove_subdir(pathlib.Path(node.name()))
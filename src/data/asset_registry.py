@@ -0,0 +1,475 @@
+import array
+import bisect
+import itertools
+
+from data.asset_dir import AssetDirIndex
+from data.name_index import NameIndex
+from data.sort_order import FILE_KEYS, KEY_FUNCTIONS, NUMBER_KEYS, SORT_TAG_COUNT
+from data.tag_vocabulary import tag_ids_of, vocabulary
+
+# Turns the "0" and "1" characters of a binary number into 0 and 1 bytes.
+_BINARY_DIGITS = bytes.maketrans(b"01", b"\x00\x01")
+# When fewer than one in this many bits are set, they are looked up one by one instead of checking every bit.
+SPARSE_BITS_RATIO = 64
+# Results with fewer than one in this many of the assets are sorted by themselves. Larger ones are taken from the
+# order of the whole library, see `sorted_ids`.
+SMALL_SORT_RATIO = 16
+# Up to this many changed assets, their ids are moved in the sort orders. For more, the orders are made again.
+SORT_ORDER_PATCH_LIMIT = 100
+
+
+class AssetRegistry(AssetDirIndex):
+    """
+    Every asset in the library, by uuid, in a single place.
+
+    Each asset also gets a small, dense integer id while it is known. The ids of removed assets are handed out again,
+    so they stay small enough to use as bit positions: for every tag there is a bitmap, an `int` with the bits of
+    the ids of the assets with that tag set. Combining tags is then a single `&`, `|` or `~` over whole bitmaps,
+    see `tag_query`. The file names are in a `NameIndex`, by the same ids.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # uuid -> id.
+        self._ids = {}
+        # Id -> Asset. `None` for ids that are free.
+        self._assets = []
+        self._free_ids = []
+        # Number of assets that were ever removed. Tells others that held on to uuids that some may be gone.
+        self._removal_count = 0
+
+        # Bitmap of all the ids in use.
+        self._all_bits = 0
+        # Tag id -> bitmap of the assets with the tag. Tags without assets are left out.
+        self._tag_bits = {}
+        # Tag id -> number of assets with the tag.
+        self._tag_counts = {}
+        # Bitmap of the assets without tags.
+        self._untagged_bits = 0
+        self._untagged_count = 0
+
+        # The file names, to search in.
+        self._names = NameIndex()
+        # Sort key -> (array of all the ids in that order, their keys in the same order to bisect, see `_sort_order`).
+        # Made when first needed, and dropped when the keys change.
+        self._sort_orders = {}
+
+        # Objects with an `assets_changed(changes)` method, that are told about every change, see `add_listener`.
+        self._listeners = []
+        # The `AnalysisIndex` of the images, for searching by what they look like. `None` when there is none.
+        self._analyses = None
+
+    def add_assets(self, assets):
+        # The bitmaps are only changed once per batch. Each change copies the whole bitmap.
+        added = []
+        replaced = []
+        # (id, name) of the names to index, and the ids of the replaced names.
+        new_names = []
+        old_names = []
+        for asset in assets:
+            asset_id = self._ids.get(asset.uuid())
+            if asset_id is None:
+                asset_id = self._free_ids.pop() if self._free_ids else len(self._assets)
+                self._ids[asset.uuid()] = asset_id
+                if asset_id == len(self._assets):
+                    self._assets.append(None)
+                new_names.append((asset_id, asset.name()))
+            elif self._assets[asset_id] is not asset:
+                # The same asset in another place, for example in two trees.
+                old_asset = self._assets[asset_id]
+                replaced.append((asset_id, old_asset.tag_mask()))
+                if old_asset.name() != asset.name():
+                    old_names.append(asset_id)
+                    new_names.append((asset_id, asset.name()))
+            self._assets[asset_id] = asset
+            added.append((asset_id, asset.tag_mask()))
+
+        self._change_bits(replaced, False)
+        self._change_bits(added, True)
+        self._update_sort_orders([asset_id for asset_id, _ in added])
+        self._names.add(new_names)
+        self._forget_names(old_names)
+        self._notify([(asset_id, self._assets[asset_id]) for asset_id, _ in added])
+
+    def remove_assets(self, assets):
+        removed = []
+        removed_assets = []
+        old_names = []
+        for asset in assets:
+            asset_id = self._ids.get(asset.uuid())
+            # A newer asset with the same uuid, for example a renamed file, stays.
+            if asset_id is None or self._assets[asset_id] is not asset:
+                continue
+            del self._ids[asset.uuid()]
+            self._assets[asset_id] = None
+            self._free_ids.append(asset_id)
+            removed.append((asset_id, asset.tag_mask()))
+            removed_assets.append((asset_id, asset))
+            old_names.append(asset_id)
+
+        self._removal_count += len(removed)
+        self._change_bits(removed, False)
+        self._update_sort_orders([asset_id for asset_id, _ in removed])
+        self._forget_names(old_names)
+        self._notify(removed_assets)
+
+    def add_tree(self, asset_dir):
+        # All at once, instead of per directory.
+        self.add_assets(asset for node in asset_dir.walk() for asset in node.assets().values())
+
+    def remove_tree(self, asset_dir):
+        self.remove_assets(asset for node in asset_dir.walk() for asset in node.assets().values())
+
+    def update_asset(self, asset, old_mask: int):
+        asset_id = self._ids.get(asset.uuid())
+        if asset_id is None or self._assets[asset_id] is not asset:
+            return
+        self._change_tag_bits([(asset_id, old_mask)], False)
+        self._change_tag_bits([(asset_id, asset.tag_mask())], True)
+        self._sort_orders.pop(SORT_TAG_COUNT, None)
+        self._notify([(asset_id, asset)])
+
+    def update_asset_stat(self, asset):
+        if self.get(asset.uuid()) is asset:
+            for sort_key in FILE_KEYS:
+                self._sort_orders.pop(sort_key, None)
+
+    def _update_sort_orders(self, asset_ids: list):
+        """
+        Puts the ids of added, replaced or removed assets in their new place in the sort orders. Making an order again
+        takes seconds for a large library, when sorting by name.
+        """
+        if len(asset_ids) == 0 or len(self._sort_orders) == 0:
+            return
+        if len(asset_ids) > SORT_ORDER_PATCH_LIMIT:
+            self._sort_orders.clear()
+            return
+
+        assets = self._assets
+        for sort_key, (order, keys) in self._sort_orders.items():
+            kept_keys = isinstance(keys, array.array)
+            # All of them are taken out first, so the keys of the ones that are left can be looked up.
+            for asset_id in asset_ids:
+                try:
+                    index = order.index(asset_id)
+                except ValueError:
+                    # A new id.
+                    continue
+                del order[index]
+                if kept_keys:
+                    del keys[index]
+
+            key = KEY_FUNCTIONS[sort_key]
+            for asset_id in asset_ids:
+                if assets[asset_id] is not None:
+                    asset_key = key(assets[asset_id])
+                    # After the ones with the same key.
+                    index = bisect.bisect_right(keys, asset_key)
+                    order.insert(index, asset_id)
+                    if kept_keys:
+                        keys.insert(index, asset_key)
+
+    def _forget_names(self, asset_ids: list):
+        if len(asset_ids) > 0 and self._names.forget(asset_ids):
+            # Mostly stale ids, start over with the current names.
+            self._names = NameIndex()
+            self._names.add((asset_id, asset.name()) for asset_id, asset in enumerate(self._assets)
+                            if asset is not None)
+
+    def set_analyses(self, analyses):
+        """
+        :param analyses: The `AnalysisIndex` that follows this registry, or `None`.
+        """
+        self._analyses = analyses
+
+    def analyses(self):
+        """
+        :return: The `AnalysisIndex` that follows this registry, or `None` if the images are not analyzed.
+        """
+        return self._analyses
+
+    def add_listener(self, listener):
+        """
+        :param listener: Gets `assets_changed(changes)` called with a list of (id, `Asset`) of the assets that were
+                         added, removed, replaced, or whose tags changed. A removed asset is no longer the asset of
+                         its id by then.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, changes: list):
+        if len(changes) == 0:
+            return
+        for listener in list(self._listeners):
+            listener.assets_changed(changes)
+
+    def _change_bits(self, ids_and_masks: list, set_bits: bool):
+        if len(ids_and_masks) == 0:
+            return
+        all_bits = _bits_of(asset_id for asset_id, _ in ids_and_masks)
+        self._all_bits = self._all_bits | all_bits if set_bits else self._all_bits & ~all_bits
+        self._change_tag_bits(ids_and_masks, set_bits)
+
+    def _change_tag_bits(self, ids_and_masks: list, set_bits: bool):
+        """
+        :param ids_and_masks: List of (asset id, tag mask) of the assets to add to, or remove from, the tag bitmaps.
+        """
+        sign = 1 if set_bits else -1
+        # Tag id -> list of asset ids. `None` for untagged.
+        ids_per_tag = {}
+        for asset_id, mask in ids_and_masks:
+            if mask == 0:
+                ids_per_tag.setdefault(None, []).append(asset_id)
+            for tag_id in tag_ids_of(mask):
+                ids_per_tag.setdefault(tag_id, []).append(asset_id)
+
+        for tag_id, asset_ids in ids_per_tag.items():
+            bits = _bits_of(asset_ids)
+            if tag_id is None:
+                self._untagged_bits = self._untagged_bits | bits if set_bits else self._untagged_bits & ~bits
+                self._untagged_count += sign * len(asset_ids)
+                continue
+
+            count = self._tag_counts.get(tag_id, 0) + sign * len(asset_ids)
+            if count == 0:
+                del self._tag_bits[tag_id]
+                del self._tag_counts[tag_id]
+            else:
+                old_bits = self._tag_bits.get(tag_id, 0)
+                self._tag_bits[tag_id] = old_bits | bits if set_bits else old_bits & ~bits
+                self._tag_counts[tag_id] = count
+
+    def get(self, asset_uuid, default=None):
+        """
+        :return: The `Asset` with the uuid, or `default` if the library does not have it.
+        """
+        asset_id = self._ids.get(asset_uuid)
+        if asset_id is None:
+            return default
+        return self._assets[asset_id]
+
+    def removal_count(self) -> int:
+        """
+        :return: How many assets were removed so far. When it did not change, every uuid that was in the registry
+                 still is.
+        """
+        return self._removal_count
+
+    def id_of(self, asset_uuid):
+        """
+        :return: The id of the asset with the uuid, or `None` if the library does not have it.
+        """
+        return self._ids.get(asset_uuid)
+
+    def asset(self, asset_id: int):
+        """
+        :return: The `Asset` with the id, or `None` if the id is free.
+        """
+        return self._assets[asset_id]
+
+    def all_bits(self) -> int:
+        """
+        :return: Bitmap of the ids of all the assets.
+        """
+        return self._all_bits
+
+    def tag_bits(self, tag: str) -> int:
+        """
+        :return: Bitmap of the ids of the assets with the tag.
+        """
+        tag_id = vocabulary.known_id(tag)
+        if tag_id is None:
+            return 0
+        return self._tag_bits.get(tag_id, 0)
+
+    def tag_count(self, tag: str) -> int:
+        """
+        :return: The number of assets with the tag.
+        """
+        tag_id = vocabulary.known_id(tag)
+        if tag_id is None:
+            return 0
+        return self._tag_counts.get(tag_id, 0)
+
+    def name_bits(self, text: str) -> int:
+        """
+        :return: Bitmap of the ids of the assets whose file name contains the text, ignoring case.
+        """
+        text = text.lower()
+        assets = self._assets
+        stale_ids = self._names.stale_ids()
+        # The index can hold old names of ids, which were removed or given to another asset since.
+        return _bits_of(asset_id for asset_id in self._names.find(text)
+                        if asset_id not in stale_ids
+                        or (assets[asset_id] is not None and text in assets[asset_id].name().lower()))
+
+    def untagged_bits(self) -> int:
+        return self._untagged_bits
+
+    def untagged_count(self) -> int:
+        return self._untagged_count
+
+    def ids_of_bits(self, bits: int) -> list:
+        """
+        :return: The ids of the bits that are set, in increasing order.
+        """
+        if bits == 0:
+            return []
+        digits = format(bits, "b")[::-1]
+        if digits.count("1") * SPARSE_BITS_RATIO < len(digits):
+            # Few bits set, jump from one to the next.
+            ids = []
+            asset_id = digits.find("1")
+            while asset_id != -1:
+                ids.append(asset_id)
+                asset_id = digits.find("1", asset_id + 1)
+            return ids
+        digits = digits.encode().translate(_BINARY_DIGITS)
+        return list(itertools.compress(range(len(digits)), digits))
+
+    def sorted_ids(self, bits: int, sort_key: str, descending=False) -> list:
+        """
+        :param sort_key: One of the `sort_order.SORT_KEYS`.
+        :return: The ids of the bits that are set, sorted. Assets with the same key are in the order they were added.
+        """
+        order = self._sort_orders.get(sort_key, (None, None))[0]
+        if order is None and count_bits(bits) * SMALL_SORT_RATIO < len(self):
+            assets = self._assets
+            key = KEY_FUNCTIONS[sort_key]
+            asset_ids = self.ids_of_bits(bits)
+            asset_ids.sort(key=lambda asset_id: key(assets[asset_id]))
+        else:
+            if order is None:
+                order, _ = self._sort_order(sort_key)
+            # Picks the ids out of the order of the whole library, without any per-asset work in Python.
+            flags = format(bits, "b")[::-1].encode().translate(_BINARY_DIGITS)
+            flags += bytes(len(self._assets) - len(flags))
+            asset_ids = list(itertools.compress(order, map(flags.__getitem__, order)))
+
+        if descending:
+            asset_ids.reverse()
+        return asset_ids
+
+    def range_bits(self, sort_key: str, low=None, high=None) -> int:
+        """
+        :param sort_key: One of the keys of `sort_order.KEY_FUNCTIONS`, with numbers as keys.
+        :param low: Lowest key to include, `None` for no limit.
+        :param high: Highest key to include, `None` for no limit.
+        :return: Bitmap of the ids of the assets whose key is in the range. Found in the sort order of the key, so only
+                 the assets in the range are looked at.
+        """
+        order, keys = self._sort_orders.get(sort_key) or self._sort_order(sort_key)
+        start = 0 if low is None else bisect.bisect_left(keys, low)
+        stop = len(order) if high is None else bisect.bisect_right(keys, high)
+        return _bits_of(order[start:stop])
+
+    def _sort_order(self, sort_key: str) -> tuple:
+        """
+        :return: (array of all the ids in the order of the key, their keys in the same order).
+                 Number keys are kept in an array next to the ids. The other keys are looked up when they are needed,
+                 keeping the name or directory keys of a million assets takes hundreds of megabytes.
+        """
+        assets = self._assets
+        key = KEY_FUNCTIONS[sort_key]
+        asset_ids = self.ids_of_bits(self._all_bits)
+        if sort_key in NUMBER_KEYS:
+            keys = [key(assets[asset_id]) for asset_id in asset_ids]
+            # Places in `asset_ids`, in the order of their keys.
+            places = sorted(range(len(asset_ids)), key=keys.__getitem__)
+            order = array.array("I", map(asset_ids.__getitem__, places))
+            keys = array.array("q", map(keys.__getitem__, places))
+        else:
+            asset_ids.sort(key=lambda asset_id: key(assets[asset_id]))
+            order = array.array("I", asset_ids)
+            keys = _KeysInOrder(order, assets, key)
+        self._sort_orders[sort_key] = order, keys
+        return order, keys
+
+    def bits_of_ids(self, asset_ids) -> int:
+        """
+        :return: Bitmap with the bits of the ids set.
+        """
+        return _bits_of(asset_ids)
+
+    def bits_of_uuids(self, asset_uuids) -> int:
+        """
+        :return: Bitmap of the assets with the uuids. Uuids that are not known are left out.
+        """
+        ids = self._ids
+        return _bits_of(asset_id for asset_id in map(ids.get, asset_uuids) if asset_id is not None)
+
+    def uuids_of_bits(self, bits: int) -> tuple:
+        """
+        :return: The uuids of the assets whose id bits are set, for example to make an `AssetView`.
+        """
+        return self.uuids_of_ids(self.ids_of_bits(bits))
+
+    def uuids_of_ids(self, asset_ids) -> tuple:
+        """
+        :return: The uuids of the assets with the ids, in the same order.
+        """
+        assets = self._assets
+        return tuple(assets[asset_id].uuid() for asset_id in asset_ids)
+
+    def assets_with_tag(self, tag: str) -> dict:
+        """
+        :return: uuid -> Asset dictionary of the assets with the tag.
+        """
+        return self._assets_of_bits(self.tag_bits(tag))
+
+    def untagged_assets(self) -> dict:
+        """
+        :return: uuid -> Asset dictionary of the assets without tags.
+        """
+        return self._assets_of_bits(self._untagged_bits)
+
+    def _assets_of_bits(self, bits: int) -> dict:
+        assets = self._assets
+        return {asset.uuid(): asset for asset in (assets[asset_id] for asset_id in self.ids_of_bits(bits))}
+
+    def __contains__(self, asset_uuid):
+        return asset_uuid in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class _KeysInOrder:
+    """
+    The keys of the ids in a sort order, looked up when they are asked for. Enough for `bisect`.
+    """
+    __slots__ = ["_order", "_assets", "_key"]
+
+    def __init__(self, order: array.array, assets: list, key):
+        self._order = order
+        self._assets = assets
+        self._key = key
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index: int):
+        return self._key(self._assets[self._order[index]])
+
+
+def _bits_of(asset_ids) -> int:
+    """
+    :return: Bitmap with the bits of the ids set.
+    """
+    asset_ids = list(asset_ids)
+    if len(asset_ids) == 0:
+        return 0
+    buffer = bytearray((max(asset_ids) >> 3) + 1)
+    for asset_id in asset_ids:
+        buffer[asset_id >> 3] |= 1 << (asset_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def count_bits(bits: int) -> int:
+    """
+    :return: The number of bits that are set.
+    """
+    return bin(bits).count("1")
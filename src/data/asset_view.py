@@ -0,0 +1,179 @@
+import bisect
+import itertools
+
+from data.asset_registry import AssetRegistry
+
+
+class AssetView:
+    """
+    A read-only, ordered selection of assets, for the asset views to show.
+
+    Does not copy the assets. It holds on to the uuid tuples of the directories it shows (see `AssetDir.asset_uuids`),
+    and looks the assets up in the library's `AssetRegistry` when they are needed. Making a view of a directory tree
+    takes time proportional to the number of directories, instead of the number of assets.
+
+    The uuids that leave the registry are dropped the next time the view is used, so its length always matches what
+    `slice` and iterating give back. That only happens after the registry removed assets, see
+    `AssetRegistry.removal_count`.
+    """
+
+    def __init__(self, chunks, registry):
+        """
+        :param chunks: List of tuples of uuids, in order. They are not changed afterwards.
+                       The uuids need to be in the registry.
+        :param registry: Where the assets are looked up, an `AssetRegistry` or a uuid -> Asset dictionary.
+                         A dictionary should not change while the view is in use.
+        """
+        self._registry = registry
+        # The removal count of the registry when the uuids were last known to be in it.
+        self._removal_count = self._registry_removal_count()
+        self._set_chunks(chunks)
+
+    def _set_chunks(self, chunks):
+        self._chunks = [chunk for chunk in chunks if len(chunk) > 0]
+        # Index of the first asset of every chunk.
+        self._offsets = []
+        count = 0
+        for chunk in self._chunks:
+            self._offsets.append(count)
+            count += len(chunk)
+        self._count = count
+        # Set of all the uuids, and uuid -> index in the view. Made when they are first needed.
+        self._uuids = None
+        self._indexes = None
+
+    def _registry_removal_count(self) -> int:
+        registry = self._registry
+        return registry.removal_count() if isinstance(registry, AssetRegistry) else 0
+
+    def _drop_removed(self):
+        """
+        Drops the uuids that are no longer in the registry, if it removed any assets since the last time.
+        The tuples without removed uuids are kept as they are.
+        """
+        removal_count = self._registry_removal_count()
+        if removal_count == self._removal_count:
+            return
+        self._removal_count = removal_count
+        registry = self._registry
+        self._set_chunks([chunk if all(map(registry.__contains__, chunk))
+                          else tuple(asset_uuid for asset_uuid in chunk if asset_uuid in registry)
+                          for chunk in self._chunks])
+
+    @staticmethod
+    def of_dirs(asset_dirs, registry):
+        """
+        :param asset_dirs: The `AssetDir`s to show, together with all their recursive subdirectories.
+                           A directory that is in the tree of another one should not be passed as well.
+        """
+        return AssetView([node.asset_uuids() for asset_dir in asset_dirs for node in asset_dir.walk()], registry)
+
+    @staticmethod
+    def of_assets(assets: dict, registry=None):
+        """
+        :param assets: uuid -> Asset dictionary. Used to look the assets up, when no registry is given.
+        """
+        if registry is None:
+            registry = assets
+        return AssetView([tuple(assets.keys())], registry)
+
+    def __len__(self):
+        self._drop_removed()
+        return self._count
+
+    def __iter__(self):
+        """
+        :return: Iterator over the assets, in order.
+        """
+        self._drop_removed()
+        return map(self._registry.get, itertools.chain.from_iterable(self._chunks))
+
+    def contains(self, asset_uuid) -> bool:
+        self._drop_removed()
+        if self._uuids is None:
+            self._uuids = set(itertools.chain.from_iterable(self._chunks))
+        return asset_uuid in self._uuids
+
+    def get(self, asset_uuid):
+        """
+        :return: The `Asset` with the uuid, or `None` if it is not in the view.
+        """
+        if not self.contains(asset_uuid):
+            return None
+        return self._registry.get(asset_uuid)
+
+    def index_of(self, asset_uuid):
+        """
+        :return: The place of the asset in the view, or `None` if it is not in the view.
+        """
+        if not self.contains(asset_uuid):
+            return None
+        if self._indexes is None:
+            self._indexes = {asset_uuid: index
+                             for index, asset_uuid in enumerate(itertools.chain.from_iterable(self._chunks))}
+        return self._indexes[asset_uuid]
+
+    def id_bits(self) -> int:
+        """
+        :return: Bitmap of the registry ids of the assets in the view. The registry needs to be an `AssetRegistry`.
+        """
+        self._drop_removed()
+        return self._registry.bits_of_uuids(itertools.chain.from_iterable(self._chunks))
+
+    def slice(self, start: int, stop: int) -> list:
+        """
+        :return: List of the assets from index `start` up to `stop`, without going through the ones before.
+        """
+        self._drop_removed()
+        stop = min(stop, self._count)
+        uuids = []
+        chunk_index = max(0, bisect.bisect_right(self._offsets, start) - 1)
+        while start < stop and chunk_index < len(self._chunks):
+            offset = self._offsets[chunk_index]
+            chunk = self._chunks[chunk_index]
+            uuids.extend(chunk[start - offset:stop - offset])
+            start = offset + len(chunk)
+            chunk_index += 1
+
+        return list(map(self._registry.get, uuids))
+
+    def sorted_by(self, sort_key: str, descending=False):
+        """
+        :param sort_key: One of the `sort_order.SORT_KEYS`.
+        :return: A new view with the same assets, sorted. The registry needs to be an `AssetRegistry`.
+        """
+        if len(self) == 0:
+            return self
+        registry = self._registry
+        return AssetView([registry.uuids_of_ids(registry.sorted_ids(self.id_bits(), sort_key, descending))], registry)
+
+    def with_assets(self, asset_uuids):
+        """
+        :param asset_uuids: Uuids to add to the end, if they are not in the view yet.
+        :return: A new view.
+        """
+        # The new view takes the chunks as they are, so they need to be up to date.
+        self._drop_removed()
+        if self._uuids is None:
+            self._uuids = set(itertools.chain.from_iterable(self._chunks))
+        uuids = self._uuids
+        new_uuids = tuple(asset_uuid for asset_uuid in asset_uuids if asset_uuid not in uuids)
+        view = AssetView(self._chunks + [new_uuids], self._registry)
+
+        # Views are extended over and over while a scan comes in, so the set is handed over instead of made again.
+        # This view makes a new one if it is still used.
+        uuids.update(new_uuids)
+        view._uuids = uuids
+        self._uuids = None
+        return view
+
+    def without_assets(self, asset_uuids):
+        """
+        :return: A new view, without the given uuids.
+        """
+        removed = {asset_uuid for asset_uuid in asset_uuids if self.contains(asset_uuid)}
+        if len(removed) == 0:
+            return self
+        remaining = tuple(asset_uuid for asset_uuid in itertools.chain.from_iterable(self._chunks)
+                          if asset_uuid not in removed)
+        return AssetView([remaining], self._registry)
@@ -1,75 +1,170 @@
+import logging
+import os
 import pathlib
-from concurrent import futures
+import threading
+
+import PyQt5.QtCore as Qcore
 
 import data
 
 
-class AsyncLoader:
+class AsyncLoader(Qcore.QObject):
     """
-    Utility class that hands off the loading and scanning of asset directories to an other thread.
+    Utility class that hands off the loading and scanning of asset directories to other threads.
     """
 
-    def __init__(self):
-        # List of asset directories to scan.
-        self._dirs_to_scan = []
+    # Fires when there are new partial or full results to retrieve.
+    # Emitted from the worker threads, so connections to objects in the GUI thread are queued.
+    # Does not fire again until the results are retrieved with `get_partial_results`.
+    results_available = Qcore.pyqtSignal()
+    # Emitted by `_notify`, and passed on as `results_available` through the event loop.
+    _new_results = Qcore.pyqtSignal()
+
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: How many directories can be read at the same time.
+                            Defaults to a few more than the number of cores, because most of the time is spent
+                            waiting on the file system.
+        """
+        super().__init__()
 
-        # Asynchronous executor.
-        # Only 1 worker, because we are working on the file system.
-        self._executor = futures.ThreadPoolExecutor(max_workers=1)
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
 
-        # Directory that is currently being scanned.
-        self._currently_scanning = None
-        # The future associated with the current scan.
-        self._future = None
+        self._scanner = data.ParallelScanner(max_workers)
 
-    def queue_scan(self, directory):
+        # The `ScanJob`s that have not yet been handed out as a result, in the order they were queued.
+        self._jobs = []
+
+        # Whether `results_available` was emitted, and the results were not yet retrieved.
+        # Keeps a flood of finished directories from flooding the event loop with signals.
+        self._notified = False
+        self._notify_lock = threading.Lock()
+        # Queued even when emitted from the GUI thread. A scan that is already done when it is queued notifies
+        # right away, and the listeners should not run inside `queue_scan`.
+        self._new_results.connect(self.results_available, Qcore.Qt.QueuedConnection)
+
+    def queue_scan(self, directory, previous=None, expected_directories=None):
         """
         Add a new directory to the scan queue.
-        Immediately starts the scan if there is nothing else queued.
+        The scan starts as soon as a worker is free.
         :param directory:
+        :param previous: The `AssetDir` from an earlier scan of this directory.
+                         When given, only the directories that changed since then are read again.
+        :param expected_directories: How many directories the scan is expected to visit, to estimate the remaining
+                                     time. Usually known from the previous time the directory was scanned.
+        """
+        job = self._scanner.submit(pathlib.Path(directory), previous, on_partial_result=self._notify,
+                                   expected_directories=expected_directories)
+        job.future().add_done_callback(lambda _: self._notify())
+        self._jobs.append(job)
+
+    def cancel_scan(self, directory) -> bool:
+        """
+        Cancels the queued or running scan of a directory. Its result will never be returned.
+        :return: True if there was a scan to cancel.
         """
-        self._dirs_to_scan.append(pathlib.Path(directory))
-        self._maybe_start_next_scan()
+        job = self._find_job(directory)
+        if job is None:
+            return False
+
+        self._jobs.remove(job)
+        self._scanner.cancel(job)
+        logging.info("Cancelled scan of asset directory: \"{}\"".format(directory))
+        return True
+
+    def prioritize_scan(self, directory):
+        """
+        Moves the scan of a directory in front of all other queued and running scans.
+        """
+        job = self._find_job(directory)
+        if job is not None and not job.done():
+            self._scanner.prioritize(job)
+
+    def _find_job(self, directory):
+        path = pathlib.Path(directory)
+        for job in self._jobs:
+            if job.root() == path:
+                return job
+        return None
 
     def get_maybe_result(self):
         """
-        Retrieves the result from a finished scan, or `None` when it is not finished.
-        Also starts the next scan.
+        Retrieves the result from a finished scan, or `None` when none is finished.
+        Call on the thread that queued the scans, see `ScanJob.result`.
+        Scans that failed are logged and skipped.
         :return: `AssetDir` when a scan is done. `None` when it isn't.
         """
-        if self._future is None or not self._future.done():
-            return None
+        for job in self._jobs:
+            if not job.done():
+                continue
 
-        result = self._future.result()
-        self._future = None
-        self._currently_scanning = None
+            self._jobs.remove(job)
 
-        self._maybe_start_next_scan()
-        return result
+            exception = job.future().exception()
+            if exception is not None:
+                logging.warning("Could not scan asset directory: \"{}\". Reason: {}".format(job.root(), exception))
+                # Try the next finished one.
+                return self.get_maybe_result()
+
+            logging.info("Scanned asset directory: \"{}\". {}".format(job.root(), job.statistics().summary()))
+            return job.result()
+
+        return None
+
+    def get_partial_results(self):
+        """
+        Retrieves the assets that were found by the scans that are still in progress, since the last call.
+        Partial results of a scan are no longer returned once its full result was retrieved.
+        :return: List of (root directory path, [(directory path, uuid -> Asset dictionary)]) tuples.
+        """
+        # Anything that comes in from here on needs a new notification.
+        with self._notify_lock:
+            self._notified = False
+
+        results = []
+        for job in self._jobs:
+            partial_results = job.take_partial_results()
+            if len(partial_results) > 0:
+                results.append((job.root(), partial_results))
+        return results
+
+    def scan_statistics(self):
+        """
+        :return: The combined live `ScanStatistics` of all scans that are queued or in progress.
+        """
+        return data.ScanStatistics.combine([job.statistics() for job in self._jobs])
 
     def currently_scanning(self):
         """
-        :return: The directory that is currently being scanned. `None` if we are not scanning anything.
+        :return: List of the directories that are currently being scanned, or whose result is waiting to be
+                 retrieved.
         """
-        return self._currently_scanning
+        return [job.root() for job in self._jobs if job.started()]
 
     def queue_size(self):
-        return len(self._dirs_to_scan)
+        return len(self.scan_queue())
 
     def scan_queue(self):
-        return self._dirs_to_scan
+        """
+        :return: List of the directories that are waiting for their scan to start, in the order they will start.
+        """
+        return [job.root() for job in self._scanner.queued_jobs() if job in self._jobs]
+
+    def is_busy(self):
+        """
+        :return: True if there are scans queued, in progress, or waiting for their result to be retrieved.
+        """
+        return len(self._jobs) > 0
 
-    def _maybe_start_next_scan(self):
+    def _notify(self):
         """
-        Starts a next scan if there is no scan running, and there is something queued.
-        :return:
+        Called from the worker threads when there is something new, or from the caller of `queue_scan` when the scan
+        is already done.
         """
-        if self._future is not None:
-            # Busy, or waiting for someone to get the result. can't start a new scan.
-            return
+        with self._notify_lock:
+            if self._notified:
+                return
+            self._notified = True
 
-        # Start the next scan.
-        if len(self._dirs_to_scan) > 0:
-            self._currently_scanning = self._dirs_to_scan.pop()
-            # Start the next scan.
-            self._future = self._executor.submit(data.recursive_load_asset_dir, self._currently_scanning)
+        self._new_results.emit()
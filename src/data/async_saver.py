@@ -0,0 +1,260 @@
+import logging
+import threading
+
+import PyQt5.QtCore as Qcore
+
+from data.load_scan_save import append_to_journal, clear_journal, write_dir_snapshot
+
+try:
+    from sqlite3 import Error as CatalogError
+except ImportError:
+    # Without sqlite there is no catalog, so there are no catalog errors either.
+    class CatalogError(Exception):
+        pass
+
+
+class AsyncSaver(Qcore.QObject):
+    """
+    Writes asset directory config files, and the catalog, on a background thread.
+
+    The directories are turned into `DirSnapshot`s on the GUI thread, so the writer never touches an `AssetDir`
+    that the user might be changing. A slow disk, or a network share, then only delays the writer, not the GUI.
+    When a directory is queued again before its previous snapshot was written, only the newest one is written.
+
+    Tag changes can also be appended to the journal of their asset directory, which is a lot cheaper than writing
+    the config files. Compacting a journal writes the given snapshots, and then clears the journal.
+    """
+
+    # List of (`DirSnapshot`, new `DirScanState`) of the directories that were written,
+    # list of (`DirSnapshot`, exception) of the directories that could not be written.
+    # Emitted from the writer thread, so connections to objects in the GUI thread are queued.
+    batch_done = Qcore.pyqtSignal(object, object)
+    # Root path of an asset directory whose journal could not be appended to. Its changes need to be written to the
+    # config files instead.
+    journal_failed = Qcore.pyqtSignal(object)
+    # List of the `DirSnapshot`s that were written to the catalog, with the file sizes and modification times of their
+    # assets measured.
+    stats_measured = Qcore.pyqtSignal(object)
+
+    def __init__(self, catalog=None):
+        """
+        :param catalog: The `AssetCatalog` to keep up to date with what is written, or `None`.
+        """
+        super().__init__()
+
+        self._catalog = catalog
+
+        self._condition = threading.Condition()
+        # Path -> `DirSnapshot` of the directories waiting to be written, in the order they were queued.
+        self._pending = {}
+        # Paths of the directories the catalog should forget.
+        self._pending_removed = {}
+        # Root paths of the asset directories the catalog should forget, after the pending snapshots.
+        self._pending_removed_roots = {}
+        # Root path -> list of the entries to append to its journal.
+        self._pending_journal = {}
+        # Root paths of the journals to clear, once the pending snapshots of the asset directory are written.
+        self._pending_compactions = {}
+        # Whether the writer is busy with a batch that it took from the pending work.
+        self._writing = False
+        self._stopping = False
+
+        self._thread = threading.Thread(target=self._run, name="AsyncSaver", daemon=True)
+        self._thread.start()
+
+    def set_catalog(self, catalog):
+        """
+        :param catalog: The `AssetCatalog` to write to from the next batch on, or `None` to stop writing to it.
+                        A batch that is already being written still uses the previous catalog, use `wait` before
+                        closing it.
+        """
+        with self._condition:
+            self._catalog = catalog
+
+    def queue(self, snapshots, removed_paths=()):
+        """
+        Queues directory snapshots to be written.
+        :param snapshots: `DirSnapshot`s. The ones with `write_config` set are written to their config file,
+                          all of them are written to the catalog.
+        :param removed_paths: Paths of the directories the catalog should forget.
+        """
+        with self._condition:
+            for path in removed_paths:
+                path = str(path)
+                pending = self._pending.get(path)
+                if pending is not None and not pending.write_config:
+                    del self._pending[path]
+                self._pending_removed[path] = None
+
+            for snapshot in snapshots:
+                self._pending_removed.pop(snapshot.path, None)
+                pending = self._pending.pop(snapshot.path, None)
+                if pending is not None and pending.write_config:
+                    if snapshot.asset_dir is None:
+                        # Only has what the catalog needs, without any assets to write to the config file.
+                        snapshot = pending
+                    else:
+                        # The newer contents are just as good to write, but the config file still needs writing.
+                        snapshot.write_config = True
+                self._pending[snapshot.path] = snapshot
+
+            self._condition.notify_all()
+
+    def append_to_journal(self, root_path, entries: list):
+        """
+        Queues entries to be appended to the journal of an asset directory.
+        """
+        if len(entries) == 0:
+            return
+        with self._condition:
+            self._pending_journal.setdefault(str(root_path), []).extend(entries)
+            self._condition.notify_all()
+
+    def compact(self, root_path, snapshots):
+        """
+        Queues the compaction of the journal of an asset directory.
+        :param snapshots: `DirSnapshot`s of all the directories with changes in the journal. The journal is only
+                          cleared if they could all be written.
+        """
+        root_path = str(root_path)
+        with self._condition:
+            # Entries that were not appended yet are already in the snapshots.
+            self._pending_journal.pop(root_path, None)
+            self._pending_compactions[root_path] = None
+        self.queue(snapshots)
+
+    def forget_root(self, root_path):
+        """
+        Removes an asset directory from the catalog, once everything queued before it is written.
+        """
+        with self._condition:
+            self._pending_removed_roots[str(root_path)] = None
+            self._condition.notify_all()
+
+    def pending_count(self):
+        """
+        :return: The number of directories that are waiting to be written, or are being written.
+        """
+        with self._condition:
+            return len(self._pending)
+
+    def wait(self, timeout=None) -> bool:
+        """
+        Waits until everything queued so far is written.
+        :param timeout: At most this many seconds. `None` waits as long as it takes.
+        :return: True if everything was written, False when the timeout ran out first.
+        """
+        with self._condition:
+            return self._condition.wait_for(self._is_idle, timeout)
+
+    def shutdown(self, timeout=None) -> bool:
+        """
+        Writes what is still queued, and stops the writer thread.
+        :param timeout: At most this many seconds. `None` waits as long as it takes.
+        :return: True if everything was written, False when the timeout ran out first.
+        """
+        done = self.wait(timeout)
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        return done
+
+    def _is_idle(self):
+        return not self._writing and len(self._pending) == 0 and len(self._pending_removed) == 0 and \
+               len(self._pending_removed_roots) == 0 and len(self._pending_journal) == 0 and \
+               len(self._pending_compactions) == 0
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: not self._is_idle() or self._stopping)
+                if self._is_idle():
+                    # Stopping, and nothing left to write.
+                    return
+
+                snapshots = list(self._pending.values())
+                removed_paths = list(self._pending_removed.keys())
+                removed_roots = list(self._pending_removed_roots.keys())
+                journal = self._pending_journal
+                compactions = list(self._pending_compactions.keys())
+                self._pending = {}
+                self._pending_removed = {}
+                self._pending_removed_roots = {}
+                self._pending_journal = {}
+                self._pending_compactions = {}
+                catalog = self._catalog
+                self._writing = True
+
+            try:
+                failed_roots = self._write_batch(snapshots, removed_paths, removed_roots, catalog)
+                self._write_journals(compactions, journal, failed_roots)
+            except Exception as e:
+                # Keep writing the batches that come after it.
+                logging.warning("Could not write a batch of {} asset directories. Reason: {}".format(
+                    len(snapshots), e))
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _write_batch(self, snapshots, removed_paths, removed_roots, catalog):
+        """
+        :return: Set of the root paths of the asset directories with snapshots that could not be written.
+        """
+        saved = []
+        failed = []
+        new_states = {}
+        for snapshot in snapshots:
+            if not snapshot.write_config:
+                continue
+
+            try:
+                new_state = write_dir_snapshot(snapshot)
+            except OSError as e:
+                logging.warning("Could not save asset directory: \"{}\". Reason: {}".format(snapshot.path, e))
+                failed.append((snapshot, e))
+                continue
+
+            new_states[snapshot.path] = new_state
+            saved.append((snapshot, new_state))
+
+        if catalog is not None:
+            # Directories that could not be written keep their old entry. The catalog mirrors what is on disk.
+            failed_paths = {snapshot.path for snapshot, _ in failed}
+            written = [snapshot for snapshot in snapshots if snapshot.path not in failed_paths]
+            try:
+                catalog.write_snapshots(written, removed_paths, new_states)
+                for root in removed_roots:
+                    catalog.remove_asset_dir(root)
+            except CatalogError as e:
+                # The config files are written, the catalog is only for starting faster.
+                logging.warning("Could not update the asset catalog. Reason: {}".format(e))
+            else:
+                measured = [snapshot for snapshot in written if snapshot.file_stats is not None]
+                if len(measured) > 0:
+                    self.stats_measured.emit(measured)
+
+        if len(saved) > 0 or len(failed) > 0:
+            self.batch_done.emit(saved, failed)
+        return {snapshot.root for snapshot, _ in failed}
+
+    def _write_journals(self, compactions, journal: dict, failed_roots: set):
+        """
+        Clears the compacted journals, and then appends the new entries.
+        Entries queued before a compaction were dropped when it was queued, so all these come after it.
+        """
+        for root_path in compactions:
+            if root_path in failed_roots:
+                # Some changes are still only in the journal.
+                continue
+            try:
+                clear_journal(root_path)
+            except OSError as e:
+                logging.warning("Could not clear journal of: \"{}\". Reason: {}".format(root_path, e))
+
+        for root_path, entries in journal.items():
+            try:
+                append_to_journal(root_path, entries)
+            except OSError as e:
+                logging.warning("Could not append to journal of: \"{}\". Reason: {}".format(root_path, e))
+                self.journal_failed.emit(root_path)
@@ -0,0 +1,364 @@
+import json
+import logging
+import os
+import pathlib
+import threading
+import uuid
+
+from data import Asset, AssetDir
+from data.image_analyzer import ImageAnalysis
+from data.load_scan_save import DirScanState, DirSnapshot, snapshot_asset_dir
+
+try:
+    import sqlite3
+except ImportError:
+    # Some Python builds come without sqlite. The program works without the catalog, it only starts slower.
+    sqlite3 = None
+
+CATALOG_FILE_NAME = "catalog.sqlite3"
+# For keeping track of breaking changes. A catalog with another version is thrown away and rebuilt.
+CATALOG_VERSION = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    dir_mtime INTEGER,
+    dir_inode INTEGER,
+    config_mtime INTEGER,
+    -- Json list of the names of all subdirectories, including the ones without assets.
+    subdirs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS directories_root ON directories (root);
+CREATE TABLE IF NOT EXISTS assets (
+    uuid TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    inode INTEGER,
+    size INTEGER,
+    mtime INTEGER,
+    -- See `pack_png_header`.
+    png_header INTEGER
+);
+CREATE INDEX IF NOT EXISTS assets_directory ON assets (directory);
+CREATE TABLE IF NOT EXISTS image_analyses (
+    uuid TEXT PRIMARY KEY,
+    -- Modification time of the file when it was analyzed. The analysis is only valid for that version of the file.
+    mtime INTEGER NOT NULL,
+    -- See `ImageAnalysis`. NULL when the file could not be read as an image.
+    dhash INTEGER,
+    colors INTEGER
+);
+"""
+# Number of uuids looked up per query. Older sqlite versions allow at most 999 parameters.
+_LOOKUP_BATCH_SIZE = 500
+
+
+class AssetCatalog:
+    """
+    A single SQLite file that mirrors the saved state of all asset directories.
+
+    For every directory it records what the directory looked like on disk (its `DirScanState`), and the assets as
+    they were saved to the directory's config file. At startup the whole tree of an asset directory comes out of
+    one query, instead of opening a config file in every directory. That tree is then handed to the scanner as the
+    previous scan, so only the directories that changed on disk since then are read.
+
+    The per-directory config files stay the source of truth. An entry is only trusted as long as the modification
+    times of its directory and config file did not change.
+    """
+
+    def __init__(self, file_path):
+        """
+        :param file_path: Where the catalog is stored. ":memory:" keeps it in memory, for testing.
+        """
+        self._file_path = str(file_path)
+        # The connection is shared, so saving can be moved off the GUI thread.
+        self._connection = sqlite3.connect(self._file_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self._connection:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != CATALOG_VERSION:
+                # Unknown, or empty. Start over, the catalog is rebuilt from the config files.
+                self._connection.executescript("DROP TABLE IF EXISTS directories; DROP TABLE IF EXISTS assets; "
+                                               "DROP TABLE IF EXISTS image_analyses;")
+                self._connection.execute("PRAGMA user_version = {}".format(CATALOG_VERSION))
+            self._connection.executescript(_SCHEMA)
+
+    def file_path(self):
+        return self._file_path
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def load_asset_dir(self, root_path) -> AssetDir:
+        """
+        Builds the `AssetDir` tree of an asset directory from the catalog, without touching the disk.
+        :return: The root `AssetDir`, with its `DirScanState` tree. `None` if the catalog does not know the directory.
+        """
+        root = str(pathlib.Path(root_path).absolute())
+        with self._lock:
+            directory_rows = self._connection.execute(
+                "SELECT path, dir_mtime, dir_inode, config_mtime, subdirs FROM directories WHERE root = ?",
+                (root,)).fetchall()
+            asset_rows = self._connection.execute(
+                "SELECT assets.directory, assets.name, assets.uuid, assets.tags, assets.inode, assets.size, "
+                "assets.mtime, assets.png_header "
+                "FROM assets JOIN directories ON assets.directory = directories.path WHERE directories.root = ?",
+                (root,)).fetchall()
+
+        rows = {row[0]: row[1:] for row in directory_rows}
+        if root not in rows:
+            return None
+
+        # Put the state tree together from the root down. Rows of directories that are no longer listed by their
+        # parent are left out.
+        states = {}
+        order = []
+        pending = [root]
+        while pending:
+            path = pending.pop()
+            row = rows.get(path)
+            if row is None:
+                # Listed by its parent, but never written. An empty state makes sure the scan reads it.
+                states[path] = DirScanState(None, None, None)
+                order.append(path)
+                continue
+
+            dir_mtime, dir_inode, config_mtime, subdir_names = row
+            state = DirScanState(dir_mtime, dir_inode, config_mtime)
+            states[path] = state
+            order.append(path)
+            for name in json.loads(subdir_names):
+                subdir_path = os.path.join(path, name)
+                pending.append(subdir_path)
+                # Filled in below, once the subdirectory's state exists.
+                state.subdir_states[name] = None
+
+        for path in order:
+            state = states[path]
+            for name in state.subdir_states.keys():
+                state.subdir_states[name] = states[os.path.join(path, name)]
+
+        assets = {}
+        for directory, name, asset_uuid, tags, inode, size, mtime, png_header in asset_rows:
+            if directory not in states:
+                continue
+            asset = Asset(os.path.join(directory, name), asset_uuid=uuid.UUID(asset_uuid), tags=json.loads(tags))
+            asset.set_inode(inode)
+            asset.set_size(size)
+            asset.set_modified_time(mtime)
+            asset.set_packed_png_header(png_header)
+            assets.setdefault(directory, {})[asset.uuid()] = asset
+
+        # Subdirectories are always done before their parents.
+        asset_dirs = {}
+        for path in reversed(order):
+            subdirs = {}
+            for name in states[path].subdir_states.keys():
+                subdir = asset_dirs.pop(os.path.join(path, name), None)
+                if subdir is not None:
+                    subdirs[pathlib.Path(name)] = subdir
+
+            dir_assets = assets.get(path, {})
+            # Only record directories that contain assets somewhere in their tree, just like a scan.
+            if path == root or len(dir_assets) > 0 or len(subdirs) > 0:
+                asset_dirs[path] = AssetDir(path, subdirs, dir_assets, scan_state=states[path])
+
+        return asset_dirs[root]
+
+    def update_asset_dir(self, root_dir: AssetDir):
+        """
+        Brings the catalog up to date with a scanned asset directory. Call right after it was saved, so what is in
+        memory matches the config files on disk.
+        Walks the whole tree, but only the directories whose `DirScanState` differs from the catalog are written.
+        """
+        snapshots, removed = self.snapshot_changes(root_dir)
+        self.write_snapshots(snapshots, removed)
+
+    def snapshot_changes(self, root_dir: AssetDir):
+        """
+        Finds out which directories of a scanned asset directory differ from the catalog.
+        Call on the GUI thread, the result can be written with `write_snapshots` on any thread.
+        :return: (List of `DirSnapshot`s of the changed directories, list of paths of the directories to forget).
+                 Empty if the directory was not fully scanned, because then there is nothing to compare with next time.
+        """
+        root_state = root_dir.scan_state()
+        if root_state is None:
+            return [], []
+
+        root = str(root_dir.absolute_path())
+        with self._lock:
+            known_rows = {row[0]: tuple(row[1:]) for row in self._connection.execute(
+                "SELECT path, dir_mtime, dir_inode, config_mtime, subdirs FROM directories WHERE root = ?", (root,))}
+
+        # The assets are stored per directory, but `AssetDir`s only exist for directories with assets.
+        asset_dirs = {}
+        nodes = [root_dir]
+        while nodes:
+            node = nodes.pop()
+            asset_dirs[str(node.absolute_path())] = node
+            nodes.extend(node.subdirs().values())
+
+        snapshots = []
+        seen = set()
+        states = [(root, root_state)]
+        while states:
+            path, state = states.pop()
+            seen.add(path)
+            if known_rows.get(path) != _state_row(state):
+                node = asset_dirs.get(path)
+                if node is not None:
+                    snapshots.append(snapshot_asset_dir(node, write_config=False))
+                else:
+                    snapshots.append(DirSnapshot(None, path, root, (), state, write_config=False))
+            for name, subdir_state in state.subdir_states.items():
+                states.append((os.path.join(path, name), subdir_state))
+        removed = [path for path in known_rows.keys() if path not in seen]
+
+        return snapshots, removed
+
+    def write_snapshots(self, snapshots, removed_paths=(), new_states=None):
+        """
+        Writes directories to the catalog, in a single transaction. Safe to call from any thread.
+        Snapshots without a `DirScanState` are skipped.
+        :param snapshots: List of `DirSnapshot`s, from any asset directory.
+        :param removed_paths: Paths of the directories to forget.
+        :param new_states: Path -> `DirScanState` of the directories whose config file was just written.
+                           Their modification times are taken from here instead of the snapshot.
+                           The file sizes and modification times of the assets end up in the `file_stats` of the
+                           snapshots.
+        """
+        if new_states is None:
+            new_states = {}
+        snapshots = [snapshot for snapshot in snapshots if snapshot.dir_mtime is not None]
+        removed_paths = list(removed_paths)
+        if len(snapshots) == 0 and len(removed_paths) == 0:
+            return
+
+        directory_rows = []
+        asset_rows = []
+        for snapshot in snapshots:
+            directory_rows.append(_directory_row(snapshot, new_states.get(snapshot.path)))
+            rows = [_asset_row(snapshot.path, asset) for asset in snapshot.assets]
+            # The files are stat-ed here anyway, so the GUI can learn their sizes.
+            snapshot.file_stats = {row[0]: (row[5], row[6]) for row in rows}
+            asset_rows.extend(rows)
+
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM assets WHERE directory = ?",
+                                         [(path,) for path in removed_paths + [row[0] for row in directory_rows]])
+            self._connection.executemany("DELETE FROM directories WHERE path = ?", [(path,) for path in removed_paths])
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO directories (path, root, dir_mtime, dir_inode, config_mtime, subdirs) "
+                "VALUES (?, ?, ?, ?, ?, ?)", directory_rows)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO assets (uuid, directory, name, tags, inode, size, mtime, png_header) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", asset_rows)
+
+        logging.debug("Updated catalog: {} directories written, {} removed.".format(
+            len(directory_rows), len(removed_paths)))
+
+    def remove_asset_dir(self, root_path):
+        """
+        Forgets everything about an asset directory.
+        """
+        root = str(pathlib.Path(root_path).absolute())
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM image_analyses WHERE uuid IN (SELECT assets.uuid FROM assets JOIN directories "
+                "ON assets.directory = directories.path WHERE directories.root = ?)", (root,))
+            self._connection.execute(
+                "DELETE FROM assets WHERE directory IN (SELECT path FROM directories WHERE root = ?)", (root,))
+            self._connection.execute("DELETE FROM directories WHERE root = ?", (root,))
+
+    def load_image_analyses(self, uuids_and_mtimes) -> dict:
+        """
+        Looks up the analyses of the images of assets. Safe to call from any thread.
+        :param uuids_and_mtimes: List of (uuid string, modification time of the file in nanoseconds).
+        :return: uuid string -> `ImageAnalysis` of the assets that were analyzed when their file had that
+                 modification time. `None` for the files that could not be read as an image.
+        """
+        mtimes = dict(uuids_and_mtimes)
+        uuids = list(mtimes.keys())
+        rows = []
+        with self._lock:
+            for start in range(0, len(uuids), _LOOKUP_BATCH_SIZE):
+                batch = uuids[start:start + _LOOKUP_BATCH_SIZE]
+                rows.extend(self._connection.execute(
+                    "SELECT uuid, mtime, dhash, colors FROM image_analyses WHERE uuid IN ({})".format(
+                        ", ".join("?" * len(batch))), batch))
+
+        return {asset_uuid: None if dhash is None else ImageAnalysis(_unsigned(dhash), colors)
+                for asset_uuid, mtime, dhash, colors in rows if mtime == mtimes[asset_uuid]}
+
+    def write_image_analyses(self, rows):
+        """
+        Keeps the analyses of the images of assets. Safe to call from any thread.
+        :param rows: List of (uuid string, modification time of the file in nanoseconds, `ImageAnalysis` or `None`).
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO image_analyses (uuid, mtime, dhash, colors) VALUES (?, ?, ?, ?)",
+                [(asset_uuid, mtime) + ((None, None) if analysis is None else
+                                        (_signed(analysis.dhash), analysis.colors))
+                 for asset_uuid, mtime, analysis in rows])
+
+
+def _signed(value: int) -> int:
+    """
+    :return: A 64 bit unsigned number as a signed one, sqlite only stores signed numbers.
+    """
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def _state_row(state: DirScanState):
+    return (state.dir_mtime, state.dir_inode, state.config_mtime, json.dumps(list(state.subdir_states.keys())))
+
+
+def _directory_row(snapshot: DirSnapshot, new_state: DirScanState):
+    dir_mtime, config_mtime = snapshot.dir_mtime, snapshot.config_mtime
+    if new_state is not None:
+        dir_mtime, config_mtime = new_state.dir_mtime, new_state.config_mtime
+    return (snapshot.path, snapshot.root, dir_mtime, snapshot.dir_inode, config_mtime,
+            json.dumps(list(snapshot.subdir_names)))
+
+
+def _asset_row(directory: str, asset: tuple):
+    """
+    Stats the file, only done for the directories that changed.
+    :param asset: (file name, uuid string, tags, inode, packed png header), as stored in a `DirSnapshot`.
+    """
+    name, asset_uuid, tags, inode, png_header = asset
+    try:
+        file_stat = os.stat(os.path.join(directory, name))
+        size, mtime = file_stat.st_size, file_stat.st_mtime_ns
+    except OSError:
+        size, mtime = None, None
+
+    return asset_uuid, directory, name, json.dumps(list(tags)), inode, size, mtime, png_header
+
+
+def open_catalog(directory):
+    """
+    Opens, or creates, the catalog in the given directory.
+    :return: The `AssetCatalog`, or `None` when sqlite is not available or the catalog could not be opened.
+    """
+    if sqlite3 is None:
+        logging.info("sqlite3 is not available, running without the asset catalog.")
+        return None
+
+    directory_path = pathlib.Path(directory)
+    try:
+        if not directory_path.is_dir():
+            directory_path.mkdir(parents=True)
+        return AssetCatalog(directory_path.joinpath(CATALOG_FILE_NAME))
+    except (OSError, sqlite3.Error) as e:
+        logging.warning("Could not open the asset catalog in: \"{}\". Reason: {}".format(directory, e))
+        return None
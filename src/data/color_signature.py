@@ -0,0 +1,131 @@
+import PyQt5.QtCore as Qcore
+import PyQt5.QtGui as Qgui
+
+# The image is shrunk to this many pixels wide and high before its colors are counted.
+_SAMPLE_SIZE = 16
+# Pixels that are more transparent than this are not counted, they are the background of an icon.
+_MIN_ALPHA = 128
+# Bits per channel of the bins the pixels are counted in. Similar colors end up in the same bin.
+_BIN_BITS = 3
+
+# Number of colors in a signature.
+SIGNATURE_COLORS = 3
+# Bits per channel of a color in a signature, and bits of its weight.
+_CHANNEL_BITS = 4
+_WEIGHT_BITS = 4
+_COLOR_BITS = 3 * _CHANNEL_BITS + _WEIGHT_BITS
+MAX_WEIGHT = (1 << _WEIGHT_BITS) - 1
+
+# Colors that cover at least this much of an image, out of `MAX_WEIGHT`, are what the image mostly is. The most
+# common color always counts.
+SIGNIFICANT_WEIGHT = 5
+
+# The names that can be searched for, see `color_name`.
+COLOR_NAMES = ("red", "orange", "yellow", "green", "cyan", "blue", "purple", "pink", "brown", "white", "gray",
+               "black")
+# Highest hue of each color with a hue, in degrees. Hues above the last one are red again.
+_HUE_NAMES = ((15, "red"), (40, "orange"), (70, "yellow"), (165, "green"), (195, "cyan"), (255, "blue"),
+              (290, "purple"), (345, "pink"))
+
+
+def color_signature(image: Qgui.QImage) -> int:
+    """
+    Finds the colors an image mostly consists of. Safe to use on any thread.
+    The image is shrunk to 16x16 pixels, and the pixels that are not transparent are counted in coarse bins. The
+    average colors of the `SIGNATURE_COLORS` fullest bins are the signature, with how much of the image they cover.
+    :return: The signature, packed in a single number, see `unpack_color_signature`. 0 for an image without any
+             pixels that are not transparent.
+    """
+    small = image.convertToFormat(Qgui.QImage.Format_ARGB32).scaled(
+        _SAMPLE_SIZE, _SAMPLE_SIZE, Qcore.Qt.IgnoreAspectRatio, Qcore.Qt.SmoothTransformation)
+    # One byte per channel, in this order on every platform. The rows have no padding at this width.
+    small = small.convertToFormat(Qgui.QImage.Format_RGBA8888)
+    pixels = small.constBits().asstring(small.bytesPerLine() * small.height())
+
+    # Bin -> [count, sum of red, sum of green, sum of blue].
+    bins = {}
+    shift = 8 - _BIN_BITS
+    for red, green, blue, alpha in zip(pixels[0::4], pixels[1::4], pixels[2::4], pixels[3::4]):
+        if alpha < _MIN_ALPHA:
+            continue
+        totals = bins.setdefault((red >> shift, green >> shift, blue >> shift), [0, 0, 0, 0])
+        totals[0] += 1
+        totals[1] += red
+        totals[2] += green
+        totals[3] += blue
+
+    pixel_count = sum(totals[0] for totals in bins.values())
+    signature = 0
+    fullest = sorted(bins.values(), key=lambda totals: totals[0], reverse=True)[:SIGNATURE_COLORS]
+    for place, (count, red, green, blue) in enumerate(fullest):
+        weight = max(1, round(count * MAX_WEIGHT / pixel_count))
+        packed = 0
+        for total in (red, green, blue):
+            packed = (packed << _CHANNEL_BITS) | ((total // count) >> (8 - _CHANNEL_BITS))
+        signature |= ((packed << _WEIGHT_BITS) | weight) << (place * _COLOR_BITS)
+    return signature
+
+
+def unpack_color_signature(signature: int) -> list:
+    """
+    :return: List of ((red, green, blue), weight) of the colors in the signature, the most common first. The
+             channels are from 0 to 255, the weights from 1 to `MAX_WEIGHT`.
+    """
+    colors = []
+    channel_mask = (1 << _CHANNEL_BITS) - 1
+    # Puts a channel back in the middle of the range of values it stands for.
+    scale = 1 << (8 - _CHANNEL_BITS)
+    while signature != 0:
+        packed = signature & ((1 << _COLOR_BITS) - 1)
+        signature >>= _COLOR_BITS
+        weight = packed & MAX_WEIGHT
+        packed >>= _WEIGHT_BITS
+        colors.append((tuple(((packed >> (_CHANNEL_BITS * (2 - channel))) & channel_mask) * scale + scale // 2
+                             for channel in range(3)), weight))
+    return colors
+
+
+def significant_colors(signature: int) -> list:
+    """
+    :return: List of the (red, green, blue) colors that the image mostly is, see `SIGNIFICANT_WEIGHT`.
+    """
+    colors = unpack_color_signature(signature)
+    return [color for place, (color, weight) in enumerate(colors) if place == 0 or weight >= SIGNIFICANT_WEIGHT]
+
+
+def color_name(color: tuple) -> str:
+    """
+    :param color: (red, green, blue), from 0 to 255.
+    :return: Which of the `COLOR_NAMES` people would call the color.
+    """
+    hue, saturation, value, _ = Qgui.QColor(*color).getHsv()
+    if value < 50:
+        return "black"
+    if saturation < 40:
+        return "white" if value > 200 else "gray"
+    for highest_hue, name in _HUE_NAMES:
+        if hue <= highest_hue:
+            if name == "orange" and value < 150:
+                return "brown"
+            return name
+    return "red"
+
+
+def parse_color(text: str):
+    """
+    :param text: A color like "#ff8800", "ff8800", "#f80", or one of the names Qt knows, like "teal".
+    :return: (red, green, blue), or `None` if the text is not a color.
+    """
+    if len(text) in (3, 6) and all(character in "0123456789abcdefABCDEF" for character in text):
+        text = "#" + text
+    color = Qgui.QColor(text)
+    if not color.isValid():
+        return None
+    return color.red(), color.green(), color.blue()
+
+
+def color_distance(color_a: tuple, color_b: tuple) -> float:
+    """
+    :return: How far apart two (red, green, blue) colors are. 0 for the same color, about 440 for black and white.
+    """
+    return sum((channel_a - channel_b) ** 2 for channel_a, channel_b in zip(color_a, color_b)) ** 0.5
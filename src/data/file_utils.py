@@ -0,0 +1,36 @@
+import os
+import threading
+
+
+def write_text_atomically(path, text: str):
+    """
+    Writes a text file, so that readers either see the old, or the new contents. Never a half written file.
+    The text is written to a temporary file next to it first, which then replaces the original.
+    """
+    _write_atomically(path, text, 'w')
+
+
+def write_bytes_atomically(path, contents: bytes):
+    """
+    Same as `write_text_atomically`, for binary files.
+    """
+    _write_atomically(path, contents, 'wb')
+
+
+def _write_atomically(path, contents, mode: str):
+    path = str(path)
+    # Unique per thread, in case two threads write the same file.
+    temp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(temp_path, mode) as f:
+            f.write(contents)
+            f.flush()
+            # Make sure the contents are on disk before the rename, or a crash can leave an empty file behind.
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,221 @@
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent import futures
+
+import PyQt5.QtCore as Qcore
+import PyQt5.QtGui as Qgui
+
+from data.async_saver import CatalogError
+from data.color_signature import color_signature
+from data.image_hash import difference_hash, duplicate_groups
+
+# What is learned from looking at the pixels of an image.
+# `dhash`: See `image_hash.difference_hash`.
+# `colors`: See `color_signature.color_signature`.
+ImageAnalysis = collections.namedtuple("ImageAnalysis", ["dhash", "colors"])
+
+# Number of images a worker takes at a time. The catalog is asked about all of them in one go.
+BATCH_SIZE = 64
+# Images are shrunk to this size once, and analyzed from there. Large enough for every analysis.
+_THUMBNAIL_SIZE = 32
+
+
+def analyze_image(path):
+    """
+    Decodes an image, and analyzes it. Safe to call on any thread.
+    :return: The `ImageAnalysis`, or `None` if the image could not be read.
+    """
+    image = Qgui.QImage(str(path))
+    if image.isNull():
+        return None
+    thumbnail = image.convertToFormat(Qgui.QImage.Format_ARGB32).scaled(
+        _THUMBNAIL_SIZE, _THUMBNAIL_SIZE, Qcore.Qt.IgnoreAspectRatio, Qcore.Qt.SmoothTransformation)
+    return ImageAnalysis(difference_hash(thumbnail), color_signature(thumbnail))
+
+
+class ImageAnalyzer(Qcore.QObject):
+    """
+    Analyzes the images of assets on a pool of worker threads, see `analyze_image`.
+
+    Decoding images is the slow part, so the analyses are kept in the catalog by asset uuid, together with the
+    modification time of the file. An image is only decoded again when its file changed.
+
+    The workers compete with the GUI for the disk and the interpreter. While the user is scrolling through the
+    assets, they can be held off with `pause`.
+    """
+
+    # Fires when there are new results to retrieve with `take_results`.
+    # Emitted from the worker threads, so connections to objects in the GUI thread are queued.
+    # Does not fire again until the results are retrieved.
+    results_available = Qcore.pyqtSignal()
+    # List of lists of the ids in each group, see `find_duplicates`. Emitted from a worker thread.
+    duplicates_found = Qcore.pyqtSignal(object)
+    # Passed on as the signals above through the event loop, see `__init__`.
+    _new_results = Qcore.pyqtSignal()
+    _new_duplicates = Qcore.pyqtSignal(object)
+
+    def __init__(self, catalog=None, max_workers=None):
+        """
+        :param catalog: The `AssetCatalog` to keep the analyses in, or `None`.
+        :param max_workers: How many images are decoded at the same time. Defaults to half of the cores, so the
+                            rest of the program doesn't have to wait for a free core.
+        """
+        super().__init__()
+
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 1) // 2)
+        self._executor = futures.ThreadPoolExecutor(max_workers, thread_name_prefix="ImageAnalyzer")
+        self._catalog = catalog
+
+        self._lock = threading.Lock()
+        # Future -> number of assets, of the batches that are queued or being analyzed.
+        self._batches = {}
+        # Number of assets in the batches.
+        self._pending_count = 0
+        # (Asset, `ImageAnalysis` or `None`) of the analyzed assets that were not yet taken.
+        self._results = []
+        # Whether `results_available` was emitted, and the results were not yet retrieved.
+        self._notified = False
+        # `time.monotonic` time until which the workers don't start on a new image.
+        self._paused_until = 0
+
+        # Queued even when emitted from the GUI thread. Work that is already done when its callback is added calls it
+        # right away, and the listeners should not run inside `queue` or `find_duplicates`.
+        self._new_results.connect(self.results_available, Qcore.Qt.QueuedConnection)
+        self._new_duplicates.connect(self.duplicates_found, Qcore.Qt.QueuedConnection)
+
+    def set_catalog(self, catalog):
+        """
+        :param catalog: The `AssetCatalog` to use from the next batch on, or `None`.
+        """
+        with self._lock:
+            self._catalog = catalog
+
+    def queue(self, assets):
+        """
+        Queues assets to be analyzed. Assets that are already in the catalog with the same modification time are
+        not decoded again.
+        """
+        assets = list(assets)
+        for start in range(0, len(assets), BATCH_SIZE):
+            batch = assets[start:start + BATCH_SIZE]
+            with self._lock:
+                future = self._executor.submit(self._analyze_batch, batch)
+                self._batches[future] = len(batch)
+                self._pending_count += len(batch)
+            future.add_done_callback(self._batch_done)
+
+    def pause(self, seconds: float):
+        """
+        Keeps the workers from starting on new images for a while. Images that are being analyzed are finished.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_while_paused(self):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def pending_count(self) -> int:
+        """
+        :return: The number of assets that are queued, or being analyzed.
+        """
+        with self._lock:
+            return self._pending_count
+
+    def take_results(self) -> list:
+        """
+        :return: List of (Asset, `ImageAnalysis`) of the assets that were analyzed since the last call.
+                 The analysis is `None` for files that could not be read as an image.
+        """
+        with self._lock:
+            results = self._results
+            self._results = []
+            self._notified = False
+        return results
+
+    def find_duplicates(self, ids_and_hashes):
+        """
+        Groups the images that look the same on a worker thread, see `image_hash.duplicate_groups`. The groups are
+        handed out with `duplicates_found`.
+        :param ids_and_hashes: List of (id, hash).
+        """
+        future = self._executor.submit(duplicate_groups, ids_and_hashes)
+        future.add_done_callback(self._duplicates_done)
+
+    def shutdown(self):
+        """
+        Drops everything that is still queued. Does not wait for the batches that are being analyzed.
+        """
+        with self._lock:
+            for future in self._batches:
+                future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _analyze_batch(self, assets: list):
+        with self._lock:
+            catalog = self._catalog
+
+        results = []
+        # (Asset, modification time the analysis is kept with).
+        asset_mtimes = []
+        for asset in assets:
+            try:
+                asset_mtimes.append((asset, os.stat(asset.absolute_path()).st_mtime_ns))
+            except OSError:
+                # Gone, nothing to analyze.
+                results.append((asset, None))
+
+        known = {}
+        if catalog is not None:
+            try:
+                known = catalog.load_image_analyses([(str(asset.uuid()), mtime) for asset, mtime in asset_mtimes])
+            except CatalogError as e:
+                logging.warning("Could not read image analyses from the catalog. Reason: {}".format(e))
+
+        new_rows = []
+        for asset, mtime in asset_mtimes:
+            asset_uuid = str(asset.uuid())
+            if asset_uuid in known:
+                results.append((asset, known[asset_uuid]))
+                continue
+            self._wait_while_paused()
+            analysis = analyze_image(asset.absolute_path())
+            results.append((asset, analysis))
+            new_rows.append((asset_uuid, mtime, analysis))
+
+        if catalog is not None and len(new_rows) > 0:
+            try:
+                catalog.write_image_analyses(new_rows)
+            except CatalogError as e:
+                logging.warning("Could not write image analyses to the catalog. Reason: {}".format(e))
+
+        with self._lock:
+            self._results.extend(results)
+
+    def _duplicates_done(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logging.warning("Could not find duplicate images. Reason: {}".format(future.exception()))
+            # Whoever asked is still waiting for an answer.
+            self._new_duplicates.emit([])
+            return
+        self._new_duplicates.emit(future.result())
+
+    def _batch_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.warning("Could not analyze images. Reason: {}".format(future.exception()))
+        with self._lock:
+            self._pending_count -= self._batches.pop(future)
+            if future.cancelled() or self._notified:
+                return
+            self._notified = True
+        self._new_results.emit()
@@ -0,0 +1,109 @@
+import PyQt5.QtCore as Qcore
+import PyQt5.QtGui as Qgui
+
+from data.asset_registry import count_bits
+
+# The image is shrunk to this many columns and rows to make a hash. Every bit compares a pixel with the one to its
+# right, so there is one column more than there are bits in a row.
+_HASH_COLUMNS = 9
+_HASH_ROWS = 8
+HASH_BITS = (_HASH_COLUMNS - 1) * _HASH_ROWS
+
+# Hashes that differ in at most this many bits are of images that look the same: copies, re-saved or slightly
+# scaled versions of the same icon.
+NEAR_DUPLICATE_DISTANCE = 3
+
+
+def difference_hash(image: Qgui.QImage) -> int:
+    """
+    The "dHash" of an image: shrinks it to 9x8 gray pixels, and sets a bit for every pixel that is brighter than the
+    one to its right. Images that look alike get hashes that differ in only a few bits, whatever their size.
+    Transparent pixels count as white, so an icon hashes the same with or without a white background.
+    Safe to use on any thread.
+    :return: A `HASH_BITS` bit number.
+    """
+    small = image.convertToFormat(Qgui.QImage.Format_ARGB32).scaled(
+        _HASH_COLUMNS, _HASH_ROWS, Qcore.Qt.IgnoreAspectRatio, Qcore.Qt.SmoothTransformation)
+
+    hash_value = 0
+    for y in range(_HASH_ROWS):
+        grays = [_gray_on_white(small.pixel(x, y)) for x in range(_HASH_COLUMNS)]
+        for left, right in zip(grays, grays[1:]):
+            hash_value = (hash_value << 1) | (left > right)
+    return hash_value
+
+
+def _gray_on_white(rgb: int) -> int:
+    alpha = (rgb >> 24) & 0xff
+    gray = (((rgb >> 16) & 0xff) * 299 + ((rgb >> 8) & 0xff) * 587 + (rgb & 0xff) * 114) // 1000
+    return (gray * alpha + 255 * (255 - alpha)) // 255
+
+
+def hash_distance(hash_a: int, hash_b: int) -> int:
+    """
+    :return: The number of bits the hashes differ in.
+    """
+    return count_bits(hash_a ^ hash_b)
+
+
+def duplicate_groups(ids_and_hashes, max_distance=NEAR_DUPLICATE_DISTANCE) -> list:
+    """
+    Groups the images that look the same.
+
+    Comparing every hash with every other one is out of the question for a large library. Instead the hashes are
+    split into `max_distance + 1` bands of bits. Two hashes that differ in at most `max_distance` bits have at
+    least one band that is exactly the same, so only the hashes that share a band are compared.
+    Groups are chained: when A looks like B, and B looks like C, then A, B and C are one group.
+    :param ids_and_hashes: Iterable of (id, hash).
+    :param max_distance: How many bits the hashes of images in a group may differ in.
+    :return: List of lists of the ids in each group of two or more, the largest groups first.
+    """
+    # Exact copies are the most common duplicates, they only need to be compared once.
+    ids_per_hash = {}
+    for item_id, hash_value in ids_and_hashes:
+        ids_per_hash.setdefault(hash_value, []).append(item_id)
+    hashes = list(ids_per_hash.keys())
+
+    # Index of the hash that stands for the group of every hash, see `_find`.
+    parents = list(range(len(hashes)))
+
+    band_count = max_distance + 1
+    start = 0
+    for band in range(band_count):
+        # The first bands get the left over bits.
+        width = HASH_BITS // band_count + (1 if band < HASH_BITS % band_count else 0)
+        mask = ((1 << width) - 1) << start
+        start += width
+
+        buckets = {}
+        for index, hash_value in enumerate(hashes):
+            buckets.setdefault(hash_value & mask, []).append(index)
+
+        for bucket in buckets.values():
+            for position, index in enumerate(bucket):
+                hash_value = hashes[index]
+                for other_index in bucket[position + 1:]:
+                    if count_bits(hash_value ^ hashes[other_index]) <= max_distance:
+                        _union(parents, index, other_index)
+
+    # Group root -> ids.
+    groups = {}
+    for index, hash_value in enumerate(hashes):
+        groups.setdefault(_find(parents, index), []).extend(ids_per_hash[hash_value])
+    return sorted((group for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+
+def _find(parents: list, index: int) -> int:
+    root = index
+    while parents[root] != root:
+        root = parents[root]
+    # Point everything on the way straight at the root, so the next search is short.
+    while parents[index] != root:
+        parents[index], index = root, parents[index]
+    return root
+
+
+def _union(parents: list, index_a: int, index_b: int):
+    root_a, root_b = _find(parents, index_a), _find(parents, index_b)
+    if root_a != root_b:
+        parents[max(root_a, root_b)] = min(root_a, root_b)
@@ -0,0 +1,78 @@
+from data import AssetDir
+from data.load_scan_save import find_dirty_asset_dirs, journal_entries, snapshot_asset_dir
+
+
+class AssetJournal:
+    """
+    Keeps track of the changes in the library that are only saved in the journals of the asset directories.
+
+    Every asset directory has a journal file in its root. Saving a tag change only appends a line with the new state
+    of the asset to it, instead of rewriting the config file of the whole directory. Loading an asset directory
+    replays its journal on top of the config files.
+    Once a journal has grown large enough, it is compacted: the directories it mentions are written to their config
+    files, and the journal is cleared.
+
+    Only to be used on the GUI thread, the files themselves are written by the `AsyncSaver`.
+    """
+
+    # How many entries a journal can collect before it is compacted.
+    COMPACT_THRESHOLD = 5000
+
+    def __init__(self):
+        # Root path -> insertion ordered set of the `AssetDir`s with changes that are only in the journal.
+        self._uncompacted = {}
+        # Root path -> number of entries appended since the last compaction.
+        self._entry_counts = {}
+
+    def record(self, asset_dirs):
+        """
+        Takes the changes of dirty directories, and marks the directories as saved.
+        :param asset_dirs: `AssetDir`s from any of the asset directories.
+        :return: Root path -> list of the journal entries to append.
+        """
+        entries = {}
+        for asset_dir in asset_dirs:
+            root_path = asset_dir.root().absolute_path()
+            entries.setdefault(root_path, []).extend(journal_entries(asset_dir, root_path))
+            asset_dir.was_saved()
+            # Even without dirty assets, for example because writing its config file failed.
+            self._uncompacted.setdefault(root_path, {})[asset_dir] = None
+
+        for root_path, root_entries in entries.items():
+            self._entry_counts[root_path] = self._entry_counts.get(root_path, 0) + len(root_entries)
+        return entries
+
+    def needs_compaction(self):
+        """
+        :return: Root paths of the asset directories whose journal grew large enough to compact.
+        """
+        return [root_path for root_path, count in self._entry_counts.items() if count >= self.COMPACT_THRESHOLD]
+
+    def has_changes(self, root_path):
+        """
+        :return: True if some changes of the asset directory are only saved in its journal.
+        """
+        return len(self._uncompacted.get(root_path, {})) > 0
+
+    def take_compaction(self, root_dir: AssetDir):
+        """
+        Snapshots all the directories of an asset directory that have changes in the journal, or are dirty.
+        Once these are written, the journal can be cleared.
+        :return: List of `DirSnapshot`s.
+        """
+        root_path = root_dir.absolute_path()
+        asset_dirs = dict.fromkeys(asset_dir for asset_dir in self._uncompacted.pop(root_path, {}).keys()
+                                   # Directories of an earlier tree that were not taken over by a rescan.
+                                   if asset_dir.root() is root_dir)
+        asset_dirs.update(dict.fromkeys(find_dirty_asset_dirs(root_dir)))
+        self._entry_counts.pop(root_path, None)
+
+        snapshots = []
+        for asset_dir in asset_dirs.keys():
+            snapshots.append(snapshot_asset_dir(asset_dir))
+            asset_dir.was_saved()
+        return snapshots
+
+    def forget(self, root_path):
+        self._uncompacted.pop(root_path, None)
+        self._entry_counts.pop(root_path, None)
@@ -0,0 +1,106 @@
+import logging
+import marshal
+import pathlib
+import uuid
+
+from data import Asset, AssetDir
+from data.file_utils import write_bytes_atomically
+from data.load_scan_save import DirScanState
+
+LIBRARY_SNAPSHOT_FILE_NAME = "library.snapshot"
+# For keeping track of breaking changes. A snapshot with another version is ignored.
+LIBRARY_SNAPSHOT_VERSION = 4
+
+
+def save_library_snapshot(directory, asset_dirs):
+    """
+    Saves the whole library in a single compact file, so it can be shown right away at the next startup.
+
+    The snapshot only holds plain tuples, dictionaries and strings, written with `marshal`. That is a lot faster to
+    read than json, or building the trees from the catalog. `marshal` is only meant for the Python version that
+    wrote it, but a snapshot that can't be read is simply ignored.
+    :param directory: The directory to save the file in.
+    :param asset_dirs: The root `AssetDir`s to save. Asset dirs without a `DirScanState` are skipped, there is
+                       nothing to verify them against at the next startup.
+    """
+    roots = []
+    for asset_dir in asset_dirs:
+        if asset_dir.scan_state() is not None:
+            roots.append((str(asset_dir.absolute_path()), _encode_state(asset_dir.scan_state()),
+                          _encode_dir(asset_dir)))
+
+    directory_path = pathlib.Path(directory)
+    if not directory_path.is_dir():
+        directory_path.mkdir(parents=True)
+    write_bytes_atomically(directory_path.joinpath(LIBRARY_SNAPSHOT_FILE_NAME),
+                           marshal.dumps((LIBRARY_SNAPSHOT_VERSION, roots)))
+
+
+def load_library_snapshot(directory) -> dict:
+    """
+    Loads the library that was saved with `save_library_snapshot`.
+    The trees are what the asset directories looked like when they were saved. Pass them as the previous scan to
+    the scanner, to verify them against what is on disk now.
+    :return: Root path -> root `AssetDir`. Empty when there is no snapshot, or it could not be read.
+    """
+    file_path = pathlib.Path(directory).joinpath(LIBRARY_SNAPSHOT_FILE_NAME)
+    try:
+        with open(file_path, 'rb') as f:
+            version, roots = marshal.load(f)
+        if version != LIBRARY_SNAPSHOT_VERSION:
+            logging.info("Ignoring library snapshot with unknown version: \'{}\', expected: \'{}\'.".format(
+                version, LIBRARY_SNAPSHOT_VERSION))
+            return {}
+
+        asset_dirs = {}
+        for root, state, encoded_dir in roots:
+            root_path = pathlib.Path(root)
+            asset_dirs[root_path] = _decode_dir(root_path, _decode_state(state), encoded_dir)
+        return asset_dirs
+    except FileNotFoundError:
+        return {}
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        logging.warning("Could not load library snapshot: \"{}\". Reason: {}".format(file_path, e))
+        return {}
+
+
+def _encode_state(state: DirScanState):
+    return (state.dir_mtime, state.dir_inode, state.config_mtime,
+            {name: _encode_state(subdir_state) for name, subdir_state in state.subdir_states.items()})
+
+
+def _decode_state(encoded) -> DirScanState:
+    dir_mtime, dir_inode, config_mtime, subdir_states = encoded
+    return DirScanState(dir_mtime, dir_inode, config_mtime,
+                        {name: _decode_state(subdir_state) for name, subdir_state in subdir_states.items()})
+
+
+def _encode_dir(asset_dir: AssetDir):
+    """
+    The scan state is saved separately, because it also covers the directories without assets.
+    """
+    assets = tuple((asset.name(), asset.uuid().bytes, tuple(asset.tags()), asset.inode(), asset.size(),
+                    asset.modified_time(), asset.packed_png_header())
+                   for asset in asset_dir.assets().values())
+    subdirs = tuple((str(rel_path), _encode_dir(subdir)) for rel_path, subdir in asset_dir.subdirs().items())
+    return assets, subdirs
+
+
+def _decode_dir(path: pathlib.Path, state: DirScanState, encoded) -> AssetDir:
+    encoded_assets, encoded_subdirs = encoded
+
+    subdirs = {}
+    for rel_path, encoded_subdir in encoded_subdirs:
+        subdir_state = state.subdir_states.get(rel_path) if state is not None else None
+        subdirs[pathlib.Path(rel_path)] = _decode_dir(path.joinpath(rel_path), subdir_state, encoded_subdir)
+
+    assets = {}
+    for name, uuid_bytes, tags, inode, size, mtime, png_header in encoded_assets:
+        asset = Asset(path.joinpath(name), asset_uuid=uuid.UUID(bytes=uuid_bytes), tags=tags)
+        asset.set_inode(inode)
+        asset.set_size(size)
+        asset.set_modified_time(mtime)
+        asset.set_packed_png_header(png_header)
+        assets[asset.uuid()] = asset
+
+    return AssetDir(path, subdirs, assets, scan_state=state)
@@ -0,0 +1,155 @@
+from data.asset_registry import count_bits
+from data.asset_view import AssetView
+
+# Number of ids per block of the result bitmap. Looking up assets by their place in the result only has to decode
+# the blocks it needs.
+BLOCK_BITS = 4096
+_BLOCK_MASK = (1 << BLOCK_BITS) - 1
+
+
+class LiveQuery:
+    """
+    The assets of the library that match a query, kept up to date while tags are edited and assets come and go.
+
+    Only the assets that changed are checked against the query again, see `AssetRegistry.add_listener`. Can be shown
+    by the asset views like an `AssetView`, in the order of the asset ids.
+    """
+
+    def __init__(self, query, registry, changed=None):
+        """
+        :param query: A query from `parse_query`.
+        :param registry: The `AssetRegistry` to search in.
+        :param changed: Called after changes in the registry, with: uuid -> Asset dictionary of the assets that now
+                        match, list of uuids of the assets that no longer match, and uuid -> Asset dictionary of the
+                        assets that still match but changed, for example because they were renamed.
+        """
+        self._query = query
+        self._registry = registry
+        self._changed = changed
+
+        self._bits = query.matching_bits(registry)
+        # Number of matching assets in every block of ids.
+        self._block_counts = []
+        self._count_blocks(range(0, self._bits.bit_length() // BLOCK_BITS + 1))
+
+        registry.add_listener(self)
+
+    def close(self):
+        """
+        Stops following the registry.
+        """
+        self._registry.remove_listener(self)
+
+    def _count_blocks(self, blocks):
+        for block in blocks:
+            while len(self._block_counts) <= block:
+                self._block_counts.append(0)
+            self._block_counts[block] = count_bits(self._block_bits(block))
+
+    def _block_bits(self, block: int) -> int:
+        """
+        :return: The bits of a block, with the first id of the block at bit 0.
+        """
+        return (self._bits >> (block * BLOCK_BITS)) & _BLOCK_MASK
+
+    def assets_changed(self, changes: list):
+        """
+        Called by the registry.
+        :param changes: List of (id, `Asset`).
+        """
+        registry = self._registry
+        # The newest change of an id counts.
+        changed_assets = dict(changes)
+        matching_ids = [asset_id for asset_id, asset in changed_assets.items()
+                        if registry.asset(asset_id) is asset and self._query.matches_asset(asset, registry)]
+
+        changed_bits = registry.bits_of_ids(changed_assets.keys())
+        matching_bits = registry.bits_of_ids(matching_ids)
+        old_bits = self._bits
+        self._bits = (old_bits & ~changed_bits) | matching_bits
+        if self._bits != old_bits:
+            self._count_blocks({asset_id // BLOCK_BITS for asset_id in changed_assets.keys()})
+
+        if self._changed is not None and (matching_bits != 0 or self._bits != old_bits):
+            added = registry.ids_of_bits(matching_bits & ~old_bits)
+            removed = registry.ids_of_bits(old_bits & changed_bits & ~matching_bits)
+            updated = registry.ids_of_bits(matching_bits & old_bits)
+            self._changed(self._assets_of(changed_assets, added),
+                          [changed_assets[asset_id].uuid() for asset_id in removed],
+                          self._assets_of(changed_assets, updated))
+
+    @staticmethod
+    def _assets_of(changed_assets: dict, asset_ids: list) -> dict:
+        return {changed_assets[asset_id].uuid(): changed_assets[asset_id] for asset_id in asset_ids}
+
+    def __len__(self):
+        return sum(self._block_counts)
+
+    def __iter__(self):
+        """
+        :return: Iterator over the matching assets.
+        """
+        return (self._registry.asset(asset_id) for asset_id in self._registry.ids_of_bits(self._bits))
+
+    def contains(self, asset_uuid) -> bool:
+        asset_id = self._registry.id_of(asset_uuid)
+        return asset_id is not None and (self._bits >> asset_id) & 1 == 1
+
+    def get(self, asset_uuid):
+        """
+        :return: The `Asset` with the uuid, or `None` if it does not match.
+        """
+        if not self.contains(asset_uuid):
+            return None
+        return self._registry.get(asset_uuid)
+
+    def index_of(self, asset_uuid):
+        """
+        :return: The place of the asset in the result, or `None` if it does not match.
+        """
+        if not self.contains(asset_uuid):
+            return None
+        asset_id = self._registry.id_of(asset_uuid)
+        block = asset_id // BLOCK_BITS
+        below = self._block_bits(block) & ((1 << (asset_id - block * BLOCK_BITS)) - 1)
+        return sum(self._block_counts[:block]) + count_bits(below)
+
+    def id_bits(self) -> int:
+        """
+        :return: Bitmap of the registry ids of the matching assets.
+        """
+        return self._bits
+
+    def slice(self, start: int, stop: int) -> list:
+        """
+        :return: List of the matching assets from index `start` up to `stop`.
+        """
+        assets = []
+        # Index of the first asset of the block.
+        offset = 0
+        for block, count in enumerate(self._block_counts):
+            if offset + count > start and offset < stop:
+                ids = self._registry.ids_of_bits(self._block_bits(block))
+                for asset_id in ids[max(0, start - offset):stop - offset]:
+                    assets.append(self._registry.asset(block * BLOCK_BITS + asset_id))
+            offset += count
+            if offset >= stop:
+                break
+        return assets
+
+    def sorted_by(self, sort_key: str, descending=False):
+        """
+        :return: An `AssetView` of the current result, sorted. It does not follow the registry by itself, new matches
+                 are passed to `changed` as before.
+        """
+        registry = self._registry
+        return AssetView([registry.uuids_of_ids(registry.sorted_ids(self._bits, sort_key, descending))], registry)
+
+    def with_assets(self, asset_uuids):
+        """
+        The result follows the registry by itself.
+        """
+        return self
+
+    def without_assets(self, asset_uuids):
+        return self
@@ -1,9 +1,14 @@
 import json
 import logging
+import os
 import pathlib
+import time
 import uuid
 
 from data import AssetDir, Asset
+from data.file_utils import write_text_atomically
+from data.png_header import pack_png_header, read_png_header
+from data.scan_statistics import ScanStatistics
 
 CONFIG_FILE_NAME = ".asset_dir.json"
 # For keeping track of breaking changes.
@@ -16,23 +21,350 @@ CFG_ASSETS = "assets"
 CFG_ASSET_UUID = "uuid"
 CFG_ASSET_TAGS = "tags"
 
+# Journal of the tag changes that are not yet in the config files. Only in the root of an asset directory.
+JOURNAL_FILE_NAME = ".asset_dir.journal"
+# Journal entry keys.
+JNL_DIR = "dir"
+JNL_NAME = "name"
+JNL_UUID = "uuid"
+JNL_TAGS = "tags"
 
-def recursive_load_asset_dir(path) -> AssetDir:
+
+def recursive_load_asset_dir(path, previous: AssetDir = None) -> AssetDir:
     """
     Loads an AssetDir from the given path.
     When a config file exists, it will attempt to load that first, and then scan the directory for any new
     assets.
-    # TODO: also scan for assets that we have seen, but are no longer there.
+    Scans the whole directory tree on the calling thread. Use the `ParallelScanner` to spread a scan over
+    multiple threads.
+    :param previous: The `AssetDir` from an earlier scan of the same path. Directories that did not change since
+                     then are not read again.
+    """
+    previous_scan = PreviousScan(previous) if previous is not None else None
+    previous_state = previous.scan_state() if previous is not None else None
+    asset_dir = _recursive_load_asset_dir(pathlib.Path(path), previous_scan, previous_state)
+    replay_journal(asset_dir)
+    return asset_dir
+
+
+def _recursive_load_asset_dir(path: pathlib.Path, previous, previous_state) -> AssetDir:
+    previous_assets = previous.assets if previous is not None else None
+    assets, subdir_paths, state, unchanged, stat_updates = load_asset_dir_contents(path, previous_state,
+                                                                                    previous_assets)
+    # The earlier tree is ours, so it can be updated right away.
+    apply_scanned_stats(stat_updates)
+
+    subdirs = {}
+    subdir_states = {}
+    for item in subdir_paths:
+        rel_path = item.relative_to(path)
+        previous_subdir, previous_subdir_state = previous_subdir_info(previous, previous_state, rel_path)
+
+        # Recursively load the subdirectories.
+        new_subdir = _recursive_load_asset_dir(item, previous_subdir, previous_subdir_state)
+        subdir_states[rel_path.name] = new_subdir.scan_state()
+
+        # Only actually record the directory, if the directory tree contains any assets.
+        if len(new_subdir.assets()) > 0 or len(new_subdir.subdirs()) > 0:
+            subdirs[rel_path] = new_subdir
+
+    return build_asset_dir(path, subdirs, assets, state, subdir_states, previous if unchanged else None)
+
+
+class PreviousScan:
+    """
+    A copy of the `AssetDir` tree of an earlier scan, to compare a new scan with.
+    Taken on the thread that owns the tree, so other threads can read it while the tree itself keeps changing.
+    The `AssetDir`s and `Asset`s are not copied, other threads must leave them alone.
+    """
+    __slots__ = ["asset_dir", "assets", "subdirs"]
+
+    def __init__(self, asset_dir: AssetDir):
+        self.asset_dir = asset_dir
+        # Uuid -> Asset dictionary of the assets directly in the directory.
+        self.assets = dict(asset_dir.assets())
+        # Relative path -> `PreviousScan` of the subdirectories that contain assets.
+        self.subdirs = {rel_path: PreviousScan(subdir) for rel_path, subdir in asset_dir.subdirs().items()}
+
+
+def previous_subdir_info(previous, previous_state, rel_path: pathlib.Path):
+    """
+    :param previous: The `PreviousScan` of the directory, or `None`.
+    :return: The `PreviousScan` and `DirScanState` a subdirectory had in an earlier scan. `None` for either if
+             unknown.
+    """
+    previous_subdir = None
+    if previous is not None:
+        previous_subdir = previous.subdirs.get(rel_path)
+
+    previous_subdir_state = None
+    if previous_state is not None:
+        previous_subdir_state = previous_state.subdir_states.get(rel_path.name)
+
+    return previous_subdir, previous_subdir_state
+
+
+def build_asset_dir(path, subdirs: dict, assets: dict, state, subdir_states: dict, unchanged_previous=None,
+                    adopt=True):
+    """
+    Puts together the `AssetDir` of a directory whose subdirectories are all loaded.
+    :param unchanged_previous: The `PreviousScan` from an earlier scan, if the directory itself did not change.
+                               Its `AssetDir` is returned as-is when all of its subdirectories are also unchanged.
+    :param adopt: False to leave taking over the subdirectories and assets to the thread that owns the earlier
+                  scan, see `AssetDir.adopt`.
+    """
+    if unchanged_previous is not None and unchanged_previous.subdirs.keys() == subdirs.keys():
+        reusable = True
+        for rel_path, subdir in subdirs.items():
+            if unchanged_previous.subdirs[rel_path].asset_dir is not subdir:
+                reusable = False
+                break
+
+        if reusable:
+            return unchanged_previous.asset_dir
+
+    state.subdir_states = subdir_states
+    return AssetDir(path, subdirs, assets, scan_state=state, adopt=adopt)
+
+
+class DirScanState:
+    """
+    What a directory looked like on disk when it was scanned.
+    Used to skip directories that did not change when scanning them again.
+    """
+    __slots__ = ["dir_mtime", "dir_inode", "config_mtime", "subdir_states"]
+
+    def __init__(self, dir_mtime, dir_inode, config_mtime, subdir_states=None):
+        """
+        :param dir_mtime: Modification time of the directory in nanoseconds.
+                          Changes when entries are added, removed or renamed.
+        :param dir_inode: Inode of the directory, in case it is replaced by another one.
+        :param config_mtime: Modification time of the config file in nanoseconds. `None` if there is none.
+        :param subdir_states: Directory name -> `DirScanState` of all subdirectories,
+                              including the ones without assets.
+        """
+        self.dir_mtime = dir_mtime
+        self.dir_inode = dir_inode
+        self.config_mtime = config_mtime
+        if subdir_states is None:
+            subdir_states = {}
+        self.subdir_states = subdir_states
+
+    def same_contents(self, other) -> bool:
+        """
+        :return: True if the directory and its config file did not change between the two states.
+                 Does not look at the subdirectories.
+        """
+        return other is not None and \
+            self.dir_mtime == other.dir_mtime and \
+            self.dir_inode == other.dir_inode and \
+            self.config_mtime == other.config_mtime
+
+    def copy(self):
+        """
+        :return: A copy of this state, and of the states of all the subdirectories.
+        """
+        return DirScanState(self.dir_mtime, self.dir_inode, self.config_mtime,
+                            {name: state.copy() for name, state in self.subdir_states.items()})
+
+
+def read_dir_scan_state(absolute_dir: str) -> DirScanState:
+    dir_stat = os.stat(absolute_dir)
+    try:
+        config_mtime = os.stat(os.path.join(absolute_dir, CONFIG_FILE_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        config_mtime = None
+
+    return DirScanState(dir_stat.st_mtime_ns, dir_stat.st_ino, config_mtime)
+
+
+def load_asset_dir_contents(path, previous_state: DirScanState = None, previous_assets: dict = None,
+                            statistics: ScanStatistics = None):
+    """
+    Loads the assets that are directly inside the given directory, without descending into the subdirectories.
+    When a config file exists, it will attempt to load that first, and then scan the directory for any new
+    assets.
+    Assets whose file is gone are dropped. A file that was renamed within the directory keeps its uuid and tags,
+    as long as the earlier scan saw it under its old name.
+    :param previous_state: The `DirScanState` from an earlier scan of this directory, if any.
+    :param previous_assets: uuid -> Asset dictionary from an earlier scan of this directory, if any.
+                            These assets are kept, so that any changes that were not yet saved are not lost.
+                            They are not changed, they can still be in use on another thread.
+    :param statistics: `ScanStatistics` to add the counts of this directory to.
+    :return: A tuple of the uuid -> Asset dictionary, a list of the paths of all the subdirectories,
+             the new `DirScanState` (without subdirectory states), whether the directory was unchanged since
+             the previous scan, and the new stats of the kept assets for `apply_scanned_stats`.
+             When it was unchanged, the list of subdirectories comes from the previous scan and the directory
+             is not read.
     """
 
     _path = pathlib.Path(path)
+    # Only resolve the absolute path once, instead of for every entry.
+    absolute_dir = str(_path.absolute())
+
+    if statistics is None:
+        # Nobody is interested in the counts, but it keeps the code below simple.
+        statistics = ScanStatistics()
+
+    start_time = time.perf_counter()
+    state = read_dir_scan_state(absolute_dir)
+
+    if previous_assets is None:
+        previous_assets = {}
+
+    if state.same_contents(previous_state):
+        # Nothing was added, removed, or renamed, and nobody changed the config file.
+        subdir_paths = [_path.joinpath(name) for name in previous_state.subdir_states.keys()]
+        statistics.add(directories_unchanged=1, assets_found=len(previous_assets),
+                       read_seconds=time.perf_counter() - start_time)
+        return dict(previous_assets), subdir_paths, state, True, []
+
+    previous_by_name = {asset.name(): asset for asset in previous_assets.values()}
+
+    # Time spent on the config file is counted by `_load_config_assets`.
+    config_start_time = time.perf_counter()
+
+    if previous_state is not None and state.config_mtime == previous_state.config_mtime:
+        # The config file did not change, so the assets we already have are at least as new.
+        assets = dict(previous_assets)
+        asset_names = set(previous_by_name.keys())
+    else:
+        assets, asset_names = _load_config_assets(absolute_dir, statistics)
+
+        # Keep assets with changes that have not been saved yet.
+        for asset_uuid, asset in list(assets.items()):
+            previous_asset = previous_by_name.get(asset.name())
+            if previous_asset is not None and previous_asset.is_dirty():
+                del assets[asset_uuid]
+                assets[previous_asset.uuid()] = previous_asset
+
+    subdir_paths = []
+    files_seen = 0
+    # Asset files that are not yet in `assets`. File name -> inode.
+    new_files = {}
+    # Known assets that are still there. File name -> inode.
+    found_files = {}
+    listing_start_time = time.perf_counter()
+    # `os.scandir` gets the entry types along with the names in a single listing of the directory,
+    # so we don't need to stat every file. That matters a lot on network drives.
+    with os.scandir(absolute_dir) as entries:
+        for entry in entries:
+            files_seen += 1
+            if entry.is_dir():
+                subdir_paths.append(_path.joinpath(entry.name))
+            # Check the name first, `is_file()` can still cost a stat on file systems that don't report entry types.
+            elif Asset.has_asset_extension(entry.name) and entry.is_file():
+                # Do we already know of this asset?
+                if entry.name in asset_names:
+                    found_files[entry.name] = entry.inode()
+                else:
+                    new_files[entry.name] = entry.inode()
+
+    # Assets that were in the config file, or in the earlier scan, but whose file is no longer there.
+    # Keyed on inode, to recognize files that were renamed.
+    missing_by_inode = {}
+    for asset_uuid, asset in list(assets.items()):
+        if asset.name() not in found_files:
+            del assets[asset_uuid]
+            if asset.inode() is not None:
+                missing_by_inode[asset.inode()] = asset
+
+    for name, inode in new_files.items():
+        previous_asset = previous_by_name.get(name)
+        if previous_asset is not None:
+            # Seen in an earlier scan, but not yet saved to the config file.
+            assets[previous_asset.uuid()] = previous_asset
+            found_files[name] = inode
+            continue
 
+        renamed_asset = missing_by_inode.get(inode)
+        if renamed_asset is not None and _modified_since_scan(os.path.join(absolute_dir, name), previous_state):
+            # A new file that happens to reuse the inode of a removed one.
+            renamed_asset = None
+        if renamed_asset is not None:
+            del missing_by_inode[inode]
+            # Same file under a new name, so it keeps its uuid and tags.
+            new_asset = renamed_asset.moved_to(os.path.join(absolute_dir, name))
+        else:
+            # Found a new asset in this directory, that was not in the config file.
+            new_asset = Asset(os.path.join(absolute_dir, name))
+            new_asset.set_inode(inode)
+        assets[new_asset.uuid()] = new_asset
+
+    # The kept assets of the earlier scan can still be in use on another thread. Their new inodes and headers are
+    # handed back instead. List of (Asset, inode, packed `PngHeader`) tuples.
+    stat_updates = []
+    for asset_uuid, asset in assets.items():
+        inode = found_files.get(asset.name(), asset.inode())
+        packed_header = asset.packed_png_header()
+        if packed_header is None:
+            previous_asset = previous_by_name.get(asset.name())
+            if (previous_asset is not None and previous_asset.png_header_known()
+                    and previous_asset.inode() == inode):
+                # Reloaded from the config file, the file itself was not replaced.
+                packed_header = previous_asset.packed_png_header()
+            else:
+                # Only the first bytes, the image is not decoded.
+                packed_header = pack_png_header(read_png_header(os.path.join(absolute_dir, asset.name())))
+
+        if previous_assets.get(asset_uuid) is not asset:
+            asset.set_inode(inode)
+            asset.set_packed_png_header(packed_header)
+        elif inode != asset.inode() or packed_header != asset.packed_png_header():
+            stat_updates.append((asset, inode, packed_header))
+
+    end_time = time.perf_counter()
+    statistics.add(directories_read=1, files_seen=files_seen, assets_found=len(assets),
+                   read_seconds=(end_time - listing_start_time) + (config_start_time - start_time))
+    return assets, subdir_paths, state, False, stat_updates
+
+
+def apply_scanned_stats(stat_updates: list):
+    """
+    Gives the assets of an earlier scan the inodes and image headers that a new scan found.
+    Call on the thread that owns the assets.
+    :param stat_updates: As returned by `load_asset_dir_contents`.
+    """
+    for asset, inode, packed_header in stat_updates:
+        asset.set_inode(inode)
+        asset.set_packed_png_header(packed_header)
+
+
+def _modified_since_scan(file_path: str, previous_state: DirScanState) -> bool:
+    """
+    Renaming a file does not change its modification time, so a renamed file was last modified before the earlier
+    scan of its directory.
+    :return: True if the file was written to after the earlier scan, or if that can not be told.
+    """
+    if previous_state is None or previous_state.dir_mtime is None:
+        return True
+    try:
+        return os.stat(file_path).st_mtime_ns > previous_state.dir_mtime
+    except OSError:
+        return True
+
+
+def _load_config_assets(absolute_dir: str, statistics: ScanStatistics):
+    """
+    Loads the assets listed in the config file of a directory.
+    :return: A tuple of the uuid -> Asset dictionary, and a set of the file names of those assets.
+    """
     assets = {}
-    # Keep track of which asset paths we already know of.
-    asset_paths = []
+    # Keep track of the file names of the assets we already know of.
+    asset_names = set()
+    start_time = time.perf_counter()
+    # Reading is done when parsing starts.
+    parse_start_time = None
     try:
-        with open(_path.joinpath(CONFIG_FILE_NAME), 'r') as f:
-            config = json.load(f)
+        with open(os.path.join(absolute_dir, CONFIG_FILE_NAME), 'rb') as f:
+            # Read the file in one go, so the time spent waiting on the disk and the time spent parsing can be told
+            # apart. As bytes, so they can be counted. `json` decodes them.
+            contents = f.read()
+            parse_start_time = time.perf_counter()
+            statistics.add(config_files_parsed=1, bytes_read=len(contents),
+                           read_seconds=parse_start_time - start_time)
+
+            config = json.loads(contents)
 
             if config[CFG_VERSION] != CONFIG_VERSION:
                 # TODO: what to do if the config version does not match.
@@ -43,30 +375,25 @@ def recursive_load_asset_dir(path) -> AssetDir:
             # Load all the assets from the file.
             for asset_path, asset_dict in assets_dict.items():
                 # First, check if the asset path only consists of a file name.
-                if str(pathlib.Path(asset_path).parent) != ".":
+                asset_parent, asset_name = os.path.split(asset_path)
+                if asset_parent not in ("", "."):
                     # The asset is not immediately in this directory.
                     # Ignore it, it will be listed in it's containing directory's config file.
                     logging.debug(
                         "Asset in config is not in this directory. Ignoring it. (\"{}\" is not in \"{}\").".format(
                             asset_path,
-                            _path))
+                            absolute_dir))
                     continue
 
-                absolute_path = _path.joinpath(asset_path).absolute()
-
                 asset_uuid = uuid.UUID(asset_dict[CFG_ASSET_UUID])
-                # Add tags if there are any.
-                tags = set()
-                if CFG_ASSET_TAGS in asset_dict:
-                    for tag in asset_dict[CFG_ASSET_TAGS]:
-                        # Tags are always lowercase.
-                        tags.add(tag.lower())
+                # Add tags if there are any. The vocabulary makes sure they are lowercase.
+                tags = asset_dict.get(CFG_ASSET_TAGS)
 
-                new_asset = Asset(absolute_path, asset_uuid=asset_uuid, tags=tags)
+                new_asset = Asset(os.path.join(absolute_dir, asset_name), asset_uuid=asset_uuid, tags=tags)
 
                 assets[asset_uuid] = new_asset
 
-                asset_paths.append(absolute_path)
+                asset_names.add(asset_name)
     except IOError:
         # TODO: what if we can't access the file, but we know it's there?
         #   The file not existing is not an error. Because then it is a new directory.
@@ -76,66 +403,274 @@ def recursive_load_asset_dir(path) -> AssetDir:
         #       Or something else went wrong?
         pass
 
-    subdirs = {}
-    for item in _path.iterdir():
-
-        if item.is_dir():
-            # Recursively load the subdirectories.
-            new_subdir = recursive_load_asset_dir(item)
-
-            # Only actually record the directory, if the directory tree contains any assets.
-            if len(new_subdir.assets()) > 0 or len(new_subdir.subdirs()) > 0:
-                rel_path = item.relative_to(_path)
-                subdirs[rel_path] = new_subdir
-        elif Asset.is_asset(item):
-            # Do we already know of this asset?
-            absolute_path = item.absolute()
-            if absolute_path not in asset_paths:
-                # Found a new asset in this directory, that was not in the config file.
-                new_asset = Asset(absolute_path)
-                assets[new_asset.uuid()] = new_asset
-
-    # TODO: What do we do with assets that were in the save file, but now are not?
+    if parse_start_time is not None:
+        statistics.add(parse_seconds=time.perf_counter() - parse_start_time)
+    else:
+        # Includes failing to open a file that isn't there.
+        statistics.add(read_seconds=time.perf_counter() - start_time)
 
-    return AssetDir(path, subdirs, assets)
+    return assets, asset_names
 
 
 def recursive_save_asset_dir(asset_dir: AssetDir):
     """
     Recursively saves the json file for the given AssetDir, and all subdirectories.
-    Only actually updates a directory's file if any of the assets was marked as dirty.
+    Only actually updates a directory's file if the directory, or any of its assets, was marked as dirty.
     Only creates json files in directories with assets.
-    :return:
+    Walks the whole tree, and writes on the calling thread. Use a `DirtyAssetDirs` to only visit the directories
+    that changed, and the `AsyncSaver` to write them on another thread.
+    :return: List of the `AssetDir`s that were saved.
     """
+    saved = find_dirty_asset_dirs(asset_dir)
+    for dirty_dir in saved:
+        save_asset_dir(dirty_dir)
+    return saved
 
-    # Are any assets dirty? Then we save this directory.
-    save = False
-    for asset in asset_dir.assets().values():
-        if asset.is_dirty():
-            save = True
-            break
-
-    if save:
-        assets_dict = {}
-        for asset in asset_dir.assets().values():
-            asset_dict = {
-                CFG_ASSET_UUID: str(asset.uuid()),
-            }
-
-            # Save tags if there are any.
-            if len(asset.tags()) > 0:
-                asset_dict[CFG_ASSET_TAGS] = list(asset.tags())
-
-            assets_dict[str(asset.relative_path(asset_dir.absolute_path()))] = asset_dict
-
-        config_dict = {
-            CFG_VERSION: CONFIG_VERSION,
-            CFG_ASSETS: assets_dict,
+
+def find_dirty_asset_dirs(asset_dir: AssetDir):
+    """
+    :return: List of the directories in the tree that are marked as dirty, or have dirty assets.
+    """
+    dirty_dirs = []
+    nodes = [asset_dir]
+    while nodes:
+        node = nodes.pop()
+        # Are any assets dirty? Then we save this directory.
+        if node.is_dirty() or any(asset.is_dirty() for asset in node.assets().values()):
+            dirty_dirs.append(node)
+        # Always check the subdirectories.
+        nodes.extend(node.subdirs().values())
+    return dirty_dirs
+
+
+def save_asset_dir(asset_dir: AssetDir):
+    """
+    Saves the json file of a single directory on the calling thread, and marks the directory and its assets as
+    saved. Does not look at the subdirectories.
+    """
+    snapshot = snapshot_asset_dir(asset_dir)
+    new_state = write_dir_snapshot(snapshot)
+    # Only once the file is written. If writing fails, the changes are still there for the next attempt.
+    asset_dir.was_saved()
+    apply_saved_state(asset_dir, snapshot, new_state)
+
+
+class DirSnapshot:
+    """
+    A copy of what is saved for a single directory.
+    Taken on the GUI thread, so it can be written on another thread while the directory keeps changing.
+    """
+    __slots__ = ["asset_dir", "path", "root", "assets", "dir_mtime", "dir_inode", "config_mtime", "subdir_names",
+                 "write_config", "file_stats"]
+
+    def __init__(self, asset_dir, path: str, root: str, assets: tuple, state: DirScanState, write_config: bool):
+        # The `AssetDir` the snapshot was taken of. Only to be touched on the GUI thread. `None` for directories
+        # without assets.
+        self.asset_dir = asset_dir
+        self.path = path
+        self.root = root
+        # Tuple of (file name, uuid string, sorted tuple of tags, inode, packed `PngHeader`) of every asset.
+        self.assets = assets
+        # The `DirScanState` when the snapshot was taken. Without a scan state, these are all `None`.
+        self.dir_mtime = state.dir_mtime if state is not None else None
+        self.dir_inode = state.dir_inode if state is not None else None
+        self.config_mtime = state.config_mtime if state is not None else None
+        self.subdir_names = tuple(state.subdir_states.keys()) if state is not None else ()
+        # False when only the catalog needs to know about this directory, and its config file is already up to date.
+        self.write_config = write_config
+        # Uuid string -> (file size, modification time) of the assets, filled in when the snapshot is written to the
+        # catalog.
+        self.file_stats = None
+
+
+def snapshot_asset_dir(asset_dir: AssetDir, write_config=True) -> DirSnapshot:
+    assets = tuple((asset.name(), str(asset.uuid()), tuple(sorted(asset.tags())), asset.inode(),
+                    asset.packed_png_header())
+                   for asset in asset_dir.assets().values())
+    return DirSnapshot(asset_dir, str(asset_dir.absolute_path()), str(asset_dir.root().absolute_path()), assets,
+                       asset_dir.scan_state(), write_config)
+
+
+def write_dir_snapshot(snapshot: DirSnapshot) -> DirScanState:
+    """
+    Writes the config file of a directory snapshot. Safe to call from any thread.
+    :return: The `DirScanState` of the directory after writing, without subdirectory states.
+             The modification time of the directory is the one from the snapshot, if something else changed the
+             directory since the snapshot's scan.
+    """
+    assets_dict = {}
+    for name, asset_uuid, tags, _, _ in snapshot.assets:
+        asset_dict = {
+            CFG_ASSET_UUID: asset_uuid,
         }
 
-        with open(asset_dir.absolute_path().joinpath(CONFIG_FILE_NAME), 'w') as f:
-            json.dump(config_dict, f)
+        # Save tags if there are any.
+        if len(tags) > 0:
+            asset_dict[CFG_ASSET_TAGS] = list(tags)
+
+        assets_dict[name] = asset_dict
+
+    config_dict = {
+        CFG_VERSION: CONFIG_VERSION,
+        CFG_ASSETS: assets_dict,
+    }
+
+    dir_mtime_before = os.stat(snapshot.path).st_mtime_ns
+    write_text_atomically(os.path.join(snapshot.path, CONFIG_FILE_NAME), json.dumps(config_dict))
+
+    new_state = read_dir_scan_state(snapshot.path)
+    if dir_mtime_before != snapshot.dir_mtime:
+        # Replacing the config file changes the directory's modification time. Only take on the new time if
+        # nothing else changed the directory, otherwise the next scan would not read it again.
+        new_state.dir_mtime = snapshot.dir_mtime
+    return new_state
+
+
+def apply_saved_state(asset_dir: AssetDir, snapshot: DirSnapshot, new_state: DirScanState):
+    """
+    Updates the `DirScanState` of a directory after its snapshot was written.
+    Our own save is not a change on disk, the next scan does not need to read the directory again.
+    """
+    state = asset_dir.scan_state()
+    if state is None:
+        return
+
+    state.config_mtime = new_state.config_mtime
+    if state.dir_mtime == snapshot.dir_mtime:
+        # Unless the directory was updated in the meantime.
+        state.dir_mtime = new_state.dir_mtime
+
+
+def apply_measured_stats(asset_dir: AssetDir, snapshot: DirSnapshot):
+    """
+    Gives the assets the file sizes and modification times that were measured while writing their snapshot.
+    """
+    if snapshot.file_stats is None:
+        return
+    for asset in asset_dir.assets().values():
+        size, mtime = snapshot.file_stats.get(str(asset.uuid()), (None, None))
+        if size is not None:
+            asset.set_size(size)
+            asset.set_modified_time(mtime)
+
+
+def journal_path(root_path) -> pathlib.Path:
+    return pathlib.Path(root_path).joinpath(JOURNAL_FILE_NAME)
+
+
+def journal_entries(asset_dir: AssetDir, root_path) -> list:
+    """
+    :return: The journal entries for the dirty assets directly in a directory.
+    """
+    rel_dir = asset_dir.absolute_path().relative_to(root_path).as_posix()
+    return [{
+        JNL_DIR: rel_dir,
+        JNL_NAME: asset.name(),
+        JNL_UUID: str(asset.uuid()),
+        JNL_TAGS: sorted(asset.tags()),
+    } for asset in asset_dir.assets().values() if asset.is_dirty()]
+
+
+def append_to_journal(root_path, entries: list):
+    """
+    Appends entries to the journal of an asset directory. Safe to call from any thread.
+    """
+    lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+    with open(journal_path(root_path), 'a') as f:
+        f.write(lines)
+        f.flush()
+        # Once appended, a change has to survive a crash. Still a lot cheaper than rewriting the config files.
+        os.fsync(f.fileno())
+
+
+def clear_journal(root_path):
+    """
+    Empties the journal of an asset directory, after all the changes in it were written to the config files.
+    The file itself stays, removing it would change the directory, and make the next scan read it again.
+    """
+    try:
+        os.truncate(journal_path(root_path), 0)
+    except FileNotFoundError:
+        pass
+
+
+def read_journal(root_path) -> list:
+    """
+    :return: The entries in the journal of an asset directory, oldest first.
+             Lines that can not be read, like a line that was cut off by a crash, are skipped.
+    """
+    file_path = journal_path(root_path)
+    entries = []
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries.append((entry[JNL_DIR], entry[JNL_NAME], uuid.UUID(entry[JNL_UUID]), set(entry[JNL_TAGS])))
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.warning("Skipping unreadable line in journal: \"{}\". Reason: {}".format(file_path, e))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning("Could not read journal: \"{}\". Reason: {}".format(file_path, e))
+    return entries
+
+
+def replay_journal(root_dir: AssetDir, entries: list = None) -> int:
+    """
+    Applies the journal of an asset directory on top of what was loaded from the config files.
+    The assets and directories that change are marked dirty, so they get written to their config files.
+    :param entries: The entries as returned by `read_journal`, if they were already read. Read when not given.
+    :return: The number of assets that changed.
+    """
+    if entries is None:
+        entries = read_journal(root_dir.absolute_path())
+    if len(entries) == 0:
+        return 0
+
+    # Only the newest entry of every asset matters.
+    newest = {}
+    for rel_dir, name, asset_uuid, tags in entries:
+        newest.pop((rel_dir, name), None)
+        newest[(rel_dir, name)] = (asset_uuid, tags)
+
+    changed = 0
+    for (rel_dir, name), (asset_uuid, tags) in newest.items():
+        asset_dir = _find_subdir(root_dir, pathlib.PurePosixPath(rel_dir))
+        if asset_dir is None:
+            continue
+
+        asset = asset_dir.assets().get(asset_uuid)
+        if asset is None:
+            # The config file did not know the asset yet, so the scan gave it a new uuid.
+            asset = next((asset for asset in asset_dir.assets().values() if asset.name() == name), None)
+            if asset is None:
+                # The file is gone.
+                continue
+
+            # It is the same file, so everything that is known about the file carries over.
+            replacement = Asset(asset.absolute_path(), asset_uuid=asset_uuid, tags=tags)
+            replacement.set_inode(asset.inode())
+            replacement.set_size(asset.size())
+            replacement.set_modified_time(asset.modified_time())
+            replacement.set_packed_png_header(asset.packed_png_header())
+            replacement.mark_dirty()
+            asset_dir.remove_assets([asset.uuid()])
+            asset_dir.add_assets({asset_uuid: replacement})
+            changed += 1
+        elif asset.tags() != tags:
+            asset.set_tags(tags)
+            changed += 1
+
+    logging.info("Replayed {} journal entries of \"{}\", {} assets changed.".format(
+        len(entries), root_dir.absolute_path(), changed))
+    return changed
+
 
-    # Always check the subdirectories.
-    for subdir in asset_dir.subdirs().values():
-        recursive_save_asset_dir(subdir)
+def _find_subdir(root_dir: AssetDir, rel_path: pathlib.PurePosixPath):
+    asset_dir = root_dir
+    for part in rel_path.parts:
+        asset_dir = asset_dir.subdirs().get(pathlib.Path(part))
+        if asset_dir is None:
+            return None
+    return asset_dir
@@ -0,0 +1,96 @@
+import array
+import bisect
+import itertools
+
+# Between the names in the joined text. File names can't contain it.
+_SEPARATOR = "\0"
+# Below this number of names, the index is not built again for stale names.
+MIN_REBUILD_SIZE = 10000
+
+
+class NameIndex:
+    """
+    The file names of the assets, to find the ones that contain a piece of text without looking at every name in
+    Python.
+
+    The lowercase names are joined into large strings, that `str.find` searches at C speed. Next to each string are
+    the ids of its names, and where each name starts. New names go into a new string, which is merged with the ones
+    before it once they are about the same size. So there are only a few strings, and each name is only copied a few
+    times.
+
+    Names are never taken out of the strings, that would mean copying them. Instead, their ids are remembered as
+    stale, see `forget`.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        # Number of names in all the chunks.
+        self._size = 0
+        # The ids whose name was removed, or changed. Found ids in here have to be checked against the actual names.
+        self._stale_ids = set()
+
+    def add(self, ids_and_names):
+        """
+        :param ids_and_names: Iterable of (id, file name).
+        """
+        ids_and_names = list(ids_and_names)
+        if len(ids_and_names) == 0:
+            return
+        self._chunks.append(_Chunk(array.array("I", (name_id for name_id, _ in ids_and_names)),
+                                   [name.lower() for _, name in ids_and_names]))
+        self._size += len(ids_and_names)
+
+        chunks = self._chunks
+        while len(chunks) >= 2 and len(chunks[-2].ids) <= 2 * len(chunks[-1].ids):
+            last = chunks.pop()
+            chunks[-1] = chunks[-1].merged(last)
+
+    def forget(self, name_ids) -> bool:
+        """
+        Marks the names of ids as stale, after they were removed or changed.
+        :return: True when most of the index is stale, and it should be built again.
+        """
+        self._stale_ids.update(name_ids)
+        return self._size > MIN_REBUILD_SIZE and len(self._stale_ids) * 2 > self._size
+
+    def stale_ids(self) -> set:
+        """
+        :return: The ids that `find` might give for names they no longer have.
+        """
+        return self._stale_ids
+
+    def find(self, text: str) -> list:
+        """
+        :param text: Lowercase text.
+        :return: The ids of the names that contain the text, or did when they were added. An id can be in there more
+                 than once.
+        """
+        found = []
+        for chunk in self._chunks:
+            chunk.find(text, found)
+        return found
+
+
+class _Chunk:
+    __slots__ = ["ids", "starts", "text"]
+
+    def __init__(self, ids: array.array, names: list):
+        self.ids = ids
+        self.text = _SEPARATOR.join(names)
+        # Where each name starts in the text.
+        self.starts = array.array("Q", itertools.accumulate(itertools.chain((0,), names[:-1]),
+                                                            lambda start, name: start + len(name) + 1))
+
+    def merged(self, other):
+        return _Chunk(self.ids + other.ids, self.text.split(_SEPARATOR) + other.text.split(_SEPARATOR))
+
+    def find(self, text: str, found: list):
+        starts = self.starts
+        position = self.text.find(text)
+        while position != -1:
+            index = bisect.bisect_right(starts, position) - 1
+            found.append(self.ids[index])
+            if index + 1 == len(starts):
+                break
+            # Once per name is enough.
+            position = self.text.find(text, starts[index + 1])
@@ -0,0 +1,397 @@
+import collections
+import logging
+import pathlib
+import threading
+from concurrent import futures
+
+from data import AssetDir
+from data.load_scan_save import DirScanState, PreviousScan, apply_scanned_stats, build_asset_dir, \
+    load_asset_dir_contents, previous_subdir_info, read_journal, replay_journal
+from data.scan_statistics import ScanStatistics, count_directories
+
+
+class ScanCancelledError(Exception):
+    """
+    The result of a `ScanJob` that was cancelled before it finished.
+    """
+    pass
+
+
+class ScanJob:
+    """
+    A single root directory that is being scanned by the `ParallelScanner`.
+    """
+
+    def __init__(self, root, previous: AssetDir = None, on_partial_result=None, expected_directories=None):
+        """
+        :param previous: The `AssetDir` from an earlier scan of the same root.
+                         Directories that did not change since then are not read again.
+                         The tree can stay in use on the thread that submits the job, see `result`.
+        :param on_partial_result: Called without arguments from the worker threads when a new partial result is
+                                  available.
+        :param expected_directories: How many directories this scan is expected to visit, for estimating the
+                                     remaining time. Taken from `previous` when not given.
+        """
+        self._root = pathlib.Path(root)
+
+        # Resolves to the `AssetDir` of the root once the whole tree is scanned.
+        self._future = futures.Future()
+        self._future.set_running_or_notify_cancel()
+
+        # Directories of this job that are waiting for a worker.
+        # The workers get copies of the earlier tree, the tree itself can keep changing while they compare.
+        previous_scan = PreviousScan(previous) if previous is not None else None
+        previous_state = previous.scan_state() if previous is not None else None
+        if previous_state is not None:
+            previous_state = previous_state.copy()
+        self._pending = collections.deque([_PendingDir(None, self._root, previous_scan, previous_state)])
+        # New directories that hold assets or subdirectories of the earlier tree. They take those over in `result`.
+        self._unadopted = []
+        # New inodes and image headers of assets of the earlier tree, see `apply_scanned_stats`.
+        self._stat_updates = []
+        # The entries in the journal of the root, read once the tree is built. Replayed in `result`.
+        self._journal_entries = []
+        # Whether `result` was called.
+        self._result_taken = False
+
+        if expected_directories is None and previous_state is not None:
+            expected_directories = count_directories(previous_state)
+        self._statistics = ScanStatistics(expected_directories)
+
+        # Whether a worker has picked up any directory of this job yet.
+        self._started = False
+        # Jobs with a higher priority are worked on first. Equal priorities go in the order they were submitted.
+        self._priority = 0
+
+        # (directory path, uuid -> Asset dictionary) of every directory that was read since the last time the
+        # partial results were taken. Only kept for first scans, a rescan already has the earlier tree to show.
+        self._keep_partial_results = previous is None
+        self._partial_results = []
+        self._partial_results_lock = threading.Lock()
+        self._on_partial_result = on_partial_result
+
+    def root(self) -> pathlib.Path:
+        return self._root
+
+    def future(self) -> futures.Future:
+        """
+        :return: Future that resolves to the `AssetDir` of the root directory.
+                 After a scan with a `previous` tree, the result is only complete once taken with `result`.
+        """
+        return self._future
+
+    def result(self, timeout=None) -> AssetDir:
+        """
+        Waits for the scan to finish, and completes the new tree. Call on the thread that submitted the job.
+        The directories that reuse assets or subdirectories from the `previous` tree only take them over here, so
+        that tree stays the same while it is being compared, and while it is still shown.
+        The reused assets get the inodes and image headers the workers found here, and the journal of the root is
+        replayed here, as both change assets that may still be shown.
+        :param timeout: Seconds to wait, `None` to wait for as long as it takes.
+        :return: The `AssetDir` of the root directory.
+        """
+        asset_dir = self._future.result(timeout)
+        if self._result_taken:
+            return asset_dir
+        self._result_taken = True
+
+        # Both change assets that may still be in the tree that is shown. Before the reused assets move over to the
+        # new tree, so that the indexes of the shown tree see the changes.
+        apply_scanned_stats(self._stat_updates)
+        self._stat_updates = []
+        # The tag changes that did not make it into the config files yet.
+        replay_journal(asset_dir, self._journal_entries)
+        self._journal_entries = []
+        for unadopted_dir in self._unadopted:
+            unadopted_dir.adopt()
+        self._unadopted = []
+        return asset_dir
+
+    def started(self) -> bool:
+        return self._started
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def priority(self) -> int:
+        return self._priority
+
+    def statistics(self) -> ScanStatistics:
+        """
+        :return: The live counters of this scan.
+        """
+        return self._statistics
+
+    def take_partial_results(self):
+        """
+        Takes the assets of the directories that were read since the last call.
+        Allows showing the contents of a large directory tree before all of it is scanned.
+        :return: List of (directory path, uuid -> Asset dictionary) tuples.
+                 Only directories that directly contain assets are listed.
+        """
+        with self._partial_results_lock:
+            results = self._partial_results
+            self._partial_results = []
+        return results
+
+    def _add_partial_result(self, path: pathlib.Path, assets: dict):
+        if not self._keep_partial_results or len(assets) == 0:
+            return
+
+        with self._partial_results_lock:
+            # Copy, the scan still owns the original dictionary.
+            self._partial_results.append((path, dict(assets)))
+
+        if self._on_partial_result is not None:
+            self._on_partial_result()
+
+
+class _PendingDir:
+    """
+    A directory that is either waiting to be read, or waiting for its subdirectories to be finished.
+    """
+    __slots__ = ["parent", "path", "previous", "previous_state", "assets", "state", "unchanged", "subdir_paths",
+                 "subdirs", "subdir_states", "remaining"]
+
+    def __init__(self, parent, path: pathlib.Path, previous, previous_state):
+        self.parent = parent
+        self.path = path
+        # `PreviousScan` and `DirScanState` from an earlier scan, if any.
+        self.previous = previous
+        self.previous_state = previous_state
+        self.assets = {}
+        self.state = None
+        # Whether the directory did not change since the earlier scan.
+        self.unchanged = False
+        # All subdirectory paths, in the order the file system listed them.
+        self.subdir_paths = []
+        # Finished subdirectories that contain assets. Path -> AssetDir.
+        self.subdirs = {}
+        # Directory name -> `DirScanState` of all finished subdirectories.
+        self.subdir_states = {}
+        # Number of subdirectories that are not yet finished.
+        self.remaining = 0
+
+
+class ParallelScanner:
+    """
+    Scans asset directory trees with a pool of worker threads.
+
+    Every directory is a separate unit of work, so the subdirectories of a single root are spread over all the
+    workers. Workers take their work from the highest priority root that still has unread directories, and only
+    move on to the next root when there is nothing left to pick up. That way no worker sits idle while another root
+    still has directories waiting. Roots with the same priority are scanned in the order they were submitted.
+    Once all the subdirectories of a directory are done, the `AssetDir` tree is put back together bottom-up.
+    """
+
+    def __init__(self, max_workers: int):
+        # Jobs in the order they were submitted.
+        self._jobs = []
+        self._condition = threading.Condition()
+        self._shutdown = False
+
+        self._workers = []
+        for i in range(max(max_workers, 1)):
+            # Daemon threads, so that closing the program does not wait for a large scan to finish.
+            worker = threading.Thread(target=self._work, name="asset_scanner_{}".format(i), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, root, previous: AssetDir = None, on_partial_result=None, expected_directories=None) -> ScanJob:
+        """
+        Queues a root directory to be scanned.
+        :param previous: The `AssetDir` from an earlier scan of the same root, to only read what changed.
+        :param on_partial_result: Called from the worker threads whenever a new partial result is available.
+        :param expected_directories: How many directories the scan is expected to visit.
+        :return: The `ScanJob` tracking the scan.
+        """
+        job = ScanJob(root, previous, on_partial_result, expected_directories)
+        with self._condition:
+            self._jobs.append(job)
+            self._condition.notify_all()
+        return job
+
+    def queued_jobs(self):
+        """
+        :return: The jobs that were not started yet, in the order they will be started.
+        """
+        with self._condition:
+            queued = [job for job in self._jobs if not job.started()]
+        # Sorting is stable, so jobs with the same priority stay in the order they were submitted.
+        queued.sort(key=lambda job: job.priority(), reverse=True)
+        return queued
+
+    def prioritize(self, job: ScanJob):
+        """
+        Moves a job in front of all other jobs.
+        Directories of other jobs that are already being read are finished first.
+        """
+        with self._condition:
+            if job not in self._jobs:
+                return
+            job._priority = max(other._priority for other in self._jobs) + 1
+
+    def cancel(self, job: ScanJob) -> bool:
+        """
+        Stops a job. Its unread directories are dropped, and any directory that is being read is thrown away once
+        the worker is done with it. The job's future gets a `ScanCancelledError`.
+        :return: False if the job was already finished.
+        """
+        return self._fail_job(job, ScanCancelledError("Scan of \"{}\" was cancelled.".format(job.root())))
+
+    def shutdown(self):
+        """
+        Stops the workers after they finish the directory they are working on.
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+
+    def _take_work(self):
+        """
+        Must be called while holding the condition lock.
+        :return: (`ScanJob`, `_PendingDir`) of the next directory to read, or `None` if there is nothing to do.
+        """
+        best_job = None
+        for job in self._jobs:
+            if job._pending and (best_job is None or job._priority > best_job._priority):
+                best_job = job
+
+        if best_job is None:
+            return None
+
+        if not best_job._started:
+            best_job._started = True
+            best_job._statistics.start()
+        # Take the most recently found directory, so subtrees are finished (and freed) as soon as possible.
+        return best_job, best_job._pending.pop()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                work = self._take_work()
+                while work is None and not self._shutdown:
+                    self._condition.wait()
+                    work = self._take_work()
+
+                if self._shutdown:
+                    return
+
+            job, node = work
+            previous_assets = node.previous.assets if node.previous is not None else None
+            try:
+                assets, subdir_paths, state, unchanged, stat_updates = load_asset_dir_contents(
+                    node.path, node.previous_state, previous_assets, job._statistics)
+            except OSError as e:
+                if node.parent is None:
+                    # Without the root there is nothing to scan.
+                    self._fail_job(job, e)
+                    continue
+
+                logging.warning("Could not scan directory: \"{}\". Reason: {}".format(node.path, e))
+                assets, subdir_paths, state, unchanged, stat_updates = {}, [], DirScanState(None, None, None), False, []
+            except Exception as e:
+                self._fail_job(job, e)
+                continue
+
+            root_dir = None
+            with self._condition:
+                if job.done():
+                    # The job was cancelled, or already failed in another worker.
+                    continue
+
+                job._add_partial_result(node.path, assets)
+                job._stat_updates.extend(stat_updates)
+
+                node.assets = assets
+                node.state = state
+                node.unchanged = unchanged
+                node.subdir_paths = subdir_paths
+                node.remaining = len(subdir_paths)
+
+                if node.remaining > 0:
+                    for subdir_path in subdir_paths:
+                        previous_subdir, previous_subdir_state = previous_subdir_info(
+                            node.previous, node.previous_state, subdir_path.relative_to(node.path))
+                        job._pending.append(_PendingDir(node, subdir_path, previous_subdir, previous_subdir_state))
+                    self._condition.notify_all()
+                else:
+                    try:
+                        root_dir = self._finish_dir(job, node)
+                    except Exception as e:
+                        # Taking the lock again is fine, it is reentrant.
+                        self._fail_job(job, e)
+                        continue
+
+            if root_dir is not None:
+                # The file is read, and the listeners of the future are called, without holding up the other workers.
+                self._finish_job(job, root_dir)
+
+    def _finish_dir(self, job: ScanJob, node: _PendingDir):
+        """
+        Builds the `AssetDir` of a directory whose subdirectories are all finished,
+        and then does the same for every parent that was only waiting on this directory.
+        Must be called while holding the condition lock.
+        :return: The `AssetDir` of the root, once the whole tree is built. `None` until then.
+        """
+        while node is not None:
+            # Keep the subdirectories in the order they were listed in, not the order they finished in.
+            subdirs = {}
+            for subdir_path in node.subdir_paths:
+                if subdir_path in node.subdirs:
+                    subdirs[subdir_path.relative_to(node.path)] = node.subdirs[subdir_path]
+
+            # Assets and directories of the earlier scan are only taken over on the thread that owns them.
+            adopt = node.previous is None
+            asset_dir = build_asset_dir(node.path, subdirs, node.assets, node.state, node.subdir_states,
+                                        node.previous if node.unchanged else None, adopt=adopt)
+            if not adopt and asset_dir is not node.previous.asset_dir:
+                job._unadopted.append(asset_dir)
+            # Drop the references to the earlier scan as soon as possible.
+            node.previous = None
+
+            parent = node.parent
+            if parent is None:
+                return asset_dir
+
+            parent.subdir_states[node.path.name] = asset_dir.scan_state()
+            # Only actually record the directory, if the directory tree contains any assets.
+            if len(asset_dir.assets()) > 0 or len(asset_dir.subdirs()) > 0:
+                parent.subdirs[node.path] = asset_dir
+
+            parent.remaining -= 1
+            if parent.remaining > 0:
+                # Other subdirectories are still being worked on.
+                return None
+            node = parent
+        return None
+
+    def _finish_job(self, job: ScanJob, root_dir: AssetDir):
+        """
+        Resolves the future of a job whose whole tree is built. Called without holding the condition lock.
+        """
+        try:
+            journal_entries = read_journal(root_dir.absolute_path())
+        except Exception as e:
+            self._fail_job(job, e)
+            return
+
+        with self._condition:
+            if job not in self._jobs:
+                # Cancelled in the meantime.
+                return
+            self._jobs.remove(job)
+            job._statistics.finish()
+            job._journal_entries = journal_entries
+        job._future.set_result(root_dir)
+
+    def _fail_job(self, job: ScanJob, exception: Exception) -> bool:
+        with self._condition:
+            # Jobs that are done, or about to be, are no longer listed.
+            if job not in self._jobs:
+                return False
+            job._pending.clear()
+            self._jobs.remove(job)
+            job._statistics.finish()
+            job._future.set_exception(exception)
+            return True
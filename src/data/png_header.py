@@ -0,0 +1,84 @@
+import collections
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# The signature, followed by the length and type of the first chunk, which must be the IHDR chunk, and its first
+# 10 bytes: width, height, bit depth and color type.
+_HEADER_FORMAT = struct.Struct(">8sI4sIIBB")
+
+# PNG color types with an alpha channel: grayscale with alpha, and RGBA.
+ALPHA_COLOR_TYPES = (4, 6)
+
+# Bits of every field in a packed header. Sizes of up to 16 million pixels, and the bit depths and color types the
+# PNG specification knows, fit in less than 60 bits, so a packed header is a small `int`.
+_SIZE_BITS = 24
+_DEPTH_BITS = 5
+_COLOR_TYPE_BITS = 3
+_MAX_SIZE = (1 << _SIZE_BITS) - 1
+
+
+class PngHeader(collections.namedtuple("PngHeader", ["width", "height", "bit_depth", "color_type"])):
+    """
+    What the IHDR chunk of a PNG file says about the image, without decoding it.
+    """
+    __slots__ = ()
+
+    def has_alpha(self) -> bool:
+        """
+        :return: True if the image has an alpha channel. Images with a transparent palette color don't count.
+        """
+        return self.color_type in ALPHA_COLOR_TYPES
+
+
+def read_png_header(path):
+    """
+    Reads the header of a PNG file. Only the first 26 bytes of the file are read.
+    :return: The `PngHeader`, or `None` if the file can't be read or is not a PNG file.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read(_HEADER_FORMAT.size)
+    except OSError:
+        return None
+    return parse_png_header(data)
+
+
+def parse_png_header(data: bytes):
+    """
+    :param data: The start of a PNG file.
+    :return: The `PngHeader`, or `None` if the data is not the start of a PNG file.
+    """
+    if len(data) < _HEADER_FORMAT.size:
+        return None
+    signature, _, chunk_type, width, height, bit_depth, color_type = _HEADER_FORMAT.unpack_from(data)
+    if signature != PNG_SIGNATURE or chunk_type != b"IHDR":
+        return None
+    return PngHeader(width, height, bit_depth, color_type)
+
+
+def pack_png_header(header) -> int:
+    """
+    Packs a header into a single `int`, to keep it with an asset.
+    :param header: A `PngHeader`, or `None` for a file without one.
+    :return: 0 for `None`, a positive number otherwise. Sizes that don't fit are capped.
+    """
+    if header is None:
+        return 0
+    return (min(header.width, _MAX_SIZE)
+            | min(header.height, _MAX_SIZE) << _SIZE_BITS
+            | (header.bit_depth & ((1 << _DEPTH_BITS) - 1)) << 2 * _SIZE_BITS
+            | (header.color_type & ((1 << _COLOR_TYPE_BITS) - 1)) << (2 * _SIZE_BITS + _DEPTH_BITS)
+            # So a header of all zeroes is still told apart from no header.
+            | 1 << (2 * _SIZE_BITS + _DEPTH_BITS + _COLOR_TYPE_BITS))
+
+
+def unpack_png_header(packed: int):
+    """
+    :return: The `PngHeader` of `pack_png_header`, or `None` for 0.
+    """
+    if packed == 0:
+        return None
+    return PngHeader(packed & _MAX_SIZE,
+                     (packed >> _SIZE_BITS) & _MAX_SIZE,
+                     (packed >> 2 * _SIZE_BITS) & ((1 << _DEPTH_BITS) - 1),
+                     (packed >> (2 * _SIZE_BITS + _DEPTH_BITS)) & ((1 << _COLOR_TYPE_BITS) - 1))
@@ -2,6 +2,9 @@ import json
 import logging
 import pathlib
 
+from data.file_utils import write_text_atomically
+from data.sort_order import SORT_KEYS
+
 CONFIG_FILE_NAME = "config.json"
 # Version number to keep track of breaking changes in config files.
 CONFIG_VERSION = 1
@@ -10,15 +13,32 @@ CONFIG_VERSION = 1
 CFG_KEY_VERSION = "version"
 CFG_KEY_ASSET_DIRS = "asset_dirs"
 CFG_KEY_LAST_DIRECTORY = "last_directory"
+CFG_KEY_SCAN_SIZES = "scan_sizes"
+CFG_KEY_USE_CATALOG = "use_catalog"
+CFG_KEY_SORT_ORDERS = "sort_orders"
 
 
 class ProgramConfig:
-    def __init__(self, asset_dirs=None, last_directory=""):
+    def __init__(self, asset_dirs=None, last_directory="", scan_sizes=None, use_catalog=True, sort_orders=None):
+        """
+        :param scan_sizes: Asset directory path -> number of directories visited the last time it was scanned.
+        :param use_catalog: Whether to keep a central catalog of all assets, so the program starts faster.
+        :param sort_orders: Asset view name -> (sort key, descending) the view shows the assets in. The sort key is
+                            one of `sort_order.SORT_KEYS`, or `None`.
+        """
         if asset_dirs is None:
             asset_dirs = []
+        if scan_sizes is None:
+            scan_sizes = {}
+        if sort_orders is None:
+            sort_orders = {}
 
         self._asset_dirs = list(asset_dirs)
         self._last_directory = pathlib.Path(last_directory)
+        self._scan_sizes = {pathlib.Path(path): size for path, size in scan_sizes.items()}
+        self._use_catalog = use_catalog
+        self._sort_orders = {view: (sort_key, bool(descending)) for view, (sort_key, descending) in sort_orders.items()
+                             if sort_key is None or sort_key in SORT_KEYS}
 
     def set_asset_dirs(self, asset_dirs):
         """
@@ -36,6 +56,22 @@ class ProgramConfig:
     def set_last_directory(self, new_dir):
         self._last_directory = pathlib.Path(new_dir)
 
+    def scan_sizes(self):
+        """
+        :return: Asset directory path -> number of directories visited the last time it was scanned.
+                 Used to estimate how long scanning will take.
+        """
+        return self._scan_sizes
+
+    def use_catalog(self):
+        return self._use_catalog
+
+    def sort_orders(self):
+        """
+        :return: Asset view name -> (sort key, descending).
+        """
+        return self._sort_orders
+
 
 def load_program_config(directory):
     """
@@ -70,7 +106,12 @@ def load_program_config(directory):
             # Load all asset directories.
             asset_dirs = config[CFG_KEY_ASSET_DIRS]
 
-            return ProgramConfig(asset_dirs, last_directory)
+            # Not there in older config files.
+            scan_sizes = config.get(CFG_KEY_SCAN_SIZES, {})
+            use_catalog = config.get(CFG_KEY_USE_CATALOG, True)
+            sort_orders = config.get(CFG_KEY_SORT_ORDERS, {})
+
+            return ProgramConfig(asset_dirs, last_directory, scan_sizes, use_catalog, sort_orders)
     except IOError as e:
         # We could not load the file.
         # todo: show an appropriate log message for the reason.
@@ -104,12 +145,15 @@ def save_program_config(config: ProgramConfig, directory):
     for asset_dir in config.asset_dirs():
         asset_dir_paths.append(str(asset_dir))
     last_dir = str(config.last_directory())
+    scan_sizes = {str(path): size for path, size in config.scan_sizes().items()}
 
     config = {
         CFG_KEY_VERSION: CONFIG_VERSION,
         CFG_KEY_ASSET_DIRS: asset_dir_paths,
-        CFG_KEY_LAST_DIRECTORY: last_dir
+        CFG_KEY_LAST_DIRECTORY: last_dir,
+        CFG_KEY_SCAN_SIZES: scan_sizes,
+        CFG_KEY_USE_CATALOG: config.use_catalog(),
+        CFG_KEY_SORT_ORDERS: {view: list(sort_order) for view, sort_order in config.sort_orders().items()},
     }
 
-    with open(file_path, 'w') as f:
-        json.dump(config, f)
+    write_text_atomically(file_path, json.dumps(config))
@@ -0,0 +1,199 @@
+import threading
+import time
+
+
+class ScanStatistics:
+    """
+    Live counters of a directory scan.
+    Updated by the scanner's worker threads, and safe to read from any thread.
+
+    The time spent reading from the file system and the time spent parsing config files are tracked separately,
+    to tell whether a slow scan is waiting on the disk, or busy parsing json.
+    """
+
+    def __init__(self, expected_directories=None):
+        """
+        :param expected_directories: How many directories the scan is expected to visit, usually from the previous
+                                     scan of the same directory. Used to estimate the remaining time.
+        """
+        self._lock = threading.Lock()
+
+        self._expected_directories = expected_directories
+
+        # Directories that were read.
+        self._directories_read = 0
+        # Directories that were not read, because they did not change since an earlier scan.
+        self._directories_unchanged = 0
+        # All entries seen in the directory listings, assets or not.
+        self._files_seen = 0
+        self._assets_found = 0
+        self._config_files_parsed = 0
+        self._bytes_read = 0
+
+        # Summed over all workers, so these can add up to more than the elapsed time.
+        self._read_seconds = 0.0
+        self._parse_seconds = 0.0
+
+        # Set when the first directory is picked up, so time spent waiting in the queue does not count.
+        self._start_time = None
+        self._end_time = None
+
+    def add(self, directories_read=0, directories_unchanged=0, files_seen=0, assets_found=0, config_files_parsed=0,
+            bytes_read=0, read_seconds=0.0, parse_seconds=0.0):
+        """
+        Adds the counts of a single directory.
+        """
+        with self._lock:
+            self._directories_read += directories_read
+            self._directories_unchanged += directories_unchanged
+            self._files_seen += files_seen
+            self._assets_found += assets_found
+            self._config_files_parsed += config_files_parsed
+            self._bytes_read += bytes_read
+            self._read_seconds += read_seconds
+            self._parse_seconds += parse_seconds
+
+    def start(self):
+        """
+        Starts the clock. Does nothing if it is already running.
+        """
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+
+    def finish(self):
+        """
+        Stops the clock.
+        """
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = time.monotonic()
+            if self._end_time is None:
+                self._end_time = time.monotonic()
+
+    def directories_visited(self):
+        """
+        :return: Number of directories that were either read, or found to be unchanged.
+        """
+        return self._directories_read + self._directories_unchanged
+
+    def directories_read(self):
+        return self._directories_read
+
+    def directories_unchanged(self):
+        return self._directories_unchanged
+
+    def files_seen(self):
+        return self._files_seen
+
+    def assets_found(self):
+        return self._assets_found
+
+    def config_files_parsed(self):
+        return self._config_files_parsed
+
+    def bytes_read(self):
+        return self._bytes_read
+
+    def read_seconds(self):
+        """
+        :return: Total time the workers spent waiting on the file system.
+        """
+        return self._read_seconds
+
+    def parse_seconds(self):
+        """
+        :return: Total time the workers spent parsing config files.
+        """
+        return self._parse_seconds
+
+    def elapsed_seconds(self):
+        if self._start_time is None:
+            return 0.0
+        end_time = self._end_time if self._end_time is not None else time.monotonic()
+        return end_time - self._start_time
+
+    def entries_per_second(self):
+        """
+        :return: Directory entries handled per second since the scan started.
+                 An unchanged directory that was not read counts as a single entry.
+        """
+        elapsed = self.elapsed_seconds()
+        if elapsed <= 0:
+            return 0.0
+        return (self._files_seen + self._directories_unchanged) / elapsed
+
+    def expected_directories(self):
+        return self._expected_directories
+
+    def remaining_seconds(self):
+        """
+        Estimates the remaining time from the number of directories the previous scan visited.
+        :return: The estimate in seconds, or `None` when there is nothing to base it on.
+        """
+        visited = self.directories_visited()
+        if self._expected_directories is None or visited == 0:
+            return None
+
+        remaining = max(self._expected_directories - visited, 0)
+        return remaining * self.elapsed_seconds() / visited
+
+    @classmethod
+    def combine(cls, statistics_list):
+        """
+        Adds up the counters of several scans that run at the same time.
+        :param statistics_list: List of `ScanStatistics`.
+        :return: A new `ScanStatistics`. The expected number of directories is only known if it is known for all
+                 scans.
+        """
+        expected = 0
+        for statistics in statistics_list:
+            if statistics.expected_directories() is None:
+                expected = None
+                break
+            expected += statistics.expected_directories()
+
+        combined = cls(expected)
+        start_times = []
+        end_times = []
+        for statistics in statistics_list:
+            combined.add(statistics.directories_read(), statistics.directories_unchanged(), statistics.files_seen(),
+                         statistics.assets_found(), statistics.config_files_parsed(), statistics.bytes_read(),
+                         statistics.read_seconds(), statistics.parse_seconds())
+
+            with statistics._lock:
+                if statistics._start_time is not None:
+                    start_times.append(statistics._start_time)
+                end_times.append(statistics._end_time)
+
+        # The combined clock runs from the first start, to the last finish.
+        if len(start_times) > 0:
+            combined._start_time = min(start_times)
+        if len(end_times) > 0 and None not in end_times:
+            combined._end_time = max(end_times)
+
+        return combined
+
+    def summary(self):
+        """
+        :return: Human readable, single line, summary of the counters.
+        """
+        return "{} directories ({} unchanged), {} files, {} assets, {} config files ({} bytes) in {:.1f}s. " \
+               "{:.0f} entries/s. Worker time: {:.1f}s reading, {:.1f}s parsing.".format(
+                self.directories_visited(), self._directories_unchanged, self._files_seen, self._assets_found,
+                self._config_files_parsed, self._bytes_read, self.elapsed_seconds(), self.entries_per_second(),
+                self._read_seconds, self._parse_seconds)
+
+
+def count_directories(scan_state) -> int:
+    """
+    :param scan_state: The `DirScanState` of a scanned directory.
+    :return: Number of directories in the scanned tree, including the ones without assets.
+    """
+    count = 0
+    states = [scan_state]
+    while states:
+        state = states.pop()
+        count += 1
+        states.extend(state.subdir_states.values())
+    return count
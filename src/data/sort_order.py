@@ -0,0 +1,83 @@
+import re
+
+# The ways the assets can be sorted. `None` keeps the order they are found in.
+SORT_NAME = "name"
+SORT_DIRECTORY = "directory"
+SORT_SIZE = "size"
+SORT_MODIFIED = "modified"
+SORT_TAG_COUNT = "tag_count"
+# By number of pixels, then by width.
+SORT_IMAGE_SIZE = "image_size"
+SORT_KEYS = (SORT_NAME, SORT_DIRECTORY, SORT_SIZE, SORT_MODIFIED, SORT_TAG_COUNT, SORT_IMAGE_SIZE)
+
+# Orders of the `PngHeader` fields, to find the assets in a range of values, see `AssetRegistry.range_bits`.
+# Assets without a known header have -1 for all of them.
+RANGE_WIDTH = "width"
+RANGE_HEIGHT = "height"
+RANGE_BIT_DEPTH = "bit_depth"
+# 1 for images with an alpha channel, 0 for the others.
+RANGE_ALPHA = "alpha"
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def natural_key(text: str) -> tuple:
+    """
+    :return: Key that sorts text the way people do: ignoring case, and with the numbers in it by their value.
+             So "sword_2" comes before "sword_10".
+    """
+    parts = _DIGITS.split(text.lower())
+    # The numbers are always at the odd places, so two keys never compare a number to a string.
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+
+def _directory_key(asset) -> tuple:
+    return natural_key(asset.dir_path()), natural_key(asset.name())
+
+
+def _size_key(asset) -> int:
+    size = asset.size()
+    # Unknown sizes first.
+    return -1 if size is None else size
+
+
+def _modified_key(asset) -> int:
+    mtime = asset.modified_time()
+    return -1 if mtime is None else mtime
+
+
+def _tag_count_key(asset) -> int:
+    return len(asset.tags())
+
+
+def _image_size_key(asset) -> tuple:
+    header = asset.png_header()
+    return (-1, -1) if header is None else (header.width * header.height, header.width)
+
+
+def _header_key(field):
+    def key(asset) -> int:
+        header = asset.png_header()
+        return -1 if header is None else int(field(header))
+    return key
+
+
+# Sort key -> function that gives the key of an asset.
+KEY_FUNCTIONS = {
+    SORT_NAME: lambda asset: natural_key(asset.name()),
+    SORT_DIRECTORY: _directory_key,
+    SORT_SIZE: _size_key,
+    SORT_MODIFIED: _modified_key,
+    SORT_TAG_COUNT: _tag_count_key,
+    SORT_IMAGE_SIZE: _image_size_key,
+    RANGE_WIDTH: _header_key(lambda header: header.width),
+    RANGE_HEIGHT: _header_key(lambda header: header.height),
+    RANGE_BIT_DEPTH: _header_key(lambda header: header.bit_depth),
+    RANGE_ALPHA: _header_key(lambda header: header.has_alpha()),
+}
+
+# The keys that depend on the file, instead of its name or tags.
+FILE_KEYS = (SORT_SIZE, SORT_MODIFIED, SORT_IMAGE_SIZE, RANGE_WIDTH, RANGE_HEIGHT, RANGE_BIT_DEPTH, RANGE_ALPHA)
+# The keys that are a single integer, instead of a tuple.
+NUMBER_KEYS = (SORT_SIZE, SORT_MODIFIED, SORT_TAG_COUNT, RANGE_WIDTH, RANGE_HEIGHT, RANGE_BIT_DEPTH, RANGE_ALPHA)
@@ -0,0 +1,581 @@
+import pathlib
+import re
+
+from data import color_signature, sort_order
+from data.asset_registry import count_bits
+
+# Matches the assets without tags.
+UNTAGGED_KEYWORD = "UNTAGGED"
+# Prefix of the terms that limit a search to the directories with a name, or path.
+DIR_PREFIX = "dir:"
+# Prefixes of the terms that find the assets whose file name, or path, contains a piece of text.
+NAME_PREFIX = "name:"
+PATH_PREFIX = "path:"
+# Prefixes of the terms that filter on what the PNG header says about the image. See `parse_query`.
+SIZE_PREFIX = "size:"
+WIDTH_PREFIX = "width:"
+HEIGHT_PREFIX = "height:"
+DEPTH_PREFIX = "depth:"
+ALPHA_PREFIX = "alpha:"
+# Prefix of the terms that find the images by color, see `parse_query`.
+COLOR_PREFIX = "color:"
+# How far a color an image mostly has may be from a searched color, see `color_signature.color_distance`.
+SIMILAR_COLOR_DISTANCE = 80
+
+# Below this number of assets, a directory term filters the assets found so far, instead of gathering the bitmap of
+# the whole directory.
+DIR_FILTER_LIMIT = 10000
+
+# A number, a comparison with a number, or a range of numbers like "64-128".
+_RANGE_PATTERN = re.compile(r"^(?:(?P<compare>>=|<=|>|<|≥|≤)?(?P<number>\d+)|(?P<low>\d+)-(?P<high>\d+))$")
+# Width and height, like "64x64".
+_SIZE_PATTERN = re.compile(r"^(?P<width>\d+)[x×](?P<height>\d+)$", re.IGNORECASE)
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:(?P<open>\()|(?P<close>\))|(?P<word>(?:[^\s()"]*")[^"]*"|[^\s()"]+))')
+
+
+class QueryError(ValueError):
+    """
+    A search that could not be understood. The message says why, and is meant for the user.
+    """
+    pass
+
+
+def parse_query(text: str):
+    """
+    Parses a search for assets. For example: `(sword or axe) and not rusty dir:weapons`
+
+    - A word is a tag. Tags with spaces, or tags like "or", can be put between quotes.
+    - `UNTAGGED` finds the assets without any tags.
+    - `dir:name` finds the assets in, or below, a directory with that name. A path finds the directories whose path
+      ends with it, like `dir:weapons/swords`.
+    - `name:text` finds the assets whose file name contains the text, ignoring case. `path:text` does the same for
+      the path from the asset directory down to the file, like `path:pack/weapons/sword_`.
+    - `width:`, `height:` and `depth:` (bits per channel) find the images with a number (`width:64`), a comparison
+      (`width:>=512`) or a range (`width:32-128`). `size:` does the same for both the width and the height, or takes
+      both: `size:64x64`. `alpha:yes` and `alpha:no` find the images with, or without, an alpha channel. Only PNG
+      files whose header was read can match these.
+    - `color:red` finds the images that are mostly red, see `color_signature.COLOR_NAMES` for the names.
+      `color:#ff8800` finds the images that mostly have a color close to that one. Only images that were analyzed
+      can match these.
+    - `and`, `or` and `not` combine them, in that order of precedence. Terms without anything in between are combined
+      with `and`. Parentheses group.
+
+    :return: The query, call `matching_bits` on it with an `AssetRegistry` to find the assets, or `matches_asset` to
+             check a single asset.
+    :raise QueryError: When the text is not a valid query.
+    """
+    tokens = _tokenize(text)
+    if len(tokens) == 0:
+        raise QueryError("Nothing to search for.")
+
+    parser = _Parser(tokens)
+    query = parser.parse_or()
+    if parser.peek() is not None:
+        raise QueryError("Unexpected \"{}\".".format(parser.peek()[1]))
+    return query
+
+
+def _tokenize(text: str) -> list:
+    """
+    :return: List of (kind, text). Kind is "(", ")", a keyword in lowercase, or "term".
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise QueryError("Missing closing quote.")
+        position = match.end()
+
+        if match.group("open"):
+            tokens.append(("(", "("))
+        elif match.group("close"):
+            tokens.append((")", ")"))
+        else:
+            word = match.group("word")
+            if word.lower() in ("and", "or", "not"):
+                tokens.append((word.lower(), word))
+            else:
+                tokens.append(("term", word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: list):
+        self._tokens = tokens
+        self._position = 0
+
+    def peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise QueryError("The search ends too early.")
+        self._position += 1
+        return token
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() is not None and self.peek()[0] == "or":
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else _Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() is not None and self.peek()[0] not in ("or", ")"):
+            if self.peek()[0] == "and":
+                self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else _And(children)
+
+    def parse_not(self):
+        if self.peek() is not None and self.peek()[0] == "not":
+            self.take()
+            return _Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, text = self.take()
+        if kind == "(":
+            query = self.parse_or()
+            if self.peek() is None or self.peek()[0] != ")":
+                raise QueryError("Missing closing parenthesis.")
+            self.take()
+            return query
+        if kind != "term":
+            raise QueryError("Unexpected \"{}\".".format(text))
+
+        if text == UNTAGGED_KEYWORD:
+            return _Untagged()
+        if text.lower().startswith(DIR_PREFIX):
+            path = _unquote(text[len(DIR_PREFIX):])
+            if path.strip("/\\") == "":
+                raise QueryError("\"{}\" needs a directory name.".format(DIR_PREFIX))
+            return _Dir(path)
+        header_term = _parse_header_term(text)
+        if header_term is not None:
+            return header_term
+        if text.lower().startswith(COLOR_PREFIX):
+            value = _unquote(text[len(COLOR_PREFIX):]).strip().lower()
+            if value in color_signature.COLOR_NAMES:
+                return _ColorName(value)
+            color = color_signature.parse_color(value)
+            if color is None:
+                raise QueryError("\"{}\" needs a color name, like red, or a color, like #ff8800.".format(
+                    COLOR_PREFIX))
+            return _SimilarColor(color)
+        for prefix, term in ((NAME_PREFIX, _Name), (PATH_PREFIX, _Path)):
+            if text.lower().startswith(prefix):
+                part = _unquote(text[len(prefix):])
+                if part == "":
+                    raise QueryError("\"{}\" needs some text to search for.".format(prefix))
+                return term(part)
+        return _Tag(_unquote(text))
+
+
+def _parse_header_term(text: str):
+    """
+    :return: The query of a term about the PNG header, or `None` if the term is about something else.
+    """
+    lower_text = text.lower()
+    if lower_text.startswith(ALPHA_PREFIX):
+        value = lower_text[len(ALPHA_PREFIX):]
+        if value not in ("yes", "no"):
+            raise QueryError("\"{}\" needs \"yes\" or \"no\".".format(ALPHA_PREFIX))
+        alpha = int(value == "yes")
+        return _HeaderRange({sort_order.RANGE_ALPHA: (alpha, alpha)})
+
+    for prefix, keys in ((SIZE_PREFIX, (sort_order.RANGE_WIDTH, sort_order.RANGE_HEIGHT)),
+                         (WIDTH_PREFIX, (sort_order.RANGE_WIDTH,)),
+                         (HEIGHT_PREFIX, (sort_order.RANGE_HEIGHT,)),
+                         (DEPTH_PREFIX, (sort_order.RANGE_BIT_DEPTH,))):
+        if not lower_text.startswith(prefix):
+            continue
+        value = text[len(prefix):]
+
+        size_match = _SIZE_PATTERN.match(value) if prefix == SIZE_PREFIX else None
+        if size_match is not None:
+            width, height = int(size_match.group("width")), int(size_match.group("height"))
+            return _HeaderRange({sort_order.RANGE_WIDTH: (width, width), sort_order.RANGE_HEIGHT: (height, height)})
+
+        value_range = _parse_range(value)
+        if value_range is None:
+            raise QueryError("\"{}\" needs a number, like 64, >=512 or 32-128.".format(prefix))
+        return _HeaderRange({key: value_range for key in keys})
+    return None
+
+
+def _parse_range(text: str):
+    """
+    :return: (lowest, highest) number of a range like "64", ">=512" or "32-128", or `None` if it isn't one.
+             `None` for a side without a limit.
+    """
+    match = _RANGE_PATTERN.match(text)
+    if match is None:
+        return None
+    if match.group("low") is not None:
+        return int(match.group("low")), int(match.group("high"))
+
+    number = int(match.group("number"))
+    compare = match.group("compare")
+    if compare in (">=", "≥"):
+        return number, None
+    if compare == ">":
+        return number + 1, None
+    if compare in ("<=", "≤"):
+        return None, number
+    if compare == "<":
+        return None, number - 1
+    return number, number
+
+
+def _unquote(text: str) -> str:
+    if len(text) >= 2 and text[0] == "\"" and text[-1] == "\"":
+        return text[1:-1]
+    return text
+
+
+class _Query:
+    def estimate(self, registry) -> int:
+        """
+        :return: About how many assets this finds, to decide the order in which the parts are evaluated.
+        """
+        raise NotImplementedError
+
+    def matching_bits(self, registry) -> int:
+        """
+        :return: Bitmap of the ids of the assets in the `AssetRegistry` that match.
+        """
+        raise NotImplementedError
+
+    def matches_asset(self, asset, registry) -> bool:
+        """
+        :return: True if a single asset of the `AssetRegistry` matches.
+        """
+        raise NotImplementedError
+
+    def shortest_text(self):
+        """
+        :return: The length of the shortest text searched for in file names or paths, or `None` if there is none.
+                 Short texts are in many names, which makes them slow to search.
+        """
+        return None
+
+
+class _Tag(_Query):
+    def __init__(self, tag: str):
+        self.tag = tag
+
+    def estimate(self, registry) -> int:
+        return registry.tag_count(self.tag)
+
+    def matching_bits(self, registry) -> int:
+        return registry.tag_bits(self.tag)
+
+    def matches_asset(self, asset, registry) -> bool:
+        return asset.has_tag(self.tag)
+
+
+class _Untagged(_Query):
+    def estimate(self, registry) -> int:
+        return registry.untagged_count()
+
+    def matching_bits(self, registry) -> int:
+        return registry.untagged_bits()
+
+    def matches_asset(self, asset, registry) -> bool:
+        return asset.tag_mask() == 0
+
+
+class _Dir(_Query):
+    def __init__(self, path: str):
+        self.parts = [part.lower() for part in re.split(r"[/\\]+", path.strip("/\\")) if part != ""]
+        # The directories that match, found when first needed.
+        self._matches = None
+
+    def _matching_dirs(self, registry) -> list:
+        """
+        :return: The `AssetDir`s whose path ends with the searched one. Not the ones below them, those are part of
+                 the trees of the matches already.
+        """
+        if self._matches is not None:
+            return self._matches
+
+        self._matches = []
+        nodes = registry.roots()
+        while nodes:
+            node = nodes.pop()
+            parts = [part.lower() for part in node.absolute_path().parts[-len(self.parts):]]
+            if parts == self.parts:
+                self._matches.append(node)
+            else:
+                nodes.extend(node.subdirs().values())
+        return self._matches
+
+    def estimate(self, registry) -> int:
+        return sum(node.asset_count_recursive() for node in self._matching_dirs(registry))
+
+    def matching_bits(self, registry) -> int:
+        return registry.bits_of_uuids(asset_uuid for match in self._matching_dirs(registry)
+                                      for node in match.walk() for asset_uuid in node.asset_uuids())
+
+    def filter_bits(self, registry, bits: int) -> int:
+        """
+        :return: The bits of the assets among `bits` that are in the matching directories. Only looks at those assets,
+                 instead of everything in the directories.
+        """
+        dir_paths = {str(node.absolute_path()) for match in self._matching_dirs(registry) for node in match.walk()}
+        return registry.bits_of_ids(asset_id for asset_id in registry.ids_of_bits(bits)
+                                    if registry.asset(asset_id).dir_path() in dir_paths)
+
+    def matches_asset(self, asset, registry) -> bool:
+        # Checks the same directories as `_matching_dirs`: the one of the asset, and its parents up to the root.
+        dir_parts = pathlib.Path(asset.dir_path()).parts
+        for root in registry.roots():
+            root_parts = root.absolute_path().parts
+            if dir_parts[:len(root_parts)] != root_parts:
+                continue
+            for end in range(len(root_parts), len(dir_parts) + 1):
+                if [part.lower() for part in dir_parts[max(0, end - len(self.parts)):end]] == self.parts:
+                    return True
+        return False
+
+
+class _Name(_Query):
+    def __init__(self, text: str):
+        self.text = text.lower()
+        # Found when first needed. There is no cheaper estimate than the search itself.
+        self._bits = None
+
+    def estimate(self, registry) -> int:
+        return count_bits(self.matching_bits(registry))
+
+    def matching_bits(self, registry) -> int:
+        if self._bits is None:
+            self._bits = registry.name_bits(self.text)
+        return self._bits
+
+    def matches_asset(self, asset, registry) -> bool:
+        return self.text in asset.name().lower()
+
+    def shortest_text(self):
+        return len(self.text)
+
+
+class _ColorName(_Query):
+    def __init__(self, name: str):
+        self.name = name
+
+    def estimate(self, registry) -> int:
+        return count_bits(self.matching_bits(registry))
+
+    def matching_bits(self, registry) -> int:
+        analyses = registry.analyses()
+        return 0 if analyses is None else analyses.color_name_bits(self.name)
+
+    def matches_asset(self, asset, registry) -> bool:
+        return any(color_signature.color_name(color) == self.name for color in _significant_colors(asset, registry))
+
+
+class _SimilarColor(_Query):
+    def __init__(self, color: tuple):
+        self.color = color
+        self._bits = None
+
+    def estimate(self, registry) -> int:
+        return count_bits(self.matching_bits(registry))
+
+    def matching_bits(self, registry) -> int:
+        if self._bits is None:
+            analyses = registry.analyses()
+            self._bits = 0 if analyses is None else analyses.similar_color_bits(self.color, SIMILAR_COLOR_DISTANCE)
+        return self._bits
+
+    def matches_asset(self, asset, registry) -> bool:
+        return any(color_signature.color_distance(self.color, color) <= SIMILAR_COLOR_DISTANCE
+                   for color in _significant_colors(asset, registry))
+
+
+def _significant_colors(asset, registry) -> list:
+    """
+    :return: The colors the image of the asset mostly has, empty if it was not analyzed.
+    """
+    analyses = registry.analyses()
+    asset_id = registry.id_of(asset.uuid())
+    if analyses is None or asset_id is None:
+        return []
+    signature = analyses.color_signature(asset_id)
+    return [] if signature is None else color_signature.significant_colors(signature)
+
+
+class _Path(_Query):
+    """
+    The path of an asset starts with the name of its asset directory, and uses "/" between the parts.
+    """
+
+    def __init__(self, text: str):
+        self.text = text.replace("\\", "/").lower()
+        self._bits = None
+
+    def estimate(self, registry) -> int:
+        return count_bits(self.matching_bits(registry))
+
+    def matching_bits(self, registry) -> int:
+        if self._bits is None:
+            self._bits = self._find_bits(registry)
+        return self._bits
+
+    def _find_bits(self, registry) -> int:
+        text = self.text
+        head, separator, tail = text.rpartition("/")
+        # Text without a "/" can be in the file name.
+        bits = 0 if separator else registry.name_bits(text)
+
+        asset_uuids = []
+        for root in registry.roots():
+            # (AssetDir, its path ending in "/"), as strings instead of `pathlib.Path`s, that is too slow for many
+            # directories.
+            nodes = [(root, root.absolute_path().name.lower() + "/")]
+            while nodes:
+                node, dir_path = nodes.pop()
+                if text in dir_path:
+                    asset_uuids.extend(node.asset_uuids())
+                elif separator and dir_path.endswith(head + "/"):
+                    # The text runs from the directory into the file name.
+                    asset_uuids.extend(asset_uuid for asset_uuid, asset in node.assets().items()
+                                       if asset.name().lower().startswith(tail))
+                nodes.extend((subdir, dir_path + str(subdir_path).replace("\\", "/").lower() + "/")
+                             for subdir_path, subdir in node.subdirs().items())
+        return bits | registry.bits_of_uuids(asset_uuids)
+
+    def matches_asset(self, asset, registry) -> bool:
+        dir_path = pathlib.Path(asset.dir_path())
+        for root in registry.roots():
+            root_path = root.absolute_path()
+            if dir_path == root_path or root_path in dir_path.parents:
+                path = pathlib.Path(root_path.name, dir_path.relative_to(root_path), asset.name()).as_posix()
+                return self.text in path.lower()
+        return False
+
+    def shortest_text(self):
+        return len(self.text)
+
+
+class _HeaderRange(_Query):
+    """
+    The assets whose `PngHeader` fields are all in their range.
+    """
+
+    def __init__(self, ranges: dict):
+        """
+        :param ranges: `sort_order` range key -> (lowest, highest) value, `None` for no limit.
+        """
+        # Assets without a header have -1 for everything, so the lowest value is never below 0.
+        self.ranges = {key: (max(0, low or 0), high) for key, (low, high) in ranges.items()}
+        self._bits = None
+
+    def estimate(self, registry) -> int:
+        return count_bits(self.matching_bits(registry))
+
+    def matching_bits(self, registry) -> int:
+        if self._bits is None:
+            bits = registry.all_bits()
+            for key, (low, high) in self.ranges.items():
+                bits &= registry.range_bits(key, low, high)
+            self._bits = bits
+        return self._bits
+
+    def matches_asset(self, asset, registry) -> bool:
+        for key, (low, high) in self.ranges.items():
+            value = sort_order.KEY_FUNCTIONS[key](asset)
+            if value < low or (high is not None and value > high):
+                return False
+        return True
+
+
+class _Not(_Query):
+    def __init__(self, child):
+        self.child = child
+
+    def estimate(self, registry) -> int:
+        return len(registry) - self.child.estimate(registry)
+
+    def matching_bits(self, registry) -> int:
+        return registry.all_bits() & ~self.child.matching_bits(registry)
+
+    def matches_asset(self, asset, registry) -> bool:
+        return not self.child.matches_asset(asset, registry)
+
+    def shortest_text(self):
+        return self.child.shortest_text()
+
+
+class _And(_Query):
+    def __init__(self, children: list):
+        self.children = children
+
+    def estimate(self, registry) -> int:
+        return min(child.estimate(registry) for child in self.children)
+
+    def matching_bits(self, registry) -> int:
+        # Start from the smallest part, so an empty one ends the search right away. The negated parts are left for
+        # last, they only take away from what was found.
+        included = sorted((child for child in self.children if not isinstance(child, _Not)),
+                          key=lambda child: child.estimate(registry))
+        excluded = [child.child for child in self.children if isinstance(child, _Not)]
+
+        bits = None
+        for child in included:
+            if bits is None:
+                bits = child.matching_bits(registry)
+            elif isinstance(child, _Dir) and count_bits(bits) < DIR_FILTER_LIMIT:
+                bits = child.filter_bits(registry, bits)
+            else:
+                bits &= child.matching_bits(registry)
+            if bits == 0:
+                return 0
+
+        if bits is None:
+            bits = registry.all_bits()
+        for child in excluded:
+            bits &= ~child.matching_bits(registry)
+            if bits == 0:
+                return 0
+        return bits
+
+    def matches_asset(self, asset, registry) -> bool:
+        return all(child.matches_asset(asset, registry) for child in self.children)
+
+    def shortest_text(self):
+        return _shortest_text_of(self.children)
+
+
+class _Or(_Query):
+    def __init__(self, children: list):
+        self.children = children
+
+    def estimate(self, registry) -> int:
+        return min(len(registry), sum(child.estimate(registry) for child in self.children))
+
+    def matching_bits(self, registry) -> int:
+        bits = 0
+        for child in self.children:
+            bits |= child.matching_bits(registry)
+        return bits
+
+    def matches_asset(self, asset, registry) -> bool:
+        return any(child.matches_asset(asset, registry) for child in self.children)
+
+    def shortest_text(self):
+        return _shortest_text_of(self.children)
+
+
+def _shortest_text_of(children: list):
+    lengths = [length for length in (child.shortest_text() for child in children) if length is not None]
+    return min(lengths) if lengths else None
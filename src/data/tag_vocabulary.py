@@ -0,0 +1,104 @@
+import threading
+
+
+class TagVocabulary:
+    """
+    Gives every tag in the library a small integer id.
+
+    Assets don't hold the tag strings themselves, but a bitmask with a bit set for the id of every tag they have.
+    Each tag string is only stored once, and checking for a tag, or comparing tags, is integer arithmetic.
+    Python integers have no fixed size, so a library can have as many tags as it wants.
+
+    Ids are never reused, and only live as long as the program runs. Anything that is saved uses the tag strings.
+    """
+
+    # How many different tag combinations are remembered by `tags_of`.
+    TAG_SET_CACHE_SIZE = 4096
+
+    def __init__(self):
+        # Tag -> id.
+        self._ids = {}
+        # Id -> tag.
+        self._tags = []
+        # Bitmask -> frozenset of tags. Most assets share one of a few tag combinations.
+        self._tag_sets = {0: frozenset()}
+        # Assets are built on the scan threads as well.
+        self._lock = threading.Lock()
+
+    def tag_id(self, tag: str) -> int:
+        """
+        :return: The id of a tag. Tags are always lowercase, so "Sword" has the same id as "sword".
+                 Unknown tags are added to the vocabulary.
+        """
+        tag_id = self._ids.get(tag)
+        if tag_id is not None:
+            return tag_id
+
+        tag = tag.lower()
+        with self._lock:
+            tag_id = self._ids.get(tag)
+            if tag_id is None:
+                tag_id = len(self._tags)
+                # Only one copy of the string for the whole library.
+                self._tags.append(tag)
+                self._ids[tag] = tag_id
+            return tag_id
+
+    def known_id(self, tag: str):
+        """
+        :return: The id of a tag, or `None` if no asset ever had it. Does not add the tag.
+        """
+        tag_id = self._ids.get(tag)
+        if tag_id is None:
+            tag_id = self._ids.get(tag.lower())
+        return tag_id
+
+    def tag(self, tag_id: int) -> str:
+        return self._tags[tag_id]
+
+    def bit(self, tag: str) -> int:
+        """
+        :return: The bitmask of a single tag.
+        """
+        return 1 << self.tag_id(tag)
+
+    def mask_of(self, tags) -> int:
+        """
+        :return: The bitmask of a collection of tags.
+        """
+        mask = 0
+        for tag in tags:
+            mask |= 1 << self.tag_id(tag)
+        return mask
+
+    def tags_of(self, mask: int) -> frozenset:
+        """
+        :return: The tags in a bitmask.
+        """
+        tags = self._tag_sets.get(mask)
+        if tags is not None:
+            return tags
+
+        tags = frozenset(self._tags[tag_id] for tag_id in tag_ids_of(mask))
+
+        if len(self._tag_sets) >= self.TAG_SET_CACHE_SIZE:
+            self._tag_sets = {0: frozenset()}
+        self._tag_sets[mask] = tags
+        return tags
+
+    def __len__(self):
+        return len(self._tags)
+
+
+def tag_ids_of(mask: int):
+    """
+    :return: Generator of the ids of the bits that are set in a bitmask, lowest first.
+    """
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+# The vocabulary of all the assets in the program.
+vocabulary = TagVocabulary()
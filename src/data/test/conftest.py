@@ -0,0 +1,50 @@
+import os
+import pathlib
+import shutil
+
+import PyQt5.QtCore as Qcore
+import pytest
+
+UNSCANNED_DIR = "unscanned_asset_dir"
+FILES_DIR = pathlib.Path(__file__).parent.joinpath("files")
+
+
+@pytest.fixture
+def files_dir(fs):
+    """
+    Creates a fake filesystem with the `files` directory in it, and cd's into it.
+    :return:
+    """
+    # Read it in right away. Lazily reading it from multiple worker threads at once is not thread safe.
+    fs.add_real_directory(FILES_DIR, lazy_read=False)
+    os.chdir(FILES_DIR)
+
+    return fs
+
+
+@pytest.fixture
+def files_copy(tmp_path):
+    """
+    A real copy of the `files` directory. For tests that the fake filesystem can't handle: sqlite, Qt reading images,
+    watching for changes, and directory modification times.
+    :return: The path of the copy.
+    """
+    files_copy = tmp_path.joinpath("files")
+    shutil.copytree(FILES_DIR, files_copy)
+    return files_copy
+
+
+@pytest.fixture
+def root_dir(files_copy):
+    """
+    :return: Path of the asset directory in the real copy of the test files, see `files_copy`.
+    """
+    return files_copy.joinpath(UNSCANNED_DIR)
+
+
+@pytest.fixture
+def app():
+    """
+    An event loop, for everything that reports back through signals.
+    """
+    return Qcore.QCoreApplication.instance() or Qcore.QCoreApplication([])
@@ -0,0 +1,87 @@
+import os
+import tracemalloc
+
+import data
+from data import Asset
+
+# How much memory a single asset may take, in bytes. Includes its uuid and file name.
+# A library can hold millions of assets, so keep an eye on this when adding anything to `Asset`.
+ASSET_MEMORY_BUDGET = 320
+
+
+def test_asset_memory():
+    """
+    Measures the memory used per asset, for a directory full of untagged assets.
+    """
+    count = 10000
+    paths = [os.path.join(os.path.abspath("library"), "asset_{}.png".format(i)) for i in range(count)]
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        assets = [Asset(path) for path in paths]
+        per_asset = (tracemalloc.get_traced_memory()[0] - before) / count
+    finally:
+        tracemalloc.stop()
+
+    assert per_asset < ASSET_MEMORY_BUDGET
+    # The directory is shared, and the path is still the same.
+    assert assets[0].dir_path() is assets[1].dir_path()
+    assert str(assets[0].absolute_path()) == paths[0]
+
+
+def test_asset_tags():
+    """
+    Test if assets without tags share the empty tag set, without it ever being changed.
+    """
+    first = Asset("first.png")
+    second = Asset("second.png")
+    assert first.tags() is second.tags()
+
+    first.add_tag("sword")
+    assert first.tags() == {"sword"}
+    assert second.tags() == set()
+
+    moved = first.moved_to("moved.png")
+    moved.add_tag("shiny")
+    assert first.tags() == {"sword"}
+    assert moved.uuid() == first.uuid()
+
+
+def test_tag_vocabulary():
+    """
+    Test if tags get stable ids, and bitmasks turn back into the same tags.
+    """
+    vocabulary = data.TagVocabulary()
+    sword_id = vocabulary.tag_id("sword")
+    assert vocabulary.tag_id("Sword") == sword_id
+    assert vocabulary.known_id("SWORD") == sword_id
+    assert vocabulary.known_id("never_used") is None
+    assert len(vocabulary) == 1
+
+    mask = vocabulary.mask_of(["sword", "Shiny"])
+    assert mask == vocabulary.bit("sword") | vocabulary.bit("shiny")
+    assert vocabulary.tags_of(mask) == {"sword", "shiny"}
+    assert vocabulary.tags_of(mask) is vocabulary.tags_of(mask)
+    assert vocabulary.tags_of(0) == set()
+
+    asset = Asset("asset.png", tags=["Sword"])
+    assert asset.tags() == {"sword"}
+    assert asset.has_tag("sword")
+    assert not asset.has_tag("never_used")
+    # Removing a tag the asset doesn't have changes nothing.
+    asset.was_saved()
+    asset.remove_tag("shiny")
+    assert not asset.is_dirty()
+
+
+def test_png_header():
+    header = data.png_header.parse_png_header(data.png_header.PNG_SIGNATURE + bytes.fromhex(
+        "0000000d49484452" "00000078" "00000140" "0802"))
+    assert header == (120, 320, 8, 2)
+    assert not header.has_alpha()
+    assert data.png_header.parse_png_header(b"GIF89a" + bytes(20)) is None
+
+    assert data.png_header.unpack_png_header(data.png_header.pack_png_header(header)) == header
+    assert data.png_header.pack_png_header(None) == 0
+    assert data.png_header.unpack_png_header(0) is None
@@ -9,20 +9,6 @@ UNSCANNED_DIR = "unscanned_asset_dir"
 SWORDS_DIR = "unscanned_asset_dir/swords"
 
 
-@pytest.fixture
-def files_dir(fs):
-    """
-    Creates a fake filesystem with the `files` directory in it, and cd's into it.
-    :return:
-    """
-    files_dir = pathlib.Path(__file__).parent.joinpath("files")
-
-    fs.add_real_directory(files_dir)
-    os.chdir(files_dir)
-
-    return fs
-
-
 def test_returns_absolute_path(files_dir):
     """
     Test if the a new AssetDir returns an absolute path.
@@ -135,3 +121,288 @@ def test_save_and_load(files_dir):
         assert not asset.is_dirty()
 
 # TODO test recursive loading.
+
+
+@pytest.fixture
+def real_files_dir(files_copy):
+    """
+    Cd's into the real copy of the `files` directory.
+    Needed for tests that depend on directory modification times, which the fake filesystem does not update.
+    :return: The path of the copy.
+    """
+    # Put the modification times far in the past, so any change made during the test is noticed.
+    for directory, _, files in os.walk(files_copy):
+        os.utime(directory, ns=(0, 0))
+        for file in files:
+            os.utime(os.path.join(directory, file), ns=(0, 0))
+
+    previous_cwd = os.getcwd()
+    os.chdir(files_copy)
+    yield files_copy
+    os.chdir(previous_cwd)
+
+
+def test_rescan_reuses_unchanged_dirs(real_files_dir):
+    """
+    Test if scanning again with the previous result reuses the directories that did not change.
+    """
+    unscanned_dir = pathlib.Path(UNSCANNED_DIR)
+    first_scan = data.recursive_load_asset_dir(unscanned_dir)
+    rescan = data.recursive_load_asset_dir(unscanned_dir, previous=first_scan)
+
+    assert rescan is first_scan
+
+
+def test_rescan_finds_new_assets(real_files_dir):
+    """
+    Test if scanning again picks up new assets, and keeps the directories that did not change.
+    """
+    unscanned_dir = pathlib.Path(UNSCANNED_DIR)
+    first_scan = data.recursive_load_asset_dir(unscanned_dir)
+    swords = pathlib.Path("swords")
+    swords_transparent = pathlib.Path("swords_transparent")
+    old_assets = set(first_scan.subdirs()[swords].assets().keys())
+
+    pathlib.Path(SWORDS_DIR).joinpath("new_sword.png").touch()
+    rescan = data.recursive_load_asset_dir(unscanned_dir, previous=first_scan)
+
+    assert rescan.asset_count_recursive() == 8
+    # The assets that were already there keep their uuid.
+    assert old_assets.issubset(rescan.subdirs()[swords].assets().keys())
+    assert rescan.subdirs()[swords_transparent] is first_scan.subdirs()[swords_transparent]
+
+
+def test_rescan_follows_renamed_and_removed_assets(real_files_dir):
+    """
+    Test if scanning again drops assets whose file is gone, and keeps the uuid and tags of renamed assets.
+    """
+    unscanned_dir = pathlib.Path(UNSCANNED_DIR)
+    first_scan = data.recursive_load_asset_dir(unscanned_dir)
+    swords = pathlib.Path("swords")
+    old_assets = {asset.name(): asset for asset in first_scan.subdirs()[swords].assets().values()}
+    old_assets["tall.png"].add_tag("long")
+
+    swords_dir = pathlib.Path(SWORDS_DIR)
+    swords_dir.joinpath("tall.png").rename(swords_dir.joinpath("taller.png"))
+    swords_dir.joinpath("wide.png").unlink()
+    rescan = data.recursive_load_asset_dir(unscanned_dir, previous=first_scan)
+
+    new_assets = {asset.name(): asset for asset in rescan.subdirs()[swords].assets().values()}
+    assert new_assets.keys() == {"square_crossed.png", "taller.png"}
+    assert new_assets["taller.png"].uuid() == old_assets["tall.png"].uuid()
+    assert new_assets["taller.png"].tags() == {"long"}
+    # The new location needs to be saved.
+    assert new_assets["taller.png"].is_dirty()
+
+
+def test_dirty_tracking(files_dir):
+    """
+    Test if only the directories with changed assets are marked for saving, and are clean again after saving.
+    """
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    # Everything is new, so every directory with assets needs to be saved once.
+    assert len(data.recursive_save_asset_dir(asset_dir)) == 3
+    assert data.recursive_save_asset_dir(asset_dir) == []
+
+    dirty_asset_dirs = data.DirtyAssetDirs()
+    dirty_asset_dirs.attach(asset_dir)
+    assert len(dirty_asset_dirs) == 0
+
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+    asset.add_tag("sword")
+    assert dirty_asset_dirs.take() == [swords]
+
+    data.save_asset_dir(swords)
+    assert not asset.is_dirty()
+    assert not swords.is_dirty()
+    assert len(dirty_asset_dirs) == 0
+
+
+def test_journal_replay(files_dir):
+    """
+    Test if changes that are only in the journal are applied when loading, until the journal is compacted.
+    """
+    root_path = pathlib.Path(UNSCANNED_DIR).absolute()
+    asset_dir = data.recursive_load_asset_dir(root_path)
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+    asset.add_tag("sword")
+
+    # Nothing was saved to the config files yet, so without the journal every asset would get a new uuid.
+    journal = data.AssetJournal()
+    entries = journal.record(data.load_scan_save.find_dirty_asset_dirs(asset_dir))
+    assert len(entries[root_path]) == 7
+    data.load_scan_save.append_to_journal(root_path, entries[root_path])
+    assert journal.has_changes(root_path)
+
+    loaded = data.recursive_load_asset_dir(root_path)
+    assert set(loaded.assets_recursive().keys()) == set(asset_dir.assets_recursive().keys())
+    replayed = loaded.assets_recursive()[asset.uuid()]
+    assert replayed.tags() == {"sword"}
+    assert replayed.inode() == asset.inode()
+    assert replayed.packed_png_header() == asset.packed_png_header()
+
+    # Compacting writes everything that was replayed.
+    snapshots = journal.take_compaction(loaded)
+    assert len(snapshots) == 3
+    assert not journal.has_changes(root_path)
+    for snapshot in snapshots:
+        data.load_scan_save.write_dir_snapshot(snapshot)
+    data.load_scan_save.clear_journal(root_path)
+
+    loaded = data.recursive_load_asset_dir(root_path)
+    assert loaded.assets_recursive()[asset.uuid()].tags() == {"sword"}
+    assert data.load_scan_save.find_dirty_asset_dirs(loaded) == []
+
+
+def test_registry_tags(files_dir):
+    """
+    Test if the tag bitmaps of the registry follow tag changes, and assets and directories that come and go.
+    """
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    registry = data.AssetRegistry()
+    registry.attach(asset_dir)
+    assert registry.untagged_assets() == asset_dir.assets_recursive()
+
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+    asset.add_tag("sword")
+    assert registry.assets_with_tag("sword") == {asset.uuid(): asset}
+    assert asset.uuid() not in registry.untagged_assets()
+    assert registry.assets_with_tag("never_used") == {}
+
+    # A new version of the asset, with other tags.
+    moved = asset.moved_to(asset.absolute_path().with_name("moved.png"))
+    moved.set_tags({"shiny"})
+    swords.add_assets({moved.uuid(): moved})
+    assert registry.assets_with_tag("sword") == {}
+    assert registry.assets_with_tag("shiny") == {moved.uuid(): moved}
+
+    asset_dir.remove_subdir(pathlib.Path("swords"))
+    assert registry.assets_with_tag("shiny") == {}
+    assert len(registry.untagged_assets()) == 4
+
+    registry.detach(asset_dir.absolute_path())
+    assert registry.untagged_assets() == {}
+
+
+def test_registry_sorting(files_dir, monkeypatch):
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    registry = data.AssetRegistry()
+    registry.attach(asset_dir)
+    assets = {asset.name(): asset for asset in asset_dir.assets_recursive().values()}
+    assets["wide.png"].set_size(30)
+    assets["tall.png"].set_size(10)
+    assets["tall_t.png"].set_tags({"sword", "transparent"})
+
+    def names(sort_key, descending=False):
+        view = data.AssetView.of_dirs([asset_dir], registry).sorted_by(sort_key, descending)
+        return [asset.name() for asset in view]
+
+    assert names(data.sort_order.SORT_NAME) == sorted(assets.keys())
+    assert names(data.sort_order.SORT_SIZE)[-2:] == ["tall.png", "wide.png"]
+    assert names(data.sort_order.SORT_TAG_COUNT, descending=True)[0] == "tall_t.png"
+
+    # Large results are picked from the order of the whole library, which follows the changes.
+    monkeypatch.setattr(data.asset_registry, "SMALL_SORT_RATIO", 0)
+    assert names(data.sort_order.SORT_SIZE)[-1] == "wide.png"
+    assets["tall.png"].set_size(50)
+    assert names(data.sort_order.SORT_SIZE)[-1] == "tall.png"
+    names(data.sort_order.SORT_NAME)
+    staff = assets["staff.png"]
+    registry.add_assets([staff.moved_to(staff.absolute_path().with_name("a_staff.png"))])
+    assert registry.uuids_of_ids(registry.sorted_ids(registry.all_bits(), data.sort_order.SORT_NAME))[0] == staff.uuid()
+    bits = registry.bits_of_uuids([assets["wide.png"].uuid(), staff.uuid()])
+    assert registry.uuids_of_ids(registry.sorted_ids(bits, data.sort_order.SORT_NAME)) == (
+        staff.uuid(), assets["wide.png"].uuid())
+
+    # Ranges are found in the cached order, which also follows the changes.
+    wide_and_tall = registry.bits_of_uuids([assets["wide.png"].uuid(), assets["tall.png"].uuid()])
+    assert registry.range_bits(data.sort_order.SORT_SIZE, 20, 60) == wide_and_tall
+    registry.remove_assets([assets["wide.png"]])
+    assert registry.range_bits(data.sort_order.SORT_SIZE, 20, 60) == registry.bits_of_uuids([assets["tall.png"].uuid()])
+    registry.add_assets([assets["wide.png"]])
+    assert registry.range_bits(data.sort_order.SORT_SIZE, 20, None) == \
+           registry.bits_of_uuids([assets["wide.png"].uuid(), assets["tall.png"].uuid()])
+
+    assert data.sort_order.natural_key("Sword_10.png") > data.sort_order.natural_key("sword_9.png")
+
+
+def test_asset_view(files_dir):
+    """
+    Test if a view of a tree shows every asset once, in order, and follows the registry.
+    """
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    registry = data.AssetRegistry()
+    registry.attach(asset_dir)
+    assert len(registry) == 7
+
+    view = data.AssetView.of_dirs([asset_dir], registry)
+    all_assets = list(asset_dir.assets_recursive().values())
+    assert len(view) == 7
+    assert list(view) == all_assets
+    assert view.slice(2, 5) == all_assets[2:5]
+    assert view.slice(5, 100) == all_assets[5:]
+
+    # Assets that are replaced by a new version are looked up again.
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+    moved = asset.moved_to(asset.absolute_path().with_name("moved.png"))
+    swords.add_assets({moved.uuid(): moved})
+    assert view.get(asset.uuid()) is moved
+
+    view = view.without_assets([moved.uuid()])
+    assert len(view) == 6
+    assert view.get(moved.uuid()) is None
+    extended = view.with_assets([moved.uuid()])
+    assert len(extended) == 7
+    assert extended.contains(moved.uuid())
+    assert not extended.with_assets([moved.uuid()]).slice(7, 8)
+    # The view it was made from stays the same.
+    assert not view.contains(moved.uuid())
+
+    # Assets that leave the registry are dropped, without having to tell the view.
+    shown = list(view)
+    registry.remove_assets([shown[2]])
+    assert len(view) == 5
+    assert view.slice(0, 5) == list(view) == shown[:2] + shown[3:]
+    assert view.index_of(shown[3].uuid()) == 2
+    assert view.index_of(shown[2].uuid()) is None
+
+    registry.detach(asset_dir.absolute_path())
+    assert len(registry) == 0
+    assert len(view) == 0
+
+
+def test_recursive_totals(files_dir):
+    """
+    Test if the totals of a tree follow tag and size changes, and assets and directories that come and go.
+    """
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    assert asset_dir.asset_count_recursive() == 7
+    assert asset_dir.untagged_count_recursive() == 7
+    assert asset_dir.tag_counts_recursive() == {}
+
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+    asset.add_tag("sword")
+    asset.set_size(100)
+    assert asset_dir.tag_counts_recursive() == {"sword": 1}
+    assert asset_dir.known_tags_recursive() == {"sword"}
+    assert asset_dir.untagged_count_recursive() == 6
+    assert asset_dir.total_bytes_recursive() == 100
+
+    # A new version of the asset replaces the old one.
+    moved = asset.moved_to(asset.absolute_path().with_name("moved.png"))
+    moved.set_tags({"shiny"})
+    swords.add_assets({moved.uuid(): moved})
+    assert asset_dir.asset_count_recursive() == 7
+    assert asset_dir.tag_counts_recursive() == {"shiny": 1}
+    assert asset_dir.total_bytes_recursive() == 100
+
+    asset_dir.remove_subdir(pathlib.Path("swords"))
+    assert asset_dir.asset_count_recursive() == 4
+    assert asset_dir.untagged_count_recursive() == 4
+    assert asset_dir.tag_counts_recursive() == {}
+    assert asset_dir.total_bytes_recursive() == 0
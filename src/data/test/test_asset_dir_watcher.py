@@ -0,0 +1,66 @@
+import pathlib
+import shutil
+import time
+
+import data
+
+
+def wait_for_changes(app, watcher, timeout=10):
+    """
+    Runs the event loop until the watcher reports a change.
+    :return: List of the (root, added, removed, updated) tuples that were reported.
+    """
+    changes = []
+    watcher.assets_changed.connect(lambda *args: changes.append(args))
+
+    end_time = time.monotonic() + timeout
+    while len(changes) == 0 and time.monotonic() < end_time:
+        app.processEvents()
+        time.sleep(0.01)
+    return changes
+
+
+def test_watcher_applies_changes(app, root_dir):
+    """
+    Test if new, removed, and renamed files, and new subdirectories, are applied to the watched tree.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    watcher = data.AssetDirWatcher()
+    watcher.watch(asset_dir)
+
+    swords_dir = root_dir.joinpath("swords")
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    tall_uuid = next(asset.uuid() for asset in swords.assets().values() if asset.name() == "tall.png")
+    wide_uuid = next(asset.uuid() for asset in swords.assets().values() if asset.name() == "wide.png")
+
+    swords_dir.joinpath("tall.png").rename(swords_dir.joinpath("taller.png"))
+    swords_dir.joinpath("wide.png").unlink()
+    swords_dir.joinpath("new_sword.png").touch()
+    changes = wait_for_changes(app, watcher)
+
+    assert len(changes) == 1
+    root, added, removed, updated = changes[0]
+    assert root == asset_dir.absolute_path()
+    assert [asset.name() for asset in added.values()] == ["new_sword.png"]
+    assert removed == [wide_uuid]
+    assert updated[tall_uuid].name() == "taller.png"
+    assert {asset.name() for asset in swords.assets().values()} == {"square_crossed.png", "taller.png",
+                                                                     "new_sword.png"}
+
+    # New directories are scanned, and watched as well.
+    new_dir = root_dir.joinpath("non_assets", "new_dir")
+    new_dir.mkdir()
+    shutil.copy(swords_dir.joinpath("taller.png"), new_dir.joinpath("copy.png"))
+    changes = wait_for_changes(app, watcher)
+
+    assert len(changes) == 1
+    assert asset_dir.asset_count_recursive() == 8
+    assert pathlib.Path("new_dir") in asset_dir.subdirs()[pathlib.Path("non_assets")].subdirs()
+
+    new_dir.joinpath("copy.png").unlink()
+    changes = wait_for_changes(app, watcher)
+
+    assert len(changes) == 1
+    # Directories without assets are not part of the tree.
+    assert pathlib.Path("non_assets") not in asset_dir.subdirs()
+    watcher.shutdown()
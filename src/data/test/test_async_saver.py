@@ -0,0 +1,115 @@
+import json
+import pathlib
+
+import data
+from data.load_scan_save import CONFIG_FILE_NAME, DirSnapshot, apply_saved_state, read_journal
+
+
+def test_saver_writes_snapshots(app, root_dir):
+    """
+    Test if snapshots are written in the background, and later changes don't leak into them.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    data.recursive_save_asset_dir(asset_dir)
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+
+    catalog = data.AssetCatalog(":memory:")
+    catalog.update_asset_dir(asset_dir)
+    saver = data.AsyncSaver(catalog)
+    results = []
+    saver.batch_done.connect(lambda saved, failed: results.append((saved, failed)))
+
+    asset.add_tag("sword")
+    snapshot = data.snapshot_asset_dir(swords)
+    swords.was_saved()
+    # Not in the snapshot, so it is not written.
+    asset.add_tag("shiny")
+    saver.queue([snapshot])
+    assert saver.wait(10)
+    app.processEvents()
+
+    with open(swords.absolute_path().joinpath(CONFIG_FILE_NAME)) as f:
+        config = json.load(f)
+    assert config["assets"][asset.name()]["tags"] == ["sword"]
+    assert catalog.load_asset_dir(root_dir).assets_recursive()[asset.uuid()].tags() == {"sword"}
+    # No temporary files are left behind.
+    assert [path.name for path in swords.absolute_path().iterdir() if path.suffix == ".tmp"] == []
+
+    assert len(results) == 1
+    saved, failed = results[0]
+    assert failed == []
+    assert [saved_snapshot for saved_snapshot, _ in saved] == [snapshot]
+
+    # Our own save does not count as a change on disk.
+    apply_saved_state(swords, *saved[0])
+    rescanned = data.recursive_load_asset_dir(root_dir, asset_dir)
+    assert rescanned.subdirs()[pathlib.Path("swords")] is swords
+
+    assert saver.shutdown(10)
+
+
+def test_saver_compacts_journal(app, root_dir):
+    """
+    Test if compacting writes the config files and clears the journal, but keeps entries appended after it.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    data.recursive_save_asset_dir(asset_dir)
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    first, second = list(swords.assets().values())[:2]
+    journal = data.AssetJournal()
+    saver = data.AsyncSaver()
+
+    first.add_tag("sword")
+    saver.append_to_journal(root_dir, journal.record([swords])[root_dir])
+    saver.compact(root_dir, journal.take_compaction(asset_dir))
+    second.add_tag("shiny")
+    saver.append_to_journal(root_dir, journal.record([swords])[root_dir])
+    assert saver.shutdown(10)
+
+    # Only the entry that came after the compaction is left.
+    assert [entry[1] for entry in read_journal(root_dir)] == [second.name()]
+    loaded = data.recursive_load_asset_dir(root_dir)
+    assert loaded.assets_recursive()[first.uuid()].tags() == {"sword"}
+    assert loaded.assets_recursive()[second.uuid()].tags() == {"shiny"}
+
+
+def test_saver_survives_errors(app, root_dir, monkeypatch):
+    """
+    Test if the writer keeps going after a batch failed in an unexpected way.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    saver = data.AsyncSaver()
+
+    def broken_write(snapshot):
+        raise ValueError("Broken")
+    monkeypatch.setattr(data.async_saver, "write_dir_snapshot", broken_write)
+    saver.queue([data.snapshot_asset_dir(swords)])
+    assert saver.wait(10)
+
+    monkeypatch.undo()
+    saver.queue([data.snapshot_asset_dir(swords)])
+    assert saver.shutdown(10)
+    assert swords.absolute_path().joinpath(CONFIG_FILE_NAME).exists()
+
+
+def test_saver_keeps_config_writes(app, root_dir):
+    """
+    Test if a catalog snapshot of a directory without assets does not replace a config file that is still waiting to
+    be written.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    swords = asset_dir.subdirs()[pathlib.Path("swords")]
+    saver = data.AsyncSaver()
+
+    # Holding the lock keeps the writer from taking the first snapshot before the second one is queued.
+    with saver._condition:
+        saver.queue([data.snapshot_asset_dir(swords)])
+        saver.queue([DirSnapshot(None, str(swords.absolute_path()), str(root_dir), (), swords.scan_state(),
+                                 write_config=False)])
+        pending = saver._pending[str(swords.absolute_path())]
+    assert saver.shutdown(10)
+
+    assert pending.asset_dir is swords
+    assert pending.write_config
@@ -0,0 +1,58 @@
+import os
+
+import data
+
+
+def tree_assets(asset_dir):
+    """
+    :return: Set of the (path, uuid, tags, png header) of all the assets in the tree.
+    """
+    return {(str(asset.absolute_path()), asset.uuid(), frozenset(asset.tags()), asset.png_header())
+            for asset in asset_dir.assets_recursive().values()}
+
+
+def test_catalog_round_trip(root_dir, tmp_path):
+    """
+    Test if an asset directory comes out of the catalog the same as it went in.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    next(iter(asset_dir.assets_recursive().values())).add_tag("sword")
+    data.recursive_save_asset_dir(asset_dir)
+
+    catalog = data.AssetCatalog(tmp_path.joinpath("catalog.sqlite3"))
+    catalog.update_asset_dir(asset_dir)
+    catalog.close()
+
+    catalog = data.AssetCatalog(tmp_path.joinpath("catalog.sqlite3"))
+    loaded = catalog.load_asset_dir(root_dir)
+
+    assert tree_assets(loaded) == tree_assets(asset_dir)
+    assert set(loaded.subdirs().keys()) == set(asset_dir.subdirs().keys())
+    assert catalog.load_asset_dir(root_dir.joinpath("does_not_exist")) is None
+
+    catalog.remove_asset_dir(root_dir)
+    assert catalog.load_asset_dir(root_dir) is None
+
+
+def test_catalog_tree_skips_unchanged_dirs(root_dir):
+    """
+    Test if scanning with the tree from the catalog only reads the directories that changed since it was saved.
+    """
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    data.recursive_save_asset_dir(asset_dir)
+    catalog = data.AssetCatalog(":memory:")
+    catalog.update_asset_dir(asset_dir)
+
+    swords_dir = root_dir.joinpath("swords")
+    swords_dir.joinpath("new_sword.png").touch()
+    # Make sure the directory looks changed, even on file systems with a coarse modification time.
+    os.utime(swords_dir, ns=(0, 0))
+
+    scanner = data.ParallelScanner(2)
+    job = scanner.submit(root_dir, previous=catalog.load_asset_dir(root_dir))
+    rescan = job.result(timeout=10)
+    scanner.shutdown()
+
+    assert job.statistics().directories_read() == 1
+    assert job.statistics().config_files_parsed() == 0
+    assert rescan.asset_count_recursive() == 8
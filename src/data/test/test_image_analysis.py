@@ -0,0 +1,170 @@
+import pathlib
+import shutil
+import time
+
+import PyQt5.QtGui as Qgui
+import pytest
+
+import data
+from data.color_signature import color_name, parse_color, significant_colors
+from data.image_analyzer import analyze_image
+from data.image_hash import duplicate_groups, hash_distance
+
+
+@pytest.fixture
+def root_dir(root_dir):
+    """
+    The real copy of the test files, with a copy of `tall.png` and a smaller version of it.
+    :return: Path of the asset directory in the copy.
+    """
+    swords = root_dir.joinpath("swords")
+    shutil.copy(swords.joinpath("tall.png"), swords.joinpath("tall_copy.png"))
+    Qgui.QImage(str(swords.joinpath("tall.png"))).scaledToHeight(150).save(str(swords.joinpath("tall_small.png")))
+    return root_dir
+
+
+def wait_for(analyzer: data.ImageAnalyzer) -> list:
+    """
+    :return: The results, once the analyzer is done.
+    """
+    deadline = time.monotonic() + 30
+    while analyzer.pending_count() > 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return analyzer.take_results()
+
+
+def test_duplicate_groups():
+    ids_and_hashes = [(0, 0b1111), (1, 0b1111), (2, 0b0111), (3, 0b0011), (4, 0b1111 << 60), (5, 0b0111 << 60)]
+    assert duplicate_groups(ids_and_hashes, max_distance=0) == [[0, 1]]
+    # Chained from 0 to 3, largest group first.
+    assert [sorted(group) for group in duplicate_groups(ids_and_hashes, max_distance=1)] == [[0, 1, 2, 3], [4, 5]]
+    assert duplicate_groups([(0, 0b01), (1, 0b10)], max_distance=1) == []
+
+
+def test_find_duplicates(root_dir):
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    registry = data.AssetRegistry()
+    registry.attach(asset_dir)
+
+    queued = []
+    index = data.AnalysisIndex(registry, queued.extend)
+    assert len(queued) == len(registry) and index.pending_count() == len(registry)
+
+    index.add_results([(asset, analyze_image(asset.absolute_path())) for asset in queued])
+    assert index.pending_count() == 0
+    names = {asset.name(): asset for asset in queued}
+    assert hash_distance(index.difference_hash(registry.id_of(names["tall.png"].uuid())),
+                         index.difference_hash(registry.id_of(names["tall_small.png"].uuid()))) <= 1
+
+    groups = duplicate_groups(index.ids_and_hashes(registry.all_bits()))
+    assert [{registry.asset(asset_id).name() for asset_id in group} for group in groups] == \
+           [{"tall.png", "tall_copy.png", "tall_small.png"}]
+
+    # Tag changes don't need a new analysis, new versions of an asset do.
+    queued.clear()
+    names["tall.png"].add_tag("sword")
+    assert queued == []
+    moved = names["tall.png"].moved_to(pathlib.Path(names["tall.png"].dir_path(), "tall_moved.png"))
+    registry.add_assets([moved])
+    assert queued == [moved]
+    assert index.difference_hash(registry.id_of(moved.uuid())) is None
+
+
+def test_color_signature(root_dir):
+    def names(file_path):
+        analysis = analyze_image(root_dir.joinpath(file_path))
+        return [color_name(color) for color in significant_colors(analysis.colors)]
+
+    # Transparent pixels don't count.
+    assert names("swords_transparent/tall_t.png")[0] == "blue"
+    assert names("swords/tall.png")[0] == "black"
+
+    assert parse_color("#ff8800") == (255, 136, 0) == parse_color("FF8800")
+    assert parse_color("teal") == (0, 128, 128)
+    assert parse_color("nope") is None
+
+
+def test_search_by_color(root_dir):
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    registry = data.AssetRegistry()
+    registry.attach(asset_dir)
+
+    queued = []
+    index = data.AnalysisIndex(registry, queued.extend)
+    # Nothing is analyzed yet.
+    assert data.parse_query("color:blue").matching_bits(registry) == 0
+
+    index.add_results([(asset, analyze_image(asset.absolute_path())) for asset in queued])
+
+    def found(query_text):
+        query = data.parse_query(query_text)
+        found_ids = registry.ids_of_bits(query.matching_bits(registry))
+        # The bitmaps agree with looking at the assets one by one.
+        assert found_ids == [asset_id for asset_id in registry.ids_of_bits(registry.all_bits())
+                             if query.matches_asset(registry.asset(asset_id), registry)]
+        return {registry.asset(asset_id).name() for asset_id in found_ids}
+
+    assert found("color:blue") == {"tall_t.png", "wide_t.png"}
+    assert found("color:white") == {"square_crossed_t.png", "staff.png"}
+    # Only the colors that cover a good part of the image count, `tall.png` has a bit of blue as well.
+    assert found("color:#0000ff") == {"tall_t.png", "wide_t.png"}
+    assert found("color:3040c0 and not color:white") == {"tall_t.png", "wide_t.png"}
+    assert found("color:navy") == set()
+
+    with pytest.raises(data.QueryError):
+        data.parse_query("color:")
+    with pytest.raises(data.QueryError):
+        data.parse_query("color:nope")
+
+
+def test_analyses_are_kept_in_catalog(root_dir, monkeypatch):
+    asset_dir = data.recursive_load_asset_dir(root_dir)
+    assets = list(asset_dir.assets_recursive().values())
+    catalog = data.AssetCatalog(":memory:")
+
+    analyzer = data.ImageAnalyzer(catalog, max_workers=2)
+    analyzer.queue(assets)
+    analyzed = dict(wait_for(analyzer))
+    assert set(analyzed.keys()) == set(assets)
+    assert all(analysis is not None for analysis in analyzed.values())
+
+    def no_decoding(path):
+        raise AssertionError("Decoded {} again.".format(path))
+
+    # The files did not change, so the analyses come from the catalog.
+    monkeypatch.setattr(data.image_analyzer, "analyze_image", no_decoding)
+    analyzer.queue(assets)
+    assert dict(wait_for(analyzer)) == analyzed
+    analyzer.shutdown()
+
+
+def test_duplicates_are_announced(app):
+    analyzer = data.ImageAnalyzer(max_workers=1)
+    found = []
+    analyzer.duplicates_found.connect(found.append)
+    analyzer.find_duplicates([(0, 0b1111), (1, 0b0111), (2, 0b1111 << 60)])
+
+    deadline = time.monotonic() + 10
+    while len(found) == 0 and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    assert [sorted(group) for group in found[0]] == [[0, 1]]
+    analyzer.shutdown()
+
+
+def test_duplicates_are_announced_after_errors(app, monkeypatch):
+    def broken_groups(ids_and_hashes):
+        raise ValueError("Broken")
+    monkeypatch.setattr(data.image_analyzer, "duplicate_groups", broken_groups)
+
+    analyzer = data.ImageAnalyzer(max_workers=1)
+    found = []
+    analyzer.duplicates_found.connect(found.append)
+    analyzer.find_duplicates([(0, 0b1111), (1, 0b0111)])
+
+    deadline = time.monotonic() + 10
+    while len(found) == 0 and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    assert found == [[]]
+    analyzer.shutdown()
@@ -0,0 +1,29 @@
+import pathlib
+
+import data
+
+UNSCANNED_DIR = "unscanned_asset_dir"
+
+
+def test_library_snapshot_round_trip(files_dir):
+    """
+    Test if a restored library is the same as the saved one, and can be verified without reading it again.
+    """
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    data.recursive_save_asset_dir(asset_dir)
+    next(iter(asset_dir.assets_recursive().values())).add_tag("sword")
+
+    data.save_library_snapshot("config", [asset_dir])
+    restored = data.load_library_snapshot("config")[asset_dir.absolute_path()]
+
+    assert {(asset.absolute_path(), asset.uuid(), frozenset(asset.tags()), asset.inode(), asset.png_header())
+            for asset in restored.assets_recursive().values()} == \
+           {(asset.absolute_path(), asset.uuid(), frozenset(asset.tags()), asset.inode(), asset.png_header())
+            for asset in asset_dir.assets_recursive().values()}
+    assert data.scan_statistics.count_directories(restored.scan_state()) == \
+           data.scan_statistics.count_directories(asset_dir.scan_state())
+
+    # Nothing changed on disk, so the verification scan keeps the whole restored tree.
+    assert data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR), restored) is restored
+
+    assert data.load_library_snapshot("does_not_exist") == {}
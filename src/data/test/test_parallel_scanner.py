@@ -0,0 +1,220 @@
+import os
+import pathlib
+import uuid
+
+import pytest
+
+import data
+from data.load_scan_save import CONFIG_FILE_NAME, load_asset_dir_contents
+
+UNSCANNED_DIR = "unscanned_asset_dir"
+
+
+def tree_paths(asset_dir):
+    """
+    :return: Set of the relative paths of all the assets in the tree.
+    """
+    return {str(asset.relative_path(asset_dir.absolute_path())) for asset in asset_dir.assets_recursive().values()}
+
+
+def test_parallel_scan_matches_recursive_load(files_dir):
+    """
+    Test if scanning with multiple workers builds the same tree as the single threaded loader.
+    """
+    scanner = data.ParallelScanner(4)
+    job = scanner.submit(pathlib.Path(UNSCANNED_DIR))
+    asset_dir = job.future().result(timeout=10)
+    scanner.shutdown()
+
+    expected = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+
+    assert asset_dir.absolute_path() == expected.absolute_path()
+    assert set(asset_dir.subdirs().keys()) == set(expected.subdirs().keys())
+    assert asset_dir.asset_count_recursive() == 7
+    assert tree_paths(asset_dir) == tree_paths(expected)
+
+
+def test_parallel_scan_multiple_roots(files_dir):
+    """
+    Test if several roots can be scanned at the same time.
+    """
+    scanner = data.ParallelScanner(2)
+    swords = scanner.submit(pathlib.Path(UNSCANNED_DIR).joinpath("swords"))
+    transparent = scanner.submit(pathlib.Path(UNSCANNED_DIR).joinpath("swords_transparent"))
+
+    assert swords.future().result(timeout=10).asset_count() == 3
+    assert transparent.future().result(timeout=10).asset_count() == 3
+    scanner.shutdown()
+
+
+def test_parallel_scan_missing_root(files_dir):
+    """
+    Test if scanning a directory that does not exist fails the job instead of hanging.
+    """
+    scanner = data.ParallelScanner(2)
+    job = scanner.submit(pathlib.Path("does_not_exist"))
+
+    with pytest.raises(OSError):
+        job.future().result(timeout=10)
+    scanner.shutdown()
+
+
+def test_failure_while_building_fails_job(files_dir, monkeypatch):
+    """
+    Test if an error while putting the tree together ends up in the job, instead of leaving it unfinished.
+    """
+    def broken_build(*args, **kwargs):
+        raise ValueError("Broken")
+    monkeypatch.setattr(data.parallel_scanner, "build_asset_dir", broken_build)
+
+    scanner = data.ParallelScanner(2)
+    job = scanner.submit(pathlib.Path(UNSCANNED_DIR))
+    with pytest.raises(ValueError):
+        job.future().result(timeout=10)
+    scanner.shutdown()
+
+
+def test_parallel_rescan_reuses_unchanged_tree(root_dir):
+    """
+    Test if scanning again with the previous result gives back the same tree when nothing changed.
+    """
+    scanner = data.ParallelScanner(4)
+    first_scan = scanner.submit(root_dir).future().result(timeout=10)
+    rescan = scanner.submit(root_dir, previous=first_scan).future().result(timeout=10)
+    scanner.shutdown()
+
+    assert rescan is first_scan
+
+
+def test_parallel_rescan_leaves_previous_tree_alone(root_dir):
+    """
+    Test if a rescan only moves the reused directories over to the new tree once its result is taken.
+    """
+    scanner = data.ParallelScanner(4)
+    first_scan = scanner.submit(root_dir).result(timeout=10)
+    swords = first_scan.subdirs()[pathlib.Path("swords")]
+
+    # Only the root changes, the subdirectories are reused.
+    root_dir.joinpath("new_sword.png").touch()
+    os.utime(root_dir, ns=(0, 0))
+    job = scanner.submit(root_dir, previous=first_scan)
+    job.future().result(timeout=10)
+    assert swords.parent() is first_scan
+
+    rescan = job.result(timeout=10)
+    scanner.shutdown()
+
+    assert rescan is not first_scan
+    assert rescan.subdirs()[pathlib.Path("swords")] is swords
+    assert swords.parent() is rescan
+    assert rescan.asset_count_recursive() == 8
+
+
+def test_parallel_rescan_updates_previous_assets_in_result(root_dir):
+    """
+    Test if the image headers that a rescan reads for the assets of the earlier tree are only given to them once the
+    result is taken.
+    """
+    scanner = data.ParallelScanner(4)
+    first_scan = scanner.submit(root_dir).result(timeout=10)
+    swords = first_scan.subdirs()[pathlib.Path("swords")]
+    asset = next(iter(swords.assets().values()))
+    asset.set_packed_png_header(None)
+
+    # Make sure the directory is read again.
+    os.utime(swords.absolute_path(), ns=(0, 0))
+    job = scanner.submit(root_dir, previous=first_scan)
+    job.future().result(timeout=10)
+    assert not asset.png_header_known()
+
+    job.result(timeout=10)
+    scanner.shutdown()
+
+    assert asset.png_header_known()
+
+
+def test_partial_results(files_dir):
+    """
+    Test if the assets of every directory are handed out as partial results.
+    """
+    scanner = data.ParallelScanner(4)
+    job = scanner.submit(pathlib.Path(UNSCANNED_DIR))
+    asset_dir = job.future().result(timeout=10)
+    scanner.shutdown()
+
+    partial_assets = {}
+    for _, assets in job.take_partial_results():
+        partial_assets.update(assets)
+
+    assert partial_assets.keys() == asset_dir.assets_recursive().keys()
+    # Partial results are only handed out once.
+    assert job.take_partial_results() == []
+
+
+def test_prioritize_and_cancel(files_dir):
+    """
+    Test if jobs start in the order they were submitted, unless prioritized, and if queued jobs can be cancelled.
+    """
+    scanner = data.ParallelScanner(1)
+    # Without running workers nothing gets started, so the queue stays as it is.
+    scanner.shutdown()
+
+    first = scanner.submit(pathlib.Path(UNSCANNED_DIR).joinpath("swords"))
+    second = scanner.submit(pathlib.Path(UNSCANNED_DIR).joinpath("swords_transparent"))
+    third = scanner.submit(pathlib.Path(UNSCANNED_DIR).joinpath("deep_nested_assets"))
+    assert scanner.queued_jobs() == [first, second, third]
+
+    scanner.prioritize(third)
+    assert scanner.queued_jobs() == [third, first, second]
+
+    assert scanner.cancel(first)
+    assert scanner.queued_jobs() == [third, second]
+    with pytest.raises(data.ScanCancelledError):
+        first.future().result(timeout=10)
+
+
+def test_scan_statistics(files_dir):
+    """
+    Test if the scan counters add up to what was scanned.
+    """
+    scanner = data.ParallelScanner(4)
+    job = scanner.submit(pathlib.Path(UNSCANNED_DIR))
+    asset_dir = job.future().result(timeout=10)
+    scanner.shutdown()
+
+    statistics = job.statistics()
+    assert statistics.assets_found() == 7
+    assert statistics.directories_visited() == data.scan_statistics.count_directories(asset_dir.scan_state())
+    assert statistics.directories_unchanged() == 0
+    # Every directory except the root is also an entry in its parent directory.
+    assert statistics.files_seen() >= statistics.directories_visited() - 1 + 7
+
+
+def test_async_loader_notifies_through_event_loop(app):
+    """
+    Test if the results are announced from the event loop, never from inside the call that queued the scan.
+    """
+    loader = data.AsyncLoader(max_workers=2)
+    notifications = []
+    loader.results_available.connect(lambda: notifications.append(True))
+
+    # What happens in `queue_scan` when the scan is already done.
+    loader._notify()
+    assert notifications == []
+
+    app.processEvents()
+    assert notifications == [True]
+
+
+def test_scan_statistics_count_bytes(root_dir):
+    """
+    Test if what is read from the config files is counted in bytes, not in characters.
+    """
+    config_path = root_dir.joinpath("swords", CONFIG_FILE_NAME)
+    config = '{"version": 1, "assets": {"sword.png": {"uuid": "%s", "tags": ["\u00e9p\u00e9e"]}}}' % uuid.uuid4()
+    config_path.write_bytes(config.encode("utf-8"))
+
+    statistics = data.ScanStatistics()
+    load_asset_dir_contents(root_dir.joinpath("swords"), statistics=statistics)
+
+    assert statistics.bytes_read() == config_path.stat().st_size
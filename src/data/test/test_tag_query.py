@@ -0,0 +1,121 @@
+import pathlib
+
+import pytest
+
+import data
+
+UNSCANNED_DIR = "unscanned_asset_dir"
+
+
+@pytest.fixture
+def registry(files_dir):
+    """
+    Loads the `unscanned_asset_dir` from a fake filesystem into a registry, and tags some of the assets.
+    :return: The `AssetRegistry`.
+    """
+    asset_dir = data.recursive_load_asset_dir(pathlib.Path(UNSCANNED_DIR))
+    registry = data.AssetRegistry()
+    registry.attach(asset_dir)
+
+    assets = {asset.name(): asset for asset in asset_dir.assets_recursive().values()}
+    assets["tall.png"].set_tags({"sword", "long"})
+    assets["wide.png"].set_tags({"sword"})
+    assets["tall_t.png"].set_tags({"sword", "transparent"})
+    assets["staff.png"].set_tags({"long"})
+    return registry
+
+
+def search(registry, text) -> set:
+    """
+    :return: The names of the assets that match the query.
+    """
+    bits = data.parse_query(text).matching_bits(registry)
+    return {registry.get(asset_uuid).name() for asset_uuid in registry.uuids_of_bits(bits)}
+
+
+def test_query(registry):
+    assert search(registry, "sword") == {"tall.png", "wide.png", "tall_t.png"}
+    assert search(registry, "sword long") == {"tall.png"}
+    assert search(registry, "sword OR long") == {"tall.png", "wide.png", "tall_t.png", "staff.png"}
+    assert search(registry, "sword and not (long or transparent)") == {"wide.png"}
+    assert search(registry, "not sword and not long") == search(registry, "UNTAGGED")
+    assert len(search(registry, "UNTAGGED")) == 3
+    assert search(registry, "never_used or \"never used\"") == set()
+
+
+def test_query_dir_scope(registry):
+    assert search(registry, "sword dir:swords") == {"tall.png", "wide.png"}
+    assert search(registry, "dir:unscanned_asset_dir/swords_transparent") == {"square_crossed_t.png", "tall_t.png",
+                                                                             "wide_t.png"}
+    # Filtering the few assets found so far, instead of gathering the whole directory.
+    assert search(registry, "transparent dir:swords_transparent") == {"tall_t.png"}
+
+
+def test_query_name_and_path(registry):
+    assert search(registry, "name:TALL") == {"tall.png", "tall_t.png"}
+    assert search(registry, "name:_t") == {"tall_t.png", "wide_t.png", "square_crossed_t.png"}
+    assert search(registry, "name:\"crossed_t.png\" or name:f") == {"square_crossed_t.png", "staff.png"}
+    assert search(registry, "path:ords/ta") == {"tall.png"}
+    assert search(registry, "path:level_2/") == {"staff.png"}
+    assert search(registry, "path:unscanned_asset_dir\\swords_t") == {"square_crossed_t.png", "tall_t.png",
+                                                                      "wide_t.png"}
+    assert search(registry, "path:/wide") == {"wide.png", "wide_t.png"}
+    assert search(registry, "sword path:wide") == {"wide.png"}
+    assert data.parse_query("name:tall or not path:ab").shortest_text() == 2
+    assert data.parse_query("sword dir:swords").shortest_text() is None
+
+
+def test_query_image_header(registry):
+    assert search(registry, "size:400x400") == {"square_crossed.png", "square_crossed_t.png"}
+    assert search(registry, "width:>400") == {"wide.png", "wide_t.png"}
+    assert search(registry, "height:<=350 width:<600") == {"staff.png"}
+    assert search(registry, "size:300-600") == {"square_crossed.png", "square_crossed_t.png", "tall.png", "wide.png",
+                                                "tall_t.png", "wide_t.png"}
+    assert search(registry, "alpha:no") == {"staff.png"}
+    assert search(registry, "depth:8") == search(registry, "size:>=0")
+    assert len(search(registry, "size:>=0")) == 7
+    staff = next(asset for asset in registry.assets_with_tag("long").values() if asset.name() == "staff.png")
+    assert data.parse_query("size:120x320 alpha:no").matches_asset(staff, registry)
+    assert not data.parse_query("width:<100").matches_asset(staff, registry)
+def test_name_index_follows_renames(registry):
+    tall = next(asset for asset in registry.assets_with_tag("long").values() if asset.name() == "tall.png")
+    registry.add_assets([tall.moved_to(pathlib.Path(tall.dir_path(), "broad.png"))])
+    assert search(registry, "name:tall") == {"tall_t.png"}
+    assert search(registry, "name:road") == {"broad.png"}
+    assert data.parse_query("name:road").matches_asset(registry.get(tall.uuid()), registry)
+    assert data.parse_query("path:swords/broad").matches_asset(registry.get(tall.uuid()), registry)
+
+
+@pytest.mark.parametrize("text", ["", "sword and", "(sword", "sword)", "\"sword", "dir:", "or", "name:", "path:\"\"",
+                                  "width:", "size:12x", "height:>>3", "alpha:maybe"])
+def test_invalid_query(text):
+    with pytest.raises(data.QueryError):
+        data.parse_query(text)
+
+
+def test_live_query(registry):
+    changes = []
+    live = data.LiveQuery(data.parse_query("sword not transparent"), registry,
+                          lambda added, removed, updated: changes.append((added, removed, updated)))
+    names = {asset.name(): asset for asset in registry.assets_with_tag("sword").values()}
+    assert {asset.name() for asset in live} == {"tall.png", "wide.png"}
+
+    names["tall_t.png"].set_tags({"sword"})
+    assert changes[-1] == ({names["tall_t.png"].uuid(): names["tall_t.png"]}, [], {})
+    names["wide.png"].set_tags(set())
+    assert changes[-1] == ({}, [names["wide.png"].uuid()], {})
+
+    assert len(live) == 2
+    assert {asset.name() for asset in live.slice(0, 2)} == {"tall.png", "tall_t.png"}
+    assert live.slice(1, 5) == live.slice(0, 2)[1:]
+    assert live.contains(names["tall_t.png"].uuid())
+    assert not live.contains(names["wide.png"].uuid())
+
+    # Changes to assets that never match don't reach the views.
+    count = len(changes)
+    names["wide.png"].set_tags({"shield"})
+    assert len(changes) == count
+
+    live.close()
+    names["wide.png"].set_tags({"sword"})
+    assert len(changes) == count
@@ -17,15 +17,34 @@ class MainWindow(Qwidgets.QMainWindow):
     # How large can the pixmap cache grow? In Mb.
     PIXMAP_MEMORY_CACHE_LIMIT = 200
 
-    # How often should we check up on our async loader?
     # In milliseconds.
-    ASYNC_CHECK_INTERVAL = 200
+    AUTOSAVE_INTERVAL = 60000
+    # How often the changes in the journals are written to the config files of the asset directories.
+    # In milliseconds.
+    JOURNAL_COMPACT_INTERVAL = 600000
+    # How long closing the program waits for the asset directories to be written.
+    # In seconds.
+    EXIT_SAVE_TIMEOUT = 10
 
+    # How often the scan progress in the status bar is updated while scanning.
     # In milliseconds.
-    AUTOSAVE_INTERVAL = 60000
+    SCAN_PROGRESS_INTERVAL = 500
+
+    # How many directories are read in parallel when scanning asset directories.
+    # `None` lets the loader decide based on the number of cores.
+    SCAN_WORKERS = None
+    # How many images are analyzed in parallel. `None` lets the analyzer decide based on the number of cores.
+    ANALYSIS_WORKERS = None
+    # Seconds the image analysis holds off after each scroll, so the thumbnails of the scrolled to assets load first.
+    SCROLL_ANALYSIS_PAUSE = 0.5
 
-    UNTAGGED_SEARCH_KEY = "UNTAGGED"
+    UNTAGGED_SEARCH_KEY = data.tag_query.UNTAGGED_KEYWORD
     SEARCH_BOX_MINIMUM_WIDTH = 200
+    # Time in ms after the last key press before a typed search is run.
+    SEARCH_TYPING_DELAY = 150
+    # Typed searches for file names or paths need at least this many characters. Shorter ones find so many assets that
+    # they are slow in large libraries, they run when pressing return.
+    SEARCH_TYPING_MIN_TEXT = 3
 
     def __init__(self):
         super().__init__()
@@ -35,11 +54,30 @@ class MainWindow(Qwidgets.QMainWindow):
 
         # pathlib.Path -> AssetDir
         self.asset_dirs = {}
+        # The directories in `asset_dirs` with changes that are not saved yet.
+        self.dirty_asset_dirs = data.DirtyAssetDirs()
+        # Every asset in the asset dirs, by uuid, and which have what tags. The asset views look up what they show in
+        # here, and searches run on it.
+        self.asset_registry = data.AssetRegistry()
+        # The `LiveQuery` of the search that the asset views are showing. `None` when they show asset dirs.
+        self.live_search = None
+        # The directories with changes that are only saved in the journals of the asset dirs so far.
+        self.asset_journal = data.AssetJournal()
+        # Paths of the asset dirs in `asset_dirs` that only contain what was found so far by a scan in progress.
+        self.partially_loaded_dirs = set()
+        # pathlib.Path -> number of directories the last scan of an asset dir visited.
+        # Used to estimate the remaining time of a scan.
+        self.scan_sizes = {}
         # The last directory that the file dialog was in.
         self.last_dialog_directory = pathlib.Path()
 
         self.known_tags = set()
 
+        # Central catalog of all the assets, so the asset dirs don't have to be read in full at startup.
+        # `None` when it is turned off, or could not be opened.
+        self.catalog = None
+        self.use_catalog = True
+
         # Application config goes into appdata (or platform equivalent)
         # The asset pack configuration will be saved in their respective directories.
         self.config_dir = Qcore.QStandardPaths.writableLocation(Qcore.QStandardPaths.AppConfigLocation)
@@ -53,38 +91,94 @@ class MainWindow(Qwidgets.QMainWindow):
         if not os.path.isdir(cache_dir):
             os.makedirs(cache_dir)
 
-        self.async_loader = data.AsyncLoader()
+        self.async_loader = data.AsyncLoader(self.SCAN_WORKERS)
+        # The loader lets us know as soon as there is something new, from its worker threads.
+        # The signal is queued, so the results are always handled on this thread.
+        self.async_loader.results_available.connect(self.check_on_async_loader)
+
+        # Picks up assets that are added, removed, or renamed while the program runs, without rescanning.
+        self.asset_dir_watcher = data.AssetDirWatcher()
+        self.asset_dir_watcher.assets_changed.connect(self.on_asset_dir_changed)
+
+        # Writes the asset directories and the catalog on a background thread, so a slow disk doesn't block the GUI.
+        self.asset_saver = data.AsyncSaver()
+        self.asset_saver.batch_done.connect(self.on_asset_dirs_saved)
+        self.asset_saver.journal_failed.connect(self.on_journal_failed)
+        self.asset_saver.stats_measured.connect(self.on_asset_stats_measured)
+
+        # Looks at the pixels of every asset in the background, to find the images that look the same.
+        self.image_analyzer = data.ImageAnalyzer(max_workers=self.ANALYSIS_WORKERS)
+        self.image_analyzer.results_available.connect(self.on_image_analyses_available)
+        self.image_analyzer.duplicates_found.connect(self.on_duplicates_found)
+        # Follows the registry, and hands every new asset to the analyzer.
+        self.image_analyses = data.AnalysisIndex(self.asset_registry, self.image_analyzer.queue)
+        # Tuples of the uuids of the groups of images that look the same, that the asset views are showing.
+        self.duplicate_groups = []
 
         # ---- Timers ----
 
-        # Timer so we can check up on the loader every so often.
-        self.async_update_timer = Qcore.QTimer()
-        self.async_update_timer.setInterval(self.ASYNC_CHECK_INTERVAL)
-        self.async_update_timer.timeout.connect(self.check_on_async_loader)
+        # Keeps the scan progress in the status bar up to date while scanning.
+        self.scan_progress_timer = Qcore.QTimer()
+        self.scan_progress_timer.setInterval(self.SCAN_PROGRESS_INTERVAL)
+        self.scan_progress_timer.timeout.connect(self.show_loading_status)
 
         # Autosave interval.
         # We save the asset info at exit, but we also want to save it regularly in between.
-        # Due to the way the AssetDir saving works, only directories with changed assets will actually be saved.
+        # Only the directories with changed assets are visited and saved.
         self.autosave_timer = Qcore.QTimer()
         self.autosave_timer.setInterval(self.AUTOSAVE_INTERVAL)
         # Only save the asset directories on autosave. The global config gets saved as soon as it changes.
         self.autosave_timer.timeout.connect(self.save_asset_dirs)
         self.autosave_timer.start()
 
+        # Autosave only appends the changes to the journals. Every now and then they are written to the config files.
+        self.journal_compact_timer = Qcore.QTimer()
+        self.journal_compact_timer.setInterval(self.JOURNAL_COMPACT_INTERVAL)
+        self.journal_compact_timer.timeout.connect(self.compact_journals)
+        self.journal_compact_timer.start()
+
+        # Searches while the user is typing, once they pause.
+        self.search_typing_timer = Qcore.QTimer()
+        self.search_typing_timer.setSingleShot(True)
+        self.search_typing_timer.setInterval(self.SEARCH_TYPING_DELAY)
+        self.search_typing_timer.timeout.connect(self.on_search_typed)
+
         # ---- Menu ----
 
         add_asset_dirs_action = Qwidgets.QAction(self.tr("Add asset directories"), parent=self)
         add_asset_dirs_action.triggered.connect(self.open_directory_dialog_to_add_asset_directories)
 
+        rescan_asset_dirs_action = Qwidgets.QAction(self.tr("Rescan asset directories"), parent=self)
+        rescan_asset_dirs_action.setStatusTip(
+            self.tr("Looks for added and removed assets. Only directories that changed on disk are read again."))
+        rescan_asset_dirs_action.triggered.connect(self.rescan_asset_dirs)
+
+        self.use_catalog_action = Qwidgets.QAction(self.tr("Keep asset catalog"), parent=self)
+        self.use_catalog_action.setCheckable(True)
+        self.use_catalog_action.setStatusTip(
+            self.tr("Keeps a central catalog of all assets, so asset directories don't have to be read in full "
+                    "at startup."))
+        self.use_catalog_action.toggled.connect(self.set_use_catalog)
+
         clear_thumbnail_cache_action = Qwidgets.QAction(self.tr("Clear thumbnail cache"), parent=self)
         clear_thumbnail_cache_action.setStatusTip(
             self.tr("Clears the thumbnail cache in memory as well as on the disk."))
         clear_thumbnail_cache_action.triggered.connect(self.clear_thumbnail_caches)
 
+        find_duplicates_action = Qwidgets.QAction(self.tr("Find duplicate images"), parent=self)
+        find_duplicates_action.setStatusTip(
+            self.tr("Groups the shown images that look the same. Images that are still being analyzed are left out."))
+        find_duplicates_action.triggered.connect(self.find_duplicates)
+
         menu = self.menuBar().addMenu(self.tr("&File"))
         menu.addAction(add_asset_dirs_action)
+        menu.addAction(rescan_asset_dirs_action)
+        menu.addAction(self.use_catalog_action)
         menu.addAction(clear_thumbnail_cache_action)
 
+        menu = self.menuBar().addMenu(self.tr("&Images"))
+        menu.addAction(find_duplicates_action)
+
         # ---- Layout ----
 
         # Enable the status bar.
@@ -143,6 +237,27 @@ class MainWindow(Qwidgets.QMainWindow):
         asset_list_bar_layout.addWidget(self.tag_search_box)
         asset_list_bar_layout.setStretch(0, 1)
 
+        # How the assets are sorted, remembered for the grid and the list separately.
+        self.sort_box = Qwidgets.QComboBox()
+        self.sort_box.addItem(self.tr("Unsorted"), None)
+        for sort_key, label in ((data.sort_order.SORT_NAME, self.tr("Name")),
+                                (data.sort_order.SORT_DIRECTORY, self.tr("Directory")),
+                                (data.sort_order.SORT_SIZE, self.tr("File size")),
+                                (data.sort_order.SORT_MODIFIED, self.tr("Modified")),
+                                (data.sort_order.SORT_TAG_COUNT, self.tr("Number of tags")),
+                                (data.sort_order.SORT_IMAGE_SIZE, self.tr("Image size"))):
+            self.sort_box.addItem(label, sort_key)
+        asset_list_bar_layout.addWidget(self.sort_box)
+
+        self.sort_descending_button = Qwidgets.QPushButton(self.tr("Descending"))
+        self.sort_descending_button.setCheckable(True)
+        asset_list_bar_layout.addWidget(self.sort_descending_button)
+
+        # Selects a group of duplicates in the asset views. Only shown while they show duplicates.
+        self.duplicate_group_box = Qwidgets.QComboBox()
+        self.duplicate_group_box.hide()
+        asset_list_bar_layout.addWidget(self.duplicate_group_box)
+
         # Add list / grid switcher button.
         self.list_grid_switch_button = Qwidgets.QPushButton(self.tr("List"))
         asset_list_bar_layout.addWidget(self.list_grid_switch_button)
@@ -167,11 +282,21 @@ class MainWindow(Qwidgets.QMainWindow):
         # ---- Connections ----
 
         self.asset_dir_list_widget.selection_changed.connect(self.on_asset_dir_selection_changed)
+        self.asset_dir_list_widget.asset_dirs_removed.connect(self.on_packs_removed)
         self.asset_list_widget.selection_changed.connect(self.on_asset_selection_changed)
         self.asset_flow_grid.selection_changed.connect(self.on_asset_selection_changed)
+        self.asset_list_widget.scrolled.connect(self.on_assets_scrolled)
+        self.asset_flow_grid.scrolled.connect(self.on_assets_scrolled)
         self.list_grid_switch_button.pressed.connect(self.switch_between_grid_and_list_view)
+        self.sort_box.activated.connect(self.on_sort_order_changed)
+        self.sort_descending_button.clicked.connect(self.on_sort_order_changed)
+        self.duplicate_group_box.activated.connect(self.on_duplicate_group_selected)
 
         self.tag_search_box.activated.connect(self.on_selected_search_tag_changed)
+        # Typed searches that are not one of the tags in the list.
+        self.tag_search_box.lineEdit().returnPressed.connect(self.on_selected_search_tag_changed)
+        # Only edits by the user, not the text changes from adding known tags.
+        self.tag_search_box.lineEdit().textEdited.connect(self.on_search_text_edited)
 
         self.asset_details_widget.tag_display().new_tag.connect(self.user_added_new_tag)
 
@@ -185,6 +310,24 @@ class MainWindow(Qwidgets.QMainWindow):
         So we can save our current configuration, before closing.
         """
         self.save_config()
+        # Autosave only saves the directories it was told about. Make sure nothing was missed.
+        self.save_all_asset_dirs()
+        self.asset_dir_watcher.shutdown()
+        # What is not analyzed yet is picked up again next time.
+        self.image_analyzer.shutdown()
+        if not self.asset_saver.shutdown(self.EXIT_SAVE_TIMEOUT):
+            logging.warning(self.tr("Not all asset directories could be saved in time. {} are not saved.".format(
+                self.asset_saver.pending_count())))
+        elif self.catalog is not None:
+            # Still in use when the saver did not finish.
+            self.catalog.close()
+
+        # So the next startup can show the library right away.
+        try:
+            data.save_library_snapshot(self.config_dir, [asset_dir for path, asset_dir in self.asset_dirs.items()
+                                                         if path not in self.partially_loaded_dirs])
+        except OSError as e:
+            logging.warning(self.tr("Could not save library snapshot. Reason: {}".format(e)))
 
         # Close.
         event.accept()
@@ -200,6 +343,27 @@ class MainWindow(Qwidgets.QMainWindow):
             # Switch to the list.
             self.asset_list_display_stack.setCurrentIndex(1)
             self.list_grid_switch_button.setText(self.tr("Grid"))
+        self.show_sort_order()
+
+    def asset_views(self) -> dict:
+        """
+        :return: Name -> asset view widget, the names are used in the config.
+        """
+        return {"grid": self.asset_flow_grid, "list": self.asset_list_widget}
+
+    def show_sort_order(self):
+        """
+        Shows the sort order of the visible asset view in the sort controls.
+        """
+        sort_key, descending = self.asset_list_display_stack.currentWidget().sort_order()
+        self.sort_box.setCurrentIndex(self.sort_box.findData(sort_key))
+        self.sort_descending_button.setChecked(descending)
+
+    @Qcore.pyqtSlot()
+    def on_sort_order_changed(self):
+        self.asset_list_display_stack.currentWidget().set_sort_order(self.sort_box.currentData(),
+                                                                     self.sort_descending_button.isChecked())
+        self.save_config()
 
     def open_directory_dialog_to_add_asset_directories(self):
         # We use a semi-custom dialog to allow selecting multiple directories.
@@ -241,52 +405,227 @@ class MainWindow(Qwidgets.QMainWindow):
                 continue
 
             # Check for duplicates in the scanner queue, or currently active scan.
-            if dir_path in self.async_loader.scan_queue() or dir_path == self.async_loader.currently_scanning():
+            if dir_path in self.async_loader.scan_queue() or dir_path in self.async_loader.currently_scanning():
                 # Duplicate!
                 logging.info(self.tr("Asset dir is already being loaded: \"{}\"".format(dir_path)))
                 continue
 
-            # Queue up the new asset directories.
-            logging.info(self.tr("Queued new asset directory: \"{}\"".format(dir_path)))
-            self.async_loader.queue_scan(dir_path)
+            self.queue_new_asset_dir(dir_path)
+
+        self.show_loading_status()
 
-        # Check up on the loading every so often.
-        self.async_update_timer.start()
+    def queue_new_asset_dir(self, dir_path: pathlib.Path, previous: AssetDir = None):
+        """
+        Queues the scan of a new asset dir.
+        The asset dir is listed right away, and fills up while it is being scanned.
+        :param previous: What the asset dir looked like before, for example from the library snapshot.
+                         When not given, the catalog is asked.
+        """
+        logging.info(self.tr("Queued new asset directory: \"{}\"".format(dir_path)))
+
+        if previous is None and self.catalog is not None:
+            previous = self.catalog.load_asset_dir(dir_path)
+        if previous is not None:
+            # Show what we know right away. The scan verifies it, and only reads the directories that changed since.
+            self.async_loader.queue_scan(dir_path, previous=previous)
+            self.asset_dirs[dir_path] = previous
+            self.dirty_asset_dirs.attach(previous)
+            self.asset_registry.attach(previous)
+            self.update_known_tags(previous.known_tags_recursive())
+            self.asset_dir_list_widget.on_new_asset_dir(dir_path)
+            return
+
+        self.async_loader.queue_scan(dir_path, expected_directories=self.scan_sizes.get(dir_path))
+
+        # The assets belong to the directories the scan builds, this one only shows them in the meantime.
+        self.asset_dirs[dir_path] = AssetDir(dir_path, {}, {}, owns_assets=False)
+        self.asset_registry.attach(self.asset_dirs[dir_path])
+        self.partially_loaded_dirs.add(dir_path)
+        self.asset_dir_list_widget.on_new_asset_dir(dir_path)
+
+    @Qcore.pyqtSlot()
+    def rescan_asset_dirs(self):
+        """
+        Scans all loaded asset directories again, reusing everything that did not change on disk.
+        """
+        in_progress = self.async_loader.currently_scanning() + self.async_loader.scan_queue()
+        for dir_path, asset_dir in self.asset_dirs.items():
+            if dir_path in in_progress:
+                continue
+
+            logging.info(self.tr("Queued rescan of asset directory: \"{}\"".format(dir_path)))
+            # The rescan picks up any changes, and the tree must not change while it is being compared.
+            # Watching starts again once the rescan is done.
+            self.asset_dir_watcher.unwatch(dir_path)
+            if dir_path in self.partially_loaded_dirs:
+                # The earlier scan did not finish, so there is nothing to compare with.
+                self.async_loader.queue_scan(dir_path, expected_directories=self.scan_sizes.get(dir_path))
+            else:
+                self.async_loader.queue_scan(dir_path, previous=asset_dir)
+
+        self.show_loading_status()
 
     @Qcore.pyqtSlot()
     def check_on_async_loader(self):
-        results = self.async_loader.get_maybe_result()
+        # Show what was found so far, before any full results replace it.
+        for root, partial_results in self.async_loader.get_partial_results():
+            self.on_asset_dir_partially_loaded(root, partial_results)
 
-        if results is not None:
+        results = self.async_loader.get_maybe_result()
+        while results is not None:
             self.on_asset_dir_load_complete(results)
+            results = self.async_loader.get_maybe_result()
+
+        self.show_loading_status()
 
+    @Qcore.pyqtSlot()
+    def show_loading_status(self):
         # Display what is currently being worked on.
-        in_progress = self.async_loader.currently_scanning()
-        if in_progress is not None:
+        if self.async_loader.is_busy():
             # TODO: show it somewhere else than the status bar?
-            self.statusBar().showMessage(self.tr("Loading: {}".format(in_progress)))
+            statistics = self.async_loader.scan_statistics()
+            message = self.tr("Loading {} asset directories ({} queued): "
+                              "{} directories, {} assets, {:.0f} entries/s").format(
+                len(self.async_loader.currently_scanning()), self.async_loader.queue_size(),
+                statistics.directories_visited(), statistics.assets_found(), statistics.entries_per_second())
+
+            remaining = statistics.remaining_seconds()
+            if remaining is not None:
+                message += self.tr(", about {:.0f}s left").format(remaining)
+
+            self.statusBar().showMessage(message)
+            self.scan_progress_timer.start()
         else:
             self.statusBar().showMessage(self.tr("Loading complete"))
-            # No need to check if nothing is happening.
-            self.async_update_timer.stop()
+            self.scan_progress_timer.stop()
+
+    def on_asset_dir_partially_loaded(self, root, partial_results):
+        """
+        Call when part of a new asset dir has been scanned.
+        Shows what was found so far, until `on_asset_dir_load_complete` replaces it with the full `AssetDir`.
+        :param root: Path of the asset dir that is being scanned.
+        :param partial_results: List of (directory path, uuid -> Asset dictionary) of the directories that were read.
+        """
+        root = pathlib.Path(root).absolute()
+
+        if root not in self.partially_loaded_dirs:
+            # This dir was already fully loaded, or it was removed.
+            return
+        partial_dir = self.asset_dirs[root]
+
+        new_assets = {}
+        for dir_path, assets in partial_results:
+            dir_path = pathlib.Path(dir_path).absolute()
+            if dir_path == root:
+                partial_dir.add_assets(assets)
+            else:
+                # Until the full tree is known, all directories are listed directly under the root.
+                partial_dir.add_subdir(dir_path.relative_to(root),
+                                       AssetDir(dir_path, {}, dict(assets), owns_assets=False))
+            new_assets.update(assets)
+
+        self.asset_dir_list_widget.update_asset_count(root)
+
+        # Add the new assets to the views if they are showing this asset dir.
+        if partial_dir in self.asset_dir_list_widget.get_selected_dirs():
+            self.asset_list_widget.add_assets(new_assets)
+            self.asset_flow_grid.add_assets(new_assets)
 
     def on_asset_dir_load_complete(self, new_dir: AssetDir):
         """
-        Call when a new asset dir has been loaded.
+        Call when a new asset dir has been loaded, or an existing one was scanned again.
         :param new_dir: The new `AssetDir`
         """
+        if new_dir.absolute_path() not in self.asset_dirs:
+            # Removed while it was being scanned.
+            return
+
+        # Keep the asset dir up to date from here on.
+        self.asset_dir_watcher.watch(new_dir)
+
+        old_dir = self.asset_dirs.get(new_dir.absolute_path())
+        if old_dir is new_dir:
+            # Rescanned, and nothing changed.
+            return
+        was_selected = old_dir in self.asset_dir_list_widget.get_selected_dirs()
+
+        # Changes to the old tree must not overwrite what the new scan found.
+        self.dirty_asset_dirs.detach(old_dir)
+        self.dirty_asset_dirs.attach(new_dir)
+        self.asset_registry.attach(new_dir)
         self.asset_dirs[new_dir.absolute_path()] = new_dir
+        self.partially_loaded_dirs.discard(new_dir.absolute_path())
+
+        if new_dir.scan_state() is not None:
+            # Remember the size, to estimate how long the next scan will take.
+            self.scan_sizes[new_dir.absolute_path()] = data.scan_statistics.count_directories(new_dir.scan_state())
 
         # Remember any new tags.
         self.update_known_tags(new_dir.known_tags_recursive())
 
         # Update the asset list.
-        self.asset_dir_list_widget.on_new_asset_dir(new_dir.absolute_path())
+        self.asset_dir_list_widget.update_asset_count(new_dir.absolute_path())
+        if was_selected:
+            # Only patch the views with what the scan changed, so the user keeps their place.
+            self.patch_views(old_dir.assets_recursive(), new_dir.assets_recursive())
+
+        # Save the new assets the scan found, and the changes replayed from the journal, so the catalog can mirror
+        # them.
+        self.compact_journal(new_dir.absolute_path())
+        if self.catalog is not None:
+            self.asset_saver.queue(*self.catalog.snapshot_changes(new_dir))
 
         # If we are done loading: save the newly added asset directory / directories.
-        if self.async_loader.queue_size() == 0:
+        if not self.async_loader.is_busy():
             self.save_config()
 
+    def patch_views(self, old_assets: dict, new_assets: dict):
+        """
+        Updates the asset views from one version of an asset dir to another.
+        :param old_assets: uuid -> Asset dictionary of what the views were showing.
+        :param new_assets: uuid -> Asset dictionary of what they should show now.
+        """
+        removed = [asset_uuid for asset_uuid in old_assets.keys() if asset_uuid not in new_assets]
+        added = {}
+        updated = {}
+        for asset_uuid, asset in new_assets.items():
+            old_asset = old_assets.get(asset_uuid)
+            if old_asset is None:
+                added[asset_uuid] = asset
+            elif old_asset is not asset:
+                updated[asset_uuid] = asset
+
+        for view in (self.asset_list_widget, self.asset_flow_grid):
+            view.remove_assets(removed)
+            view.update_assets(updated)
+            view.add_assets(added)
+
+    @Qcore.pyqtSlot(object, object, object, object)
+    def on_asset_dir_changed(self, root: pathlib.Path, added: dict, removed: list, updated: dict):
+        """
+        Call when the watcher applied changes on disk to an asset dir.
+        :param added: uuid -> Asset dictionary of new assets.
+        :param removed: uuids of the assets that are gone.
+        :param updated: uuid -> Asset dictionary of assets that were replaced, for example because they were renamed.
+        """
+        asset_dir = self.asset_dirs.get(root)
+        if asset_dir is None:
+            return
+
+        self.asset_dir_list_widget.update_asset_count(root)
+
+        new_tags = set()
+        for asset in list(added.values()) + list(updated.values()):
+            new_tags.update(asset.tags())
+        self.update_known_tags(new_tags)
+
+        # Only patch the views, instead of showing everything again, so the user keeps their place.
+        if asset_dir in self.asset_dir_list_widget.get_selected_dirs():
+            for view in (self.asset_list_widget, self.asset_flow_grid):
+                view.remove_assets(removed)
+                view.update_assets(updated)
+                view.add_assets(added)
+
     @Qcore.pyqtSlot(str)
     def user_added_new_tag(self, new_tag):
         self.update_known_tags([new_tag])
@@ -306,46 +645,145 @@ class MainWindow(Qwidgets.QMainWindow):
 
     @Qcore.pyqtSlot()
     def on_selected_search_tag_changed(self):
+        # Search for assets with a tag, or a combination of tags.
+        search_text = self.tag_search_box.currentText()
+        query = None
+        if search_text.strip() != "":
+            try:
+                query = data.parse_query(search_text)
+            except data.QueryError as e:
+                self.statusBar().showMessage(self.tr("Invalid search: {}").format(e))
+                return
+
         # When we search for tags, the selection in the asset dir list doesn't matter.
         self.asset_dir_list_widget.clear_selection()
 
-        # Search for assets with a tag.
-        search_tag = self.tag_search_box.currentText()
-        if search_tag == self.UNTAGGED_SEARCH_KEY:
-            search_tag = None
-
-        # TODO: this can be more efficient.
-        # Search through all the assets for the ones that have the given tag.
-        filtered_assets = {}
-        for asset_dir in self.asset_dirs.values():
-            assets = asset_dir.assets_recursive()
-            for asset in assets.values():
-                # Are we looking for untagged or a specific tag?
-                if search_tag is None:
-                    # Looking for untagged.
-                    if len(asset.tags()) == 0:
-                        # Found an untagged item.
-                        filtered_assets[asset.uuid()] = asset
-                else:
-                    # Looking for a tag.
-                    if search_tag in asset.tags():
-                        # Found one.
-                        filtered_assets[asset.uuid()] = asset
-
+        self.stop_live_search()
+        self.hide_duplicate_groups()
+        if query is None:
+            filtered_assets = data.AssetView.of_assets({})
+        else:
+            # The result follows tag changes, so it doesn't have to be searched again after every edit.
+            self.live_search = data.LiveQuery(query, self.asset_registry, self.on_search_results_changed)
+            filtered_assets = self.live_search
         self.asset_list_widget.show_assets(filtered_assets)
         self.asset_flow_grid.show_assets(filtered_assets)
 
+        if data.tag_query.COLOR_PREFIX in search_text.lower() and self.image_analyses.pending_count() > 0:
+            # Images are only found by color once they are analyzed.
+            self.statusBar().showMessage(self.tr("{} images are still being analyzed, search again to find them too.")
+                                         .format(self.image_analyses.pending_count()))
+
+    @Qcore.pyqtSlot(str)
+    def on_search_text_edited(self, _text):
+        # Starts over at every key press.
+        self.search_typing_timer.start()
+
+    @Qcore.pyqtSlot()
+    def on_search_typed(self):
+        search_text = self.tag_search_box.currentText()
+        if search_text.strip() == "":
+            return
+        try:
+            query = data.parse_query(search_text)
+        except data.QueryError:
+            # Probably not done typing yet. Pressing return shows what is wrong.
+            return
+        shortest_text = query.shortest_text()
+        if shortest_text is not None and shortest_text < self.SEARCH_TYPING_MIN_TEXT:
+            return
+        self.on_selected_search_tag_changed()
+
+    def stop_live_search(self):
+        if self.live_search is not None:
+            self.live_search.close()
+            self.live_search = None
+
+    def on_search_results_changed(self, added: dict, removed: list, updated: dict):
+        """
+        Patches the asset views with the assets that started, or stopped, matching the search.
+        Keeps the scroll position, and the selection of the assets that still match.
+        """
+        for view in (self.asset_list_widget, self.asset_flow_grid):
+            view.remove_assets(removed)
+            view.update_assets(updated)
+            view.add_assets(added)
+
     @Qcore.pyqtSlot()
     def on_asset_dir_selection_changed(self):
         # Show the selected asset directories in the asset list.
         selected_dirs = self.asset_dir_list_widget.get_selected_dirs()
-        assets = {}
+        if len(selected_dirs) == 0 and (self.live_search is not None or len(self.duplicate_groups) > 0):
+            # Cleared because of the search, or to show duplicates.
+            return
+        self.stop_live_search()
+        self.hide_duplicate_groups()
+        # Only refers to the assets in the directories, instead of gathering them all.
+        assets = data.AssetView.of_dirs(selected_dirs, self.asset_registry)
         for asset_dir in selected_dirs:
-            assets.update(asset_dir.assets_recursive())
+            # The user wants to see this one, so don't let it wait behind other scans.
+            if asset_dir.absolute_path() in self.partially_loaded_dirs:
+                self.async_loader.prioritize_scan(asset_dir.absolute_path())
 
         self.asset_list_widget.show_assets(assets)
         self.asset_flow_grid.show_assets(assets)
 
+    @Qcore.pyqtSlot()
+    def find_duplicates(self):
+        """
+        Looks for the images that look the same among the assets that are shown, on a worker thread.
+        """
+        assets = self.asset_list_display_stack.currentWidget().shown_assets()
+        ids_and_hashes = self.image_analyses.ids_and_hashes(assets.id_bits())
+        self.statusBar().showMessage(self.tr("Looking for duplicates among {} images.").format(len(ids_and_hashes)))
+        self.image_analyzer.find_duplicates(ids_and_hashes)
+
+    @Qcore.pyqtSlot(object)
+    def on_duplicates_found(self, groups: list):
+        """
+        Shows the groups of images that look the same in the asset views, one group after the other.
+        :param groups: List of lists of the registry ids in every group.
+        """
+        registry = self.asset_registry
+        # Assets that were removed in the meantime are left out.
+        groups = [[asset_id for asset_id in group if registry.asset(asset_id) is not None] for group in groups]
+        self.duplicate_groups = [registry.uuids_of_ids(group) for group in groups if len(group) > 1]
+
+        message = self.tr("Found {} groups of images that look the same.").format(len(self.duplicate_groups))
+        if self.image_analyses.pending_count() > 0:
+            message += self.tr(" {} images are still being analyzed.").format(self.image_analyses.pending_count())
+        self.statusBar().showMessage(message)
+
+        # Like a search, the duplicates are not of the selected directories.
+        self.stop_live_search()
+        self.asset_dir_list_widget.clear_selection()
+
+        self.duplicate_group_box.clear()
+        for group in self.duplicate_groups:
+            self.duplicate_group_box.addItem(self.tr("{} × {}").format(len(group), registry.get(group[0]).name()))
+        self.duplicate_group_box.setVisible(len(self.duplicate_groups) > 0)
+
+        assets = data.AssetView(self.duplicate_groups, registry)
+        self.asset_list_widget.show_assets(assets)
+        self.asset_flow_grid.show_assets(assets)
+
+    @Qcore.pyqtSlot(int)
+    def on_duplicate_group_selected(self, index: int):
+        self.asset_list_display_stack.currentWidget().select_assets(self.duplicate_groups[index])
+
+    def hide_duplicate_groups(self):
+        self.duplicate_groups = []
+        self.duplicate_group_box.clear()
+        self.duplicate_group_box.hide()
+
+    @Qcore.pyqtSlot()
+    def on_image_analyses_available(self):
+        self.image_analyses.add_results(self.image_analyzer.take_results())
+
+    @Qcore.pyqtSlot()
+    def on_assets_scrolled(self):
+        self.image_analyzer.pause(self.SCROLL_ANALYSIS_PAUSE)
+
     @Qcore.pyqtSlot()
     def on_asset_selection_changed(self):
         assets = []
@@ -357,7 +795,19 @@ class MainWindow(Qwidgets.QMainWindow):
             assets = self.asset_flow_grid.get_selected_assets()
         self.asset_details_widget.show_assets(assets)
 
-    def on_packs_removed(self):
+    @Qcore.pyqtSlot(list)
+    def on_packs_removed(self, removed_dirs: [pathlib.Path]):
+        # Don't spend any more time on scanning removed asset dirs.
+        for removed_dir in removed_dirs:
+            self.async_loader.cancel_scan(removed_dir)
+            self.asset_dir_watcher.unwatch(removed_dir)
+            self.asset_registry.detach(removed_dir)
+            self.asset_saver.forget_root(removed_dir)
+            # Whatever is still in its journal is replayed if it is ever added again.
+            self.asset_journal.forget(removed_dir)
+            self.partially_loaded_dirs.discard(removed_dir)
+
+        self.show_loading_status()
         self.save_config()
 
     @Qcore.pyqtSlot()
@@ -381,13 +831,27 @@ class MainWindow(Qwidgets.QMainWindow):
 
         # Remember where the directory dialog left off.
         self.last_dialog_directory = config.last_directory()
+        self.scan_sizes = dict(config.scan_sizes())
+
+        views = self.asset_views()
+        for view_name, (sort_key, descending) in config.sort_orders().items():
+            if view_name in views:
+                views[view_name].set_sort_order(sort_key, descending)
+        self.show_sort_order()
+
+        # Opens the catalog, before the asset directories need it.
+        self.set_use_catalog(config.use_catalog())
+        self.use_catalog_action.setChecked(config.use_catalog())
+
+        # What the asset directories looked like when the program was closed.
+        snapshot = data.load_library_snapshot(self.config_dir)
 
         # Queue the loading of the asset directories.
         for asset_dir in config.asset_dirs():
-            self.async_loader.queue_scan(asset_dir)
+            dir_path = pathlib.Path(asset_dir).absolute()
+            self.queue_new_asset_dir(dir_path, snapshot.get(dir_path))
 
-        # Check up on the loading every so often.
-        self.async_update_timer.start()
+        self.show_loading_status()
 
     def save_config(self):
         # First save the program config.
@@ -395,13 +859,19 @@ class MainWindow(Qwidgets.QMainWindow):
 
         # Also save asset dirs that were yet to be scanned.
         asset_dirs += self.async_loader.scan_queue()
-        if self.async_loader.currently_scanning() is not None:
-            asset_dirs.append(self.async_loader.currently_scanning())
+        asset_dirs += self.async_loader.currently_scanning()
+        # Asset dirs that are being rescanned are in both lists.
+        asset_dirs = list(dict.fromkeys(asset_dirs))
 
         # Remember where the directory dialog left off.
         last_dir = self.last_dialog_directory
 
-        config = data.ProgramConfig(asset_dirs, last_dir)
+        # Only keep the sizes of asset dirs we still have.
+        scan_sizes = {path: size for path, size in self.scan_sizes.items() if path in asset_dirs}
+
+        sort_orders = {view_name: view.sort_order() for view_name, view in self.asset_views().items()}
+
+        config = data.ProgramConfig(asset_dirs, last_dir, scan_sizes, self.use_catalog, sort_orders)
         data.program_config.save_program_config(config, self.config_dir)
 
         # And then save all the asset directory data.
@@ -409,6 +879,102 @@ class MainWindow(Qwidgets.QMainWindow):
 
     @Qcore.pyqtSlot()
     def save_asset_dirs(self):
+        """
+        Saves the directories that changed since the last save.
+        Only the changed assets are appended to the journals, the files are written in the background.
+        """
+        # Directories that were already saved by a compaction are still in the list.
+        dirty_dirs = [asset_dir for asset_dir in self.dirty_asset_dirs.take() if asset_dir.is_dirty()]
+        if len(dirty_dirs) == 0:
+            return
+        logging.info(self.tr("Saving {} changed asset directories.".format(len(dirty_dirs))))
+
+        self.journal_asset_dirs(dirty_dirs)
+
+    def save_all_asset_dirs(self):
+        """
+        Walks all asset directories, and saves any directory with changes, even if it was not marked as dirty.
+        """
         logging.info(self.tr("Saving any changed asset information."))
-        for asset_dir in self.asset_dirs.values():
-            data.recursive_save_asset_dir(asset_dir)
+        for dir_path, asset_dir in self.asset_dirs.items():
+            self.journal_asset_dirs(data.load_scan_save.find_dirty_asset_dirs(asset_dir))
+
+            # Partially loaded dirs are not complete enough to go in the catalog.
+            if self.catalog is not None and dir_path not in self.partially_loaded_dirs:
+                self.asset_saver.queue(*self.catalog.snapshot_changes(asset_dir))
+
+    def journal_asset_dirs(self, asset_dirs):
+        live_dirs = []
+        for asset_dir in asset_dirs:
+            root = asset_dir.root()
+            if self.asset_dirs.get(root.absolute_path()) is root:
+                live_dirs.append(asset_dir)
+            # Otherwise removed, or replaced by a new scan.
+
+        for root_path, entries in self.asset_journal.record(live_dirs).items():
+            self.asset_saver.append_to_journal(root_path, entries)
+
+        for root_path in self.asset_journal.needs_compaction():
+            self.compact_journal(root_path)
+
+    @Qcore.pyqtSlot()
+    def compact_journals(self):
+        for root_path in list(self.asset_dirs.keys()):
+            if self.asset_journal.has_changes(root_path):
+                self.compact_journal(root_path)
+
+    def compact_journal(self, root_path: pathlib.Path):
+        """
+        Writes all the changes of an asset directory to the config files in the background, and clears its journal.
+        """
+        root_dir = self.asset_dirs.get(root_path)
+        if root_dir is None or root_path in self.partially_loaded_dirs:
+            return
+
+        self.asset_saver.compact(root_path, self.asset_journal.take_compaction(root_dir))
+
+    @Qcore.pyqtSlot(object)
+    def on_journal_failed(self, root_path: str):
+        # The changes are not on disk yet. Write the config files instead.
+        self.compact_journal(pathlib.Path(root_path))
+
+    @Qcore.pyqtSlot(object)
+    def on_asset_stats_measured(self, snapshots: list):
+        for snapshot in snapshots:
+            asset_dir = snapshot.asset_dir
+            if asset_dir is None:
+                continue
+            root = asset_dir.root()
+            if self.asset_dirs.get(root.absolute_path()) is root:
+                data.load_scan_save.apply_measured_stats(asset_dir, snapshot)
+
+    @Qcore.pyqtSlot(object, object)
+    def on_asset_dirs_saved(self, saved: list, failed: list):
+        for snapshot, new_state in saved:
+            if snapshot.asset_dir is not None:
+                data.load_scan_save.apply_saved_state(snapshot.asset_dir, snapshot, new_state)
+
+        for snapshot, _ in failed:
+            asset_dir = snapshot.asset_dir
+            if asset_dir is None:
+                continue
+            root = asset_dir.root()
+            if self.asset_dirs.get(root.absolute_path()) is root:
+                # Try again next time.
+                asset_dir.mark_dirty()
+
+    @Qcore.pyqtSlot(bool)
+    def set_use_catalog(self, use_catalog: bool):
+        self.use_catalog = use_catalog
+
+        if use_catalog and self.catalog is None:
+            self.catalog = data.open_catalog(self.config_dir)
+            self.asset_saver.set_catalog(self.catalog)
+            self.image_analyzer.set_catalog(self.catalog)
+        elif not use_catalog and self.catalog is not None:
+            self.asset_saver.set_catalog(None)
+            self.image_analyzer.set_catalog(None)
+            # The saver might still be writing to it.
+            self.asset_saver.wait(self.EXIT_SAVE_TIMEOUT)
+            self.catalog.close()
+            self.catalog = None
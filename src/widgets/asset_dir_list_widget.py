@@ -15,6 +15,9 @@ class AssetDirListWidget(Qwidgets.QWidget):
     COUNT_COL_WIDTH = 50
 
     selection_changed = Qcore.pyqtSignal()
+    # Fires after asset directories were removed by the user.
+    # Sends along the list of removed paths.
+    asset_dirs_removed = Qcore.pyqtSignal(list)
 
     def __init__(self, asset_dirs: {}):
         super().__init__()
@@ -66,6 +69,15 @@ class AssetDirListWidget(Qwidgets.QWidget):
     def on_new_asset_dir(self, path: pathlib.Path):
         asset_dir = self.asset_dirs[path]
 
+        existing_row = self._find_row(path)
+        if existing_row is not None:
+            # The directory was scanned again, only the contents changed.
+            self.update_asset_count(path)
+            if self.view.item(existing_row, self.NAME_COL).isSelected():
+                # Let the rest know they should show the new contents.
+                self.selection_changed.emit()
+            return
+
         self.view.insertRow(0)
         self.view.setItem(0, self.NAME_COL, Qwidgets.QTableWidgetItem(asset_dir.name()))
 
@@ -78,6 +90,15 @@ class AssetDirListWidget(Qwidgets.QWidget):
         # Sort the table based on the names.
         self.view.sortItems(self.NAME_COL, Qcore.Qt.AscendingOrder)
 
+    def update_asset_count(self, path: pathlib.Path):
+        """
+        Updates the displayed asset count of an asset directory whose contents changed.
+        """
+        row = self._find_row(path)
+        if row is not None:
+            count = self.asset_dirs[path].asset_count_recursive()
+            self.view.item(row, self.COUNT_COL).setText(str(count))
+
     @Qcore.pyqtSlot()
     def on_remove_button_pressed(self):
         remove_rows = []
@@ -103,6 +124,8 @@ class AssetDirListWidget(Qwidgets.QWidget):
         for remove_dir in remove_dirs:
             del self.asset_dirs[remove_dir]
 
+        self.asset_dirs_removed.emit(remove_dirs)
+
     @Qcore.pyqtSlot()
     def on_selection_changed(self):
         if len(self.get_selected_dirs()) == 0:
@@ -123,5 +146,14 @@ class AssetDirListWidget(Qwidgets.QWidget):
 
         return selection
 
+    def _find_row(self, path: pathlib.Path):
+        """
+        :return: The row displaying the asset directory with the given path, or `None`.
+        """
+        for row in range(self.view.rowCount()):
+            if pathlib.Path(self.view.item(row, self.PATH_COL).text()) == path:
+                return row
+        return None
+
     def clear_selection(self):
         self.view.clearSelection()
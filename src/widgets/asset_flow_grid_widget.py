@@ -5,7 +5,7 @@ import PyQt5.QtCore as Qcore
 import PyQt5.QtGui as Qgui
 import PyQt5.QtWidgets as Qwidgets
 
-from data import Asset
+from data import Asset, AssetView
 from .asset_flow_grid_item_widget import AssetFlowGridItemWidget
 
 
@@ -19,12 +19,17 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
     SCROLL_3_PER_TICK_LIMIT = 8
 
     selection_changed = Qcore.pyqtSignal()
+    # Fires whenever the user scrolls through the assets.
+    scrolled = Qcore.pyqtSignal()
 
     def __init__(self):
         super().__init__()
 
-        # uuid -> Asset, ordered dictionary of the assets to be displayed.
-        self._assets = {}
+        # `AssetView` of the assets to be displayed.
+        self._assets = AssetView.of_assets({})
+        # See `sort_order`.
+        self._sort_key = None
+        self._sort_descending = False
         # [y][x] grid of asset widgets.
         self._asset_grid = []
         self._item_width = AssetFlowGridItemWidget.WIDTH
@@ -113,8 +118,8 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
         # ---- Connections ----
         self._scrollbar.valueChanged.connect(self.on_scrollbar_value_changed)
 
-    def show_assets(self, assets: dict):
-        self._assets = assets
+    def show_assets(self, assets: AssetView):
+        self._assets = self._sorted(assets)
 
         # Deselect all.
         self._selected_asset_uuids = []
@@ -125,6 +130,69 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
         self._calculate_grid_layout()
         self._update_display()
 
+    def shown_assets(self):
+        """
+        :return: The `AssetView` of the assets that are shown, in the order they are shown in.
+        """
+        return self._assets
+
+    def sort_order(self) -> tuple:
+        """
+        :return: (sort key, descending) the assets are shown in. The sort key is one of `sort_order.SORT_KEYS`, or
+                 `None` for the order they are given in.
+        """
+        return self._sort_key, self._sort_descending
+
+    def set_sort_order(self, sort_key, descending=False):
+        """
+        Sorts the assets that are shown, and the ones shown later. Going back to `None` keeps the current order, until
+        other assets are shown.
+        Assets added later are put in their place in the order.
+        """
+        self._sort_key = sort_key
+        self._sort_descending = descending
+        if sort_key is not None:
+            self.show_assets(self._assets)
+
+    def _sorted(self, assets):
+        if self._sort_key is None:
+            return assets
+        return assets.sorted_by(self._sort_key, self._sort_descending)
+
+    def add_assets(self, assets: dict):
+        """
+        Adds assets after the ones that are already displayed, or in their place when the assets are sorted.
+        Keeps the scroll position and the selection.
+        :param assets: uuid -> Asset dictionary of assets that are not yet displayed.
+                       They need to be in the registry the view looks them up in.
+        """
+        self._assets = self._sorted(self._assets.with_assets(assets.keys()))
+
+        self._calculate_grid_layout()
+        self._update_display()
+
+    def remove_assets(self, asset_uuids):
+        """
+        Removes assets from the display. Keeps the scroll position and the selection of the other assets.
+        :param asset_uuids: uuids of the assets to remove. Ones that are not displayed are ignored.
+        """
+        self._assets = self._assets.without_assets(asset_uuids)
+        for asset_uuid in asset_uuids:
+            if asset_uuid in self._selected_asset_uuids:
+                self._selected_asset_uuids.remove(asset_uuid)
+
+        self._calculate_grid_layout()
+        self._update_display()
+
+    def update_assets(self, assets: dict):
+        """
+        Replaces assets that are already displayed, for example because they were renamed.
+        Keeps their place in the grid.
+        :param assets: uuid -> Asset dictionary. Assets that are not displayed are ignored.
+        """
+        # The view looks up the new versions by itself.
+        self._update_display()
+
     def _update_display(self):
         self._scrollbar.setMaximum(self._max_scroll_row)
         # Keep the asset we were scrolled to in the top row.
@@ -132,7 +200,9 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
 
         # Start displaying assets at the place we are currently scrolled to.
         asset_index = self._top_scroll_row * self._items_in_width
-        assets = list(self._assets.values())
+        # Only the assets that fit in the grid.
+        assets = self._assets.slice(asset_index, asset_index + self._items_in_width * len(self._asset_grid))
+        asset_index = 0
 
         for row in self._asset_grid:
             for widget in row:
@@ -213,7 +283,7 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
         self._items_in_height = math.ceil(grid_height / self._item_height)
 
         # This is how many rows displaying all the items at the same time would take.
-        total_number_of_rows = math.ceil(len(self._assets.values()) / self._items_in_width)
+        total_number_of_rows = math.ceil(len(self._assets) / self._items_in_width)
         # Make sure we don't scroll past the last items.
         # The extra +1 is because we allow the last row to be clipped, so we want to scroll 1 more.
         self._max_scroll_row = max(total_number_of_rows - self._items_in_height + 1, 0)
@@ -244,6 +314,7 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
 
         self._top_scroll_row = row_value
         self._update_display()
+        self.scrolled.emit()
 
     def scroll(self, dx: int, dy: int) -> None:
         """
@@ -266,10 +337,26 @@ class AssetFlowGridWidget(Qwidgets.QFrame):
     def get_selected_assets(self) -> [Asset]:
         selected_assets = []
         for asset_uuid in self._selected_asset_uuids:
-            selected_assets.append(self._assets[asset_uuid])
+            asset = self._assets.get(asset_uuid)
+            if asset is not None:
+                selected_assets.append(asset)
 
         return selected_assets
 
+    def select_assets(self, asset_uuids):
+        """
+        Selects the assets instead of the ones that were selected, and scrolls to the first one.
+        :param asset_uuids: uuids of the assets to select. Ones that are not displayed are ignored.
+        """
+        self._selected_asset_uuids = [asset_uuid for asset_uuid in asset_uuids if self._assets.contains(asset_uuid)]
+        if len(self._selected_asset_uuids) > 0:
+            first_index = min(self._assets.index_of(asset_uuid) for asset_uuid in self._selected_asset_uuids)
+            # Let the `valueChanged` signal take care of the scrolling.
+            self._scrollbar.setValue(first_index // self._items_in_width)
+        self._update_display()
+
+        self.selection_changed.emit()
+
     @Qcore.pyqtSlot(int, int, UUID)
     def on_asset_item_clicked(self, grid_x, grid_y, asset_uuid):
         # TODO: shift and ctrl selection.
@@ -4,7 +4,7 @@ import PyQt5.QtCore as Qcore
 import PyQt5.QtGui as Qgui
 import PyQt5.QtWidgets as Qwidgets
 
-from data import Asset
+from data import Asset, AssetView
 
 
 class AssetListWidget(Qwidgets.QWidget):
@@ -16,12 +16,26 @@ class AssetListWidget(Qwidgets.QWidget):
     IMAGE_SIZE = 100
 
     selection_changed = Qcore.pyqtSignal()
+    # Fires whenever the user scrolls through the assets.
+    scrolled = Qcore.pyqtSignal()
 
     def __init__(self):
         super().__init__()
 
-        # uuid -> Asset, ordered dictionary of the assets to be displayed.
-        self._assets = {}
+        # `AssetView` of the assets to be displayed.
+        self._assets = AssetView.of_assets({})
+        # See `sort_order`.
+        self._sort_key = None
+        self._sort_descending = False
+        # Whether the rows no longer match `_assets`. Rows are only made while the list is visible, because
+        # a row for every asset in a large library takes a while.
+        self._rows_outdated = False
+        # uuid strings of the assets to select once the rows are made, see `select_assets`.
+        self._pending_selection = None
+        # uuid strings of the assets in the rows, from top to bottom. Finding a row does not have to go through Qt.
+        self._row_uuids = []
+        # uuid string -> row. Made from `_row_uuids` when it is needed, and dropped when rows move.
+        self._rows = None
 
         # ---- layout ----
 
@@ -71,32 +85,189 @@ class AssetListWidget(Qwidgets.QWidget):
         self._view.verticalScrollBar().valueChanged.connect(self.on_scrollbar_value_changed)
         self._view.itemSelectionChanged.connect(self.on_selection_changed)
 
-    def show_assets(self, assets: dict):
+    def show_assets(self, assets: AssetView):
+        self._assets = self._sorted(assets)
+        self._pending_selection = None
+        # Always scroll to the top when displaying a new list of assets.
+        self._rows_outdated = True
+        self._update_rows()
+
+    def _update_rows(self):
+        """
+        Makes the rows again, when they are outdated and the list is visible.
+        """
+        if not self._rows_outdated or not self.isVisible():
+            return
+        self._rows_outdated = False
+
         # Remove previous displayed assets.
-        # TODO: this can probably be done more efficient.
-        #       For example by checking if certain assets are already there.
         self._view.setRowCount(0)
-        # Always scroll to the top when displaying a new list of assets.
+        self._row_uuids = []
+        self._rows = {}
         self._view.scrollToTop()
 
-        self._assets = assets
+        for asset in self._assets:
+            self._append_asset_row(asset)
+
+        self.load_visible_asset_thumbnails()
+
+    def showEvent(self, event: Qgui.QShowEvent) -> None:
+        super().showEvent(event)
+        self._update_rows()
+        self._apply_pending_selection()
+
+    def shown_assets(self):
+        """
+        :return: The `AssetView` of the assets that are shown, in the order they are shown in.
+        """
+        return self._assets
+
+    def select_assets(self, asset_uuids):
+        """
+        Selects the assets instead of the ones that were selected, and scrolls to the first one.
+        :param asset_uuids: uuids of the assets to select. Ones that are not displayed are ignored.
+        """
+        self._pending_selection = {str(asset_uuid) for asset_uuid in asset_uuids}
+        self._update_rows()
+        self._apply_pending_selection()
+
+    def _apply_pending_selection(self):
+        if self._pending_selection is None or self._rows_outdated:
+            return
+        selected = self._pending_selection
+        self._pending_selection = None
+
+        self._view.clearSelection()
+        first_item = None
+        for row, asset_uuid in enumerate(self._row_uuids):
+            if asset_uuid in selected:
+                self._view.selectionModel().select(self._view.model().index(row, self.NAME_COL),
+                                                   Qcore.QItemSelectionModel.Select | Qcore.QItemSelectionModel.Rows)
+                if first_item is None:
+                    first_item = self._view.item(row, self.NAME_COL)
+        if first_item is not None:
+            self._view.scrollToItem(first_item)
+
+    def sort_order(self) -> tuple:
+        """
+        :return: (sort key, descending) the assets are shown in. The sort key is one of `sort_order.SORT_KEYS`, or
+                 `None` for the order they are given in.
+        """
+        return self._sort_key, self._sort_descending
+
+    def set_sort_order(self, sort_key, descending=False):
+        """
+        Sorts the assets that are shown, and the ones shown later. Going back to `None` keeps the current order, until
+        other assets are shown.
+        Assets added later are put in their place in the order.
+        """
+        self._sort_key = sort_key
+        self._sort_descending = descending
+        if sort_key is not None:
+            self.show_assets(self._assets)
+
+    def _sorted(self, assets):
+        if self._sort_key is None:
+            return assets
+        return assets.sorted_by(self._sort_key, self._sort_descending)
+
+    def add_assets(self, assets: dict):
+        """
+        Adds assets after the ones that are already displayed, or in their place when the assets are sorted.
+        Keeps the scroll position and the selection.
+        :param assets: uuid -> Asset dictionary of assets that are not yet displayed.
+                       They need to be in the registry the view looks them up in.
+        """
+        new_assets = [asset for asset_uuid, asset in assets.items() if not self._assets.contains(asset_uuid)]
+        self._assets = self._sorted(self._assets.with_assets(assets.keys()))
+        if self._rows_outdated or not self.isVisible():
+            self._rows_outdated = True
+            return
 
-        for asset in assets.values():
-            # Insert at the bottom, to keep the ordering of the assets intact.
-            new_row_id = self._view.rowCount()
-            self._view.insertRow(new_row_id)
-            self._view.setItem(new_row_id, self.NAME_COL, Qwidgets.QTableWidgetItem(asset.name()))
-            self._view.setItem(new_row_id, self.UUID_COL, Qwidgets.QTableWidgetItem(str(asset.uuid())))
-            # The thumbnails will be loaded when the item is visible.
+        if self._sort_key is None:
+            for asset in new_assets:
+                self._append_asset_row(asset)
+        else:
+            # From top to bottom, so the rows above each new one are already in place.
+            places = [(self._assets.index_of(asset.uuid()), asset) for asset in new_assets]
+            places = sorted((place for place in places if place[0] is not None), key=lambda place: place[0])
+            for row, asset in places:
+                self._insert_asset_row(row, asset)
 
         self.load_visible_asset_thumbnails()
 
+    def remove_assets(self, asset_uuids):
+        """
+        Removes assets from the display. Keeps the scroll position and the selection of the other assets.
+        :param asset_uuids: uuids of the assets to remove. Ones that are not displayed are ignored.
+        """
+        self._assets = self._assets.without_assets(asset_uuids)
+        if self._rows_outdated or not self.isVisible():
+            self._rows_outdated = True
+            return
+
+        rows = {self._row_of(asset_uuid) for asset_uuid in asset_uuids} - {None}
+        if len(rows) == 0:
+            return
+        # From bottom to top, so the rows that are still to be removed don't shift.
+        for row in sorted(rows, reverse=True):
+            self._view.removeRow(row)
+        self._row_uuids = [asset_uuid for row, asset_uuid in enumerate(self._row_uuids) if row not in rows]
+        self._rows = None
+
+        self.load_visible_asset_thumbnails()
+
+    def update_assets(self, assets: dict):
+        """
+        Replaces assets that are already displayed, for example because they were renamed.
+        Keeps their place in the list.
+        :param assets: uuid -> Asset dictionary. Assets that are not displayed are ignored.
+        """
+        if self._rows_outdated or not self.isVisible():
+            # The view looks up the new versions by itself.
+            self._rows_outdated = True
+            return
+
+        for asset_uuid, asset in assets.items():
+            row = self._row_of(asset_uuid)
+            if row is not None:
+                self._view.item(row, self.NAME_COL).setText(asset.name())
+
+        self.load_visible_asset_thumbnails()
+
+    def _row_of(self, asset_uuid):
+        """
+        :return: The row of an asset, or `None` if it has none.
+        """
+        if self._rows is None:
+            self._rows = {row_uuid: row for row, row_uuid in enumerate(self._row_uuids)}
+        return self._rows.get(str(asset_uuid))
+
+    def _append_asset_row(self, asset: Asset):
+        # Insert at the bottom, to keep the ordering of the assets intact.
+        self._insert_asset_row(self._view.rowCount(), asset)
+
+    def _insert_asset_row(self, row: int, asset: Asset):
+        asset_uuid = str(asset.uuid())
+        self._view.insertRow(row)
+        self._view.setItem(row, self.NAME_COL, Qwidgets.QTableWidgetItem(asset.name()))
+        self._view.setItem(row, self.UUID_COL, Qwidgets.QTableWidgetItem(asset_uuid))
+        # The thumbnails will be loaded when the item is visible.
+
+        self._row_uuids.insert(row, asset_uuid)
+        if row < len(self._row_uuids) - 1:
+            # The rows below it moved down.
+            self._rows = None
+        elif self._rows is not None:
+            self._rows[asset_uuid] = row
+
     def get_selected_assets(self) -> [Asset]:
         assets = []
         for index in self._view.selectedIndexes():
             if index.column() == self.IMAGE_COL:
-                asset_uuid = uuid.UUID(self._view.item(index.row(), self.UUID_COL).text())
-                assets.append(self._assets[asset_uuid])
+                asset = self._assets.get(uuid.UUID(self._view.item(index.row(), self.UUID_COL).text()))
+                if asset is not None:
+                    assets.append(asset)
 
         return assets
 
@@ -107,6 +278,7 @@ class AssetListWidget(Qwidgets.QWidget):
     @Qcore.pyqtSlot()
     def on_scrollbar_value_changed(self):
         self.load_visible_asset_thumbnails()
+        self.scrolled.emit()
 
     @Qcore.pyqtSlot()
     def on_selection_changed(self):
@@ -136,7 +308,9 @@ class AssetListWidget(Qwidgets.QWidget):
         for row in range(top_visible_row, bottom_visible_plus_one):
             # Load the thumbnail.
             asset_uuid = self._view.item(row, self.UUID_COL).text()
-            asset = self._assets[uuid.UUID(asset_uuid)]
+            asset = self._assets.get(uuid.UUID(asset_uuid))
+            if asset is None:
+                continue
 
             # TODO: image loading and thumbnail generation should be done asynchronously.
             item = Qwidgets.QTableWidgetItem()